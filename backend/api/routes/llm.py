@@ -1,20 +1,242 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
+from backend.core.admission import AdmissionRejected
 from backend.core.engine import engine
-import torch
+from backend.core.constants import CONTENT_TAGS, PRIORITY_CLASSES, TAG_DEADLINES_MS
+from backend.core.config import settings
+from backend.models.stopping import GenerationCancelled, request_cancel
+from backend.services.batch_service import plan_buckets
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+import asyncio
+import json
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
 import uuid
 import time
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
 
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_INTERVAL = 0.25
+
 
 class QueryPayload(BaseModel):
     input: str = Field(..., description="User input prompt")
     max_tokens: int = Field(100, ge=1, le=1024, description="Maximum tokens to generate")
     temperature: float = Field(0.7, ge=0.0, le=1.0, description="Sampling temperature")
     system_prompt: Optional[str] = Field(None, description="Optional system prompt for injection")
+    use_cache: bool = Field(True, description="Allow answering from the response cache")
+    coalesce: bool = Field(False, description="Share an identical in-flight generation even when sampling (greedy requests always do)")
+    tag: Optional[str] = Field(None, description="Content tag (see CONTENT_TAGS), selects cache thresholds")
+    adapter: Optional[str] = Field(None, description="Name of a LoRA adapter to serve this request with")
+    deadline_ms: Optional[int] = Field(None, ge=1, le=600000, description="Latency budget; generation ends when it runs out")
+    stop: Optional[List[str]] = Field(None, max_length=8, description="Stop sequences; generation ends before the first match")
+    priority: str = Field("interactive", description="Scheduling class (see PRIORITY_CLASSES); scripts should send 'bulk'")
+
+
+class BatchPayload(BaseModel):
+    prompts: List[str] = Field(..., description="Prompts to generate completions for")
+    max_tokens: int = Field(100, ge=1, le=1024, description="Maximum tokens to generate per prompt")
+    temperature: float = Field(0.7, ge=0.0, le=1.0, description="Sampling temperature")
+    system_prompt: Optional[str] = Field(None, description="Optional system prompt prepended to every prompt")
+    batch_size: Optional[int] = Field(None, ge=1, le=256, description="Prompts per padded batch (default BULK_BATCH_SIZE)")
+    adapter: Optional[str] = Field(None, description="Name of a LoRA adapter to serve this batch with")
+
+
+class ChatTurn(BaseModel):
+    message: str = Field(..., min_length=1, description="The user's next message")
+    max_tokens: int = Field(100, ge=1, le=1024, description="Maximum tokens to generate")
+    temperature: float = Field(0.7, ge=0.0, le=1.0, description="Sampling temperature")
+    system_prompt: Optional[str] = Field(None, description="System prompt; only used on the first turn of a session")
+
+
+def _full_prompt(payload: QueryPayload) -> str:
+    # Combine system prompt if provided
+    return f"{payload.system_prompt}\n{payload.input}" if payload.system_prompt else payload.input
+
+
+def _deadline_ms(payload: QueryPayload) -> Optional[int]:
+    """Explicit deadline, else the tag's default budget, else GENERATION_DEADLINE_MS (0 = none)."""
+    return payload.deadline_ms or TAG_DEADLINES_MS.get(payload.tag) or settings.GENERATION_DEADLINE_MS or None
+
+
+def _admission_deadline(deadline_ms: Optional[int]) -> float:
+    limit = settings.ADMISSION_DEADLINE_MS
+    return (min(limit, deadline_ms) if deadline_ms else limit) / 1000.0
+
+
+def _validate_adapter(payload):
+    if not payload.adapter:
+        return
+    status = engine.adapter_status(payload.adapter)
+    if not status["enabled"]:
+        raise HTTPException(status_code=400, detail="LoRA adapters are not enabled on this server.")
+    if not status["exists"]:
+        raise HTTPException(status_code=404, detail=f"Unknown adapter '{payload.adapter}'.")
+
+
+def _validate_priority(payload: QueryPayload):
+    if payload.priority not in PRIORITY_CLASSES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown priority '{payload.priority}'. Expected one of {PRIORITY_CLASSES}."
+        )
+
+
+def _client_id(request) -> str:
+    """Fair-queueing identity: the user resolved by the auth middleware, else the client address."""
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user.username
+    return request.client.host if request.client else "anonymous"
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _acquire_slot(deadline: float, user: str = None, priority: str = "interactive", cost: float = 1.0):
+    """Ask the admission controller for a slot, shedding with 429/503 + Retry-After."""
+    if engine.admission is None:
+        return None
+    try:
+        return engine.admission.acquire(deadline, user, priority, cost)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _wait_timed_out(slot, deadline: float):
+    engine.admission.abandon(slot)
+    retry_after = max(1, int(engine.admission.estimated_wait()))
+    return HTTPException(
+        status_code=503,
+        detail=f"No inference slot within the {deadline:.1f}s deadline.",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+
+async def _admit(deadline: float, *queueing):
+    """
+    Await an inference slot for async routes. Returns the slot to release, or None if admission is off.
+    `queueing` is (user, priority, cost) for the fair queue.
+    """
+    slot = _acquire_slot(deadline, *queueing)
+    if slot is None:
+        return None
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(slot)), timeout=deadline)
+    except asyncio.TimeoutError:
+        raise _wait_timed_out(slot, deadline)
+    except asyncio.CancelledError:
+        # The handler was cancelled while queued; the shielded waiter would otherwise be
+        # granted a slot later that nobody releases
+        engine.admission.abandon(slot)
+        raise
+    return slot
+
+
+def _admit_sync(deadline: float, *queueing):
+    """Blocking variant of _admit for sync routes (runs in the threadpool)."""
+    slot = _acquire_slot(deadline, *queueing)
+    if slot is None:
+        return None
+    try:
+        slot.result(timeout=deadline)
+    except FutureTimeout:
+        raise _wait_timed_out(slot, deadline)
+    return slot
+
+
+def _release(slot, started: float, result: dict = None):
+    if slot is None:
+        return
+    # Cache hits say nothing about generation latency, so keep them out of the wait estimate
+    cached = result is not None and result.get("cache") == "hit"
+    engine.admission.release(None if cached or result is None else time.time() - started)
+
+
+def _release_once(slot, started: float):
+    """
+    Idempotent _release for streaming routes. The generator's `finally` and the
+    response's background task both call it, so the slot is returned even when the
+    response is torn down before the generator ever runs.
+    """
+    lock = threading.Lock()
+    released = []
+
+    def release(result: dict = None):
+        with lock:
+            if released:
+                return
+            released.append(True)
+        _release(slot, started, result)
+
+    return release
+
+
+async def _await_unless_disconnected(future, request: Request) -> dict:
+    """
+    Await a generation future, cancelling it if the client goes away meanwhile.
+    Cancelling stops the request's row in its batch at the next decode step.
+    """
+    wrapped = asyncio.wrap_future(future)
+    while True:
+        done, _ = await asyncio.wait({wrapped}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return wrapped.result()
+        if await request.is_disconnected():
+            # Stops the row mid-decode; cancelling the asyncio wrapper alone only reaches queued requests
+            request_cancel(future)
+            wrapped.cancel()
+            raise GenerationCancelled("Client disconnected.")
+
+
+def _ndjson(data: dict) -> str:
+    return json.dumps(data) + "\n"
+
+
+def _parse_jsonl(raw: bytes) -> List[str]:
+    """Each line is either a JSON string or an object with a `prompt` (or `input`) field."""
+    prompts = []
+    for line_no, line in enumerate(raw.decode("utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid JSON on line {line_no}: {e}")
+        if isinstance(item, dict):
+            item = item.get("prompt", item.get("input"))
+        if not isinstance(item, str):
+            raise HTTPException(status_code=422, detail=f"Line {line_no} has no prompt string.")
+        prompts.append(item)
+    return prompts
+
+
+async def _read_batch_payload(request: Request) -> BatchPayload:
+    """Accept either a JSON BatchPayload or a multipart upload with a JSONL `file` plus form fields."""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None:
+            raise HTTPException(status_code=422, detail="Multipart request needs a JSONL 'file' field.")
+        fields = {k: v for k, v in form.items() if k != "file" and v != ""}
+        fields["prompts"] = _parse_jsonl(await upload.read())
+    else:
+        try:
+            fields = await request.json()
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid JSON body: {e}")
+    if not isinstance(fields, dict):
+        raise HTTPException(status_code=422, detail="Batch payload must be a JSON object.")
+    try:
+        return BatchPayload(**fields)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 
 @router.post("/api/llm/query")
@@ -22,31 +244,43 @@ async def query_llm(payload: QueryPayload, request: Request):
     session_id = str(uuid.uuid4())
     start_time = time.time()
 
+    if payload.tag and payload.tag not in CONTENT_TAGS:
+        raise HTTPException(status_code=422, detail=f"Unknown tag '{payload.tag}'. Expected one of {CONTENT_TAGS}.")
+    _validate_adapter(payload)
+    _validate_priority(payload)
+
+    user = _client_id(request)
+    deadline_ms = _deadline_ms(payload)
+    slot = await _admit(_admission_deadline(deadline_ms), user, payload.priority, payload.max_tokens)
+    served_at = time.time()
+    result = None
+
     try:
-        llm = engine.get_model()
-        model = llm["model"]
-        tokenizer = llm["tokenizer"]
-        model_name = model.name_or_path if hasattr(model, "name_or_path") else "unknown"
-
-        # Combine system prompt if provided
-        full_prompt = f"{payload.system_prompt}\n{payload.input}" if payload.system_prompt else payload.input
-
-        # Tokenize input
-        inputs = tokenizer(full_prompt, return_tensors="pt").to(model.device)
-        input_token_count = inputs.input_ids.shape[-1]
-
-        # Generate output
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=payload.max_tokens,
-                temperature=payload.temperature,
-                do_sample=True
-            )
+        model_name = engine.model_meta.get("name", "unknown")
+
+        # Queue for batched generation; the system prompt is kept separate so
+        # the scheduler can reuse its cached prefix KV. submit() may embed the prompt
+        # for the semantic cache (or call the sidecar), so it runs off the event loop.
+        future = await run_in_threadpool(
+            engine.submit,
+            payload.input,
+            system_prompt=payload.system_prompt,
+            max_tokens=payload.max_tokens,
+            temperature=payload.temperature,
+            tag=payload.tag,
+            adapter=payload.adapter,
+            deadline_ms=deadline_ms,
+            stop=payload.stop,
+            user=user,
+            priority=payload.priority,
+            use_cache=payload.use_cache,
+            coalesce=payload.coalesce
+        )
+        result = await _await_unless_disconnected(future, request)
 
-        # Decode result
-        generated = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        output_token_count = outputs[0].shape[-1] - input_token_count
+        generated = result["text"]
+        input_token_count = result["input_tokens"]
+        output_token_count = result["output_tokens"]
         duration = round(time.time() - start_time, 3)
 
         response_data = {
@@ -57,15 +291,28 @@ async def query_llm(payload: QueryPayload, request: Request):
                 "output_tokens": output_token_count,
                 "total_tokens": input_token_count + output_token_count,
                 "inference_time": duration,
+                "finish_reason": result.get("finish_reason"),
+                "deadline_ms": deadline_ms,
+                "queue_wait": result.get("queue_wait", 0.0),
+                "admission_wait": round(served_at - start_time, 4),
+                "priority": payload.priority,
+                "batch_size": result["batch_size"],
+                "prefix_cached": result["prefix_cached"],
+                "cache": result.get("cache", "bypass"),
+                "cache_source": result.get("cache_source"),
+                "cache_similarity": result.get("similarity"),
+                "coalesced": result.get("coalesced", False),
+                "speculative": result.get("speculative"),
                 "timestamp": datetime.utcnow().isoformat(),
                 "model": model_name,
+                "adapter": payload.adapter,
                 "client_ip": request.client.host,
                 "user_agent": request.headers.get("user-agent")
             }
         }
 
         # Optional: persist this query to DB or log system
-        # log_query(session_id, full_prompt, generated, response_data["meta"])
+        # log_query(session_id, _full_prompt(payload), generated, response_data["meta"])
 
         return response_data
 
@@ -75,3 +322,232 @@ async def query_llm(payload: QueryPayload, request: Request):
             "error": str(e),
             "timestamp": datetime.utcnow().isoformat()
         }
+
+    finally:
+        _release(slot, served_at, result)
+
+
+@router.post("/api/llm/stream")
+def stream_llm(payload: QueryPayload, request: Request):
+    """
+    Stream generated tokens as server-sent events.
+
+    Emits `token` events while decoding, then one `meta` event with timing
+    (time-to-first-token, per-token latency) and the finish reason, or an
+    `error` event on failure.
+    """
+    session_id = str(uuid.uuid4())
+    _validate_adapter(payload)
+    _validate_priority(payload)
+    model_name = engine.model_meta.get("name", "unknown")
+
+    deadline_ms = _deadline_ms(payload)
+    slot = _admit_sync(_admission_deadline(deadline_ms), _client_id(request), payload.priority, payload.max_tokens)
+    release = _release_once(slot, time.time())
+
+    def event_stream():
+        completed = None
+        try:
+            for kind, data in engine.stream(
+                _full_prompt(payload),
+                max_tokens=payload.max_tokens,
+                temperature=payload.temperature,
+                adapter=payload.adapter,
+                deadline_ms=deadline_ms,
+                stop=payload.stop
+            ):
+                if kind == "token":
+                    yield _sse("token", {"session_id": session_id, "text": data})
+                else:
+                    data.update({
+                        "session_id": session_id,
+                        "timestamp": datetime.utcnow().isoformat(),
+                        "model": model_name,
+                        "adapter": payload.adapter,
+                        "client_ip": request.client.host,
+                        "user_agent": request.headers.get("user-agent")
+                    })
+                    completed = data
+                    yield _sse("meta", data)
+        except Exception as e:
+            yield _sse("error", {
+                "session_id": session_id,
+                "error": str(e),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        finally:
+            release(completed)
+
+    try:
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(release)
+        )
+    except Exception:
+        release()
+        raise
+
+
+@router.post("/api/llm/batch")
+async def batch_llm(request: Request):
+    """
+    Bulk generation for offline workloads.
+
+    Prompts are sorted and bucketed by token length so each padded generate()
+    call wastes little compute on padding. Buckets run on the inference executor
+    and results stream back as NDJSON in completion order: one line per prompt
+    (with its original `index`), then a final `summary` line with aggregate throughput.
+    """
+    payload = await _read_batch_payload(request)
+    _validate_adapter(payload)
+    if not payload.prompts:
+        raise HTTPException(status_code=422, detail="No prompts given.")
+    if len(payload.prompts) > settings.BULK_MAX_PROMPTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many prompts ({len(payload.prompts)} > {settings.BULK_MAX_PROMPTS})."
+        )
+
+    batch_id = str(uuid.uuid4())
+    prompts = payload.prompts
+    if payload.system_prompt:
+        prompts = [f"{payload.system_prompt}\n{p}" for p in prompts]
+    batch_size = payload.batch_size or settings.BULK_BATCH_SIZE
+    buckets = await run_in_threadpool(plan_buckets, prompts, batch_size)
+
+    async def result_stream():
+        start_time = time.time()
+        pending_buckets = list(buckets)
+        running = {}
+        totals = {"completed": 0, "failed": 0, "output_tokens": 0, "prompt_tokens": 0, "padded_tokens": 0}
+        # Keep at most one bucket per worker in flight so interactive traffic is not starved
+        max_in_flight = settings.INFERENCE_WORKERS
+
+        try:
+            while pending_buckets or running:
+                while pending_buckets and len(running) < max_in_flight:
+                    bucket = pending_buckets.pop(0)
+                    try:
+                        future = engine.run_bucket(bucket, payload.max_tokens, payload.temperature, payload.adapter)
+                    except Exception as e:
+                        totals["failed"] += len(bucket)
+                        for item in bucket:
+                            yield _ndjson({"batch_id": batch_id, "index": item["index"], "error": str(e)})
+                        continue
+                    running[asyncio.wrap_future(future)] = bucket
+
+                if not running:
+                    continue
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    bucket = running.pop(task)
+                    try:
+                        outcome = task.result()
+                    except Exception as e:
+                        totals["failed"] += len(bucket)
+                        for item in bucket:
+                            yield _ndjson({"batch_id": batch_id, "index": item["index"], "error": str(e)})
+                        continue
+
+                    totals["completed"] += outcome["batch_size"]
+                    for key in ("output_tokens", "prompt_tokens", "padded_tokens"):
+                        totals[key] += outcome[key]
+                    for item in outcome["results"]:
+                        item["prompt"] = payload.prompts[item["index"]]
+                        yield _ndjson({"batch_id": batch_id, "batch_size": outcome["batch_size"], **item})
+        finally:
+            # Client went away: drop buckets that have not started yet
+            for task in running:
+                task.cancel()
+
+        elapsed = time.time() - start_time
+        yield _ndjson({
+            "batch_id": batch_id,
+            "summary": {
+                "prompts": len(prompts),
+                "completed": totals["completed"],
+                "failed": totals["failed"],
+                "buckets": len(buckets),
+                "output_tokens": totals["output_tokens"],
+                "elapsed": round(elapsed, 3),
+                "prompts_per_sec": round(totals["completed"] / elapsed, 2) if elapsed > 0 else None,
+                "tokens_per_sec": round(totals["output_tokens"] / elapsed, 2) if elapsed > 0 else None,
+                "padding_efficiency": (
+                    round(totals["prompt_tokens"] / totals["padded_tokens"], 3) if totals["padded_tokens"] else None
+                ),
+                "adapter": payload.adapter,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        })
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+@router.websocket("/api/llm/chat")
+async def chat_llm(websocket: WebSocket):
+    """
+    Multi-turn chat over a WebSocket.
+
+    The server announces a `session` message with the session id, then answers every
+    ChatTurn JSON message with `token` messages and a final `meta` message. The
+    conversation and its past key/values stay on the server, so each turn only
+    prefills the new message (meta reports cached vs prefilled tokens). Errors are
+    sent as `error` messages and the session stays usable. The session ends when
+    the socket closes.
+    """
+    await websocket.accept()
+    session_id = str(uuid.uuid4())
+    user = _client_id(websocket)
+    await websocket.send_json({"type": "session", "session_id": session_id})
+
+    try:
+        while True:
+            try:
+                turn = ChatTurn(**await websocket.receive_json())
+            except (TypeError, ValueError) as e:
+                # Invalid JSON, a non-object message or a failed validation
+                await websocket.send_json({"type": "error", "session_id": session_id, "error": str(e)})
+                continue
+
+            try:
+                slot = await _admit(_admission_deadline(None), user, "interactive", turn.max_tokens)
+            except HTTPException as e:
+                await websocket.send_json({
+                    "type": "error",
+                    "session_id": session_id,
+                    "error": e.detail,
+                    "status": e.status_code,
+                    "retry_after": int((e.headers or {}).get("Retry-After", 1))
+                })
+                continue
+
+            served_at = time.time()
+            completed = None
+            events = engine.chat(
+                session_id,
+                turn.message,
+                max_tokens=turn.max_tokens,
+                temperature=turn.temperature,
+                system_prompt=turn.system_prompt
+            )
+            try:
+                async for kind, data in iterate_in_threadpool(events):
+                    if kind == "token":
+                        await websocket.send_json({"type": "token", "session_id": session_id, "text": data})
+                    else:
+                        completed = data
+                        await websocket.send_json({"type": "meta", **data, "timestamp": datetime.utcnow().isoformat()})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "session_id": session_id, "error": str(e)})
+            finally:
+                # Stops the decode if the client went away mid-turn
+                events.close()
+                _release(slot, served_at, completed)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await run_in_threadpool(engine.end_chat, session_id)
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, Query, HTTPException, Request
 from backend.utils.logger_store import get_logs
+from backend.core.engine import engine
+from backend.services.search_service import prompt_index, search_prompts
 from typing import Optional
 from datetime import datetime
 import uuid
@@ -75,3 +77,43 @@ async def fetch_logs(
                 "timestamp": datetime.utcnow().isoformat()
             }
         )
+
+
+@router.get("/api/system/prompts/search")
+def search_prompt_history(
+    q: str = Query(..., min_length=1, description="Text to search prompt history for"),
+    limit: int = Query(10, ge=1, le=100),
+    nprobe: Optional[int] = Query(None, ge=1, description="Index cells to visit (default: ANN_NPROBE)"),
+    refine: Optional[int] = Query(None, ge=0, description="Exact re-rank factor (default: ANN_REFINE)")
+):
+    """
+    Semantic search over logged prompts using the ANN index. Raise nprobe/refine
+    for better recall at the cost of latency.
+    """
+    start = time.time()
+    try:
+        results = search_prompts(q, limit=limit, nprobe=nprobe, refine=refine)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail={"error": "Prompt search failed", "reason": str(e)})
+    return {
+        "query": q,
+        "count": len(results),
+        "results": results,
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "response_time": round(time.time() - start, 4),
+            "index": prompt_index.stats(),
+        },
+    }
+
+
+@router.get("/api/system/status")
+async def fetch_status():
+    """
+    Engine status: boot state, loaded model, and inference queue depth /
+    in-flight counts from the scheduler and executor.
+    """
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "engine": engine.status()
+    }
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, Request, Query
 from pydantic import BaseModel, Field
-from backend.models.trainer import fine_tune_model
+from backend.data.tokenizer import token_lengths
 from backend.core.engine import engine
 from datetime import datetime
 from typing import List, Optional
+import re
 import uuid
 import logging
 
@@ -17,6 +18,7 @@ class TrainPayload(BaseModel):
     dry_run: Optional[bool] = Field(False, description="If True, simulates training without executing")
     tags: Optional[List[str]] = Field(default_factory=list, description="Optional tags for tracking")
     source: Optional[str] = Field("api", description="Where the training request originated from")
+    adapter_name: Optional[str] = Field(None, description="Train a LoRA adapter under this name instead of a full model copy")
 
 
 @router.post("/api/llm/train")
@@ -29,17 +31,20 @@ async def train_llm(payload: TrainPayload, request: Request):
     if not payload.texts or not isinstance(payload.texts, list):
         raise HTTPException(status_code=400, detail="Invalid training data. Must be a non-empty list.")
 
+    if payload.adapter_name and not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", payload.adapter_name):
+        raise HTTPException(status_code=400, detail="Adapter name may only contain letters, digits, '-' and '_'.")
+
     try:
-        # Estimate token count using active tokenizer
-        tokenizer = engine.get_model()["tokenizer"]
-        total_tokens = sum(len(tokenizer.encode(txt)) for txt in payload.texts)
+        # Estimate token count (the served model may live in the inference sidecar)
+        total_tokens = sum(token_lengths(payload.texts))
 
         logger.info(f"[{session_id}] Received training request — {len(payload.texts)} entries, {total_tokens} tokens.")
 
         if payload.dry_run:
             logger.info(f"[{session_id}] Dry-run mode: Skipping actual training.")
         else:
-            fine_tune_model(payload.texts)
+            # Runs where the model lives; a retrained adapter is served fresh on its next request
+            engine.train(payload.texts, adapter_name=payload.adapter_name)
             logger.info(f"[{session_id}] Model fine-tuning executed successfully.")
 
         return {
@@ -49,6 +54,7 @@ async def train_llm(payload: TrainPayload, request: Request):
             "dry_run": payload.dry_run,
             "tags": payload.tags,
             "source": payload.source,
+            "adapter_name": payload.adapter_name,
             "meta": {
                 "session_id": session_id,
                 "timestamp": timestamp,
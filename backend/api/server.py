@@ -3,6 +3,7 @@ from fastapi import FastAPI
 
 # CORS middleware to allow cross-origin requests (required for frontend access)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 # Import API route modules
 from backend.api.routes import llm, train, logs, user
@@ -10,6 +11,9 @@ from backend.api.routes import llm, train, logs, user
 # Lifecycle hooks for app startup and shutdown (DB/model loading)
 from backend.core.lifecycle import on_startup, on_shutdown
 
+# Engine instance, for readiness reporting
+from backend.core.engine import engine
+
 
 # Create FastAPI instance with a custom title
 app = FastAPI(title="Locentra OS API")
@@ -44,3 +48,11 @@ app.include_router(user.router)
 @app.get("/")
 async def root():
     return {"message": "Locentra OS is running."}
+
+# Readiness probe: 200 only once the model is loaded and warmed up, 503 before.
+# Load balancers should route on this; "/" stays the liveness check.
+@app.get("/ready")
+async def ready():
+    state = engine.readiness()
+    body = {"ready": state["ready"], "state": state["state"]}
+    return JSONResponse(body, status_code=200 if state["ready"] else 503)
@@ -0,0 +1,30 @@
+import argparse
+import json
+import logging
+from backend.core.config import settings
+from backend.services.search_service import PromptIndex
+
+logger = logging.getLogger("LocentraCLI")
+logging.basicConfig(level=logging.INFO)
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the ANN index over prompt logs")
+    parser.add_argument("command", choices=["build", "stats"], help="build: re-embed and index every prompt; stats: show the index")
+    parser.add_argument("--path", type=str, default=settings.ANN_INDEX_DIR, help="Index directory (default: ANN_INDEX_DIR)")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Prompts embedded per batch while building")
+    args = parser.parse_args()
+
+    index = PromptIndex(args.path)
+    try:
+        if args.command == "build":
+            print(f"[LocentraOS] Building ANN index (nlist={settings.ANN_NLIST}, m={settings.ANN_PQ_M}) into {args.path}...")
+            stats = index.build(chunk_size=args.chunk_size)
+            print(f"[✓] Indexed {stats['rows']} prompts in {stats['seconds']}s")
+        else:
+            print(json.dumps(index.stats(), indent=2))
+    except Exception as e:
+        logger.error(f"Index {args.command} failed: {str(e)}")
+        print(f"[✗] Index {args.command} failed: {str(e)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import argparse
+import json
+import logging
+from backend.core.config import settings
+from backend.models.snapshot import export_snapshot
+
+logger = logging.getLogger("LocentraCLI")
+logging.basicConfig(level=logging.INFO)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the serving model as a memory-mappable snapshot")
+    parser.add_argument("--output", type=str, default=settings.SNAPSHOT_DIR, help="Snapshot directory (default: SNAPSHOT_DIR)")
+    args = parser.parse_args()
+
+    if not args.output:
+        parser.error("--output is required when SNAPSHOT_DIR is not set")
+
+    try:
+        print(f"[LocentraOS] Exporting snapshot of {settings.MODEL_NAME} (adapter strategy: {settings.ADAPTER_STRATEGY})...")
+        manifest = export_snapshot(args.output)
+        print(f"[✓] Snapshot written to: {args.output}")
+        print(json.dumps({k: manifest[k] for k in ("tensors", "bytes", "requantize", "seconds")}, indent=2))
+        print(f"[Info] Set SNAPSHOT_DIR={args.output} to boot from it.")
+    except Exception as e:
+        logger.error(f"Snapshot export failed: {str(e)}")
+        print(f"[✗] Snapshot export failed: {str(e)}")
+
+if __name__ == "__main__":
+    main()
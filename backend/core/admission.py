@@ -0,0 +1,152 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from backend.core.config import settings
+from backend.core.fair_queue import FairQueue
+
+logger = logging.getLogger("locentra.admission")
+
+
+class AdmissionRejected(RuntimeError):
+    """
+    Raised when a request is shed instead of queued.
+    Carries the HTTP status to answer with and a Retry-After hint in seconds.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Per-process gate in front of the inference path.
+
+    At most `max_concurrency` requests are served at once; up to `max_queue` more
+    wait for a slot in weighted fair order across users and priority classes
+    (see FairQueue), so one tenant's backlog cannot starve the rest. Every admission estimates how long the new request
+    would wait plus be served, from a window of recent service times, and sheds it
+    immediately when that exceeds its deadline (429) or when the queue is full (503).
+
+    `acquire()` never blocks: it returns a Future that resolves once a slot is granted,
+    so async routes can await it and sync routes can call `.result(timeout)`.
+    Every granted slot must be handed back with `release()`.
+    """
+
+    def __init__(self, max_concurrency: int = None, max_queue: int = None, window: int = None):
+        self.max_concurrency = max_concurrency or settings.ADMISSION_MAX_CONCURRENCY or (
+            settings.BATCH_MAX_SIZE * settings.INFERENCE_WORKERS
+        )
+        self.max_queue = settings.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self._latencies = deque(maxlen=window or settings.ADMISSION_LATENCY_WINDOW)
+        self._waiters = FairQueue()
+        self._tokens: Dict[Future, int] = {}      # queued slot -> its FairQueue token
+        self._active = 0
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_deadline = 0
+        self.timed_out = 0
+
+    # === Estimation ===
+
+    def _avg_latency(self) -> float:
+        return sum(self._latencies) / len(self._latencies) if self._latencies else 0.0
+
+    def _estimate_wait(self) -> float:
+        """Seconds until a request arriving now would get a slot."""
+        if self._active < self.max_concurrency and not self._waiters:
+            return 0.0
+        # Each "generation" of max_concurrency queued requests ahead adds one service time
+        rounds = self._waiters.qsize() // self.max_concurrency + 1
+        return rounds * self._avg_latency()
+
+    def estimated_wait(self) -> float:
+        with self._lock:
+            return self._estimate_wait()
+
+    # === Slots ===
+
+    def acquire(
+        self,
+        deadline: Optional[float] = None,
+        user: Optional[str] = None,
+        priority: str = "interactive",
+        cost: float = 1.0
+    ) -> Future:
+        """
+        Request a slot. `deadline` is the caller's total budget in seconds; `user`,
+        `priority` and `cost` (predicted work, e.g. max_tokens) place it in the fair queue.
+        Raises AdmissionRejected when the request cannot be served in time.
+        """
+        with self._lock:
+            wait = self._estimate_wait()
+            retry_after = max(1, math.ceil(wait))
+
+            waiting = self._waiters.qsize()
+            if self._active >= self.max_concurrency and waiting >= self.max_queue:
+                self.rejected_full += 1
+                raise AdmissionRejected(f"Inference queue full ({waiting} waiting).", 503, retry_after)
+
+            if deadline is not None and wait + self._avg_latency() > deadline:
+                self.rejected_deadline += 1
+                raise AdmissionRejected(
+                    f"Estimated wait {wait:.1f}s exceeds the {deadline:.1f}s deadline.", 429, retry_after
+                )
+
+            slot = Future()
+            if self._active < self.max_concurrency:
+                self._active += 1
+                self.admitted += 1
+                slot.set_running_or_notify_cancel()
+                slot.set_result(time.time())
+            else:
+                self._tokens[slot] = self._waiters.put(slot, user, priority, cost)
+            return slot
+
+    def abandon(self, slot: Future):
+        """The caller gave up waiting (timeout/disconnect); drop its place or return its slot."""
+        with self._lock:
+            self.timed_out += 1
+            token = self._tokens.pop(slot, None)
+            if token is not None and self._waiters.remove(token):
+                slot.cancel()
+                return
+        if slot.done() and not slot.cancelled():
+            self.release()
+
+    def release(self, latency: Optional[float] = None):
+        """Return a slot. `latency` (service time in seconds) feeds the wait estimate."""
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            while self._waiters.qsize():
+                waiter = self._waiters.get_nowait()
+                self._tokens.pop(waiter, None)
+                if waiter.set_running_or_notify_cancel():
+                    self.admitted += 1
+                    waiter.set_result(time.time())
+                    return
+            self._active -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "waiting": self._waiters.qsize(),
+                "estimated_wait": round(self._estimate_wait(), 3),
+                "avg_latency": round(self._avg_latency(), 3),
+                "admitted": self.admitted,
+                "rejected_full": self.rejected_full,
+                "rejected_deadline": self.rejected_deadline,
+                "timed_out": self.timed_out,
+                "fairness": self._waiters.stats(),
+            }
@@ -28,6 +28,40 @@ CONTENT_TAGS = [
     "crypto", "tech", "code", "general", "feedback", "security", "ai", "web3", "data"
 ]
 
+# Minimum cosine similarity for a semantic cache hit, per content tag.
+# Precise domains (code, security) need near-identical prompts; general chatter can be looser.
+SEMANTIC_CACHE_TAG_THRESHOLDS = {
+    "code": 0.97,
+    "security": 0.96,
+    "crypto": 0.93,
+    "web3": 0.93,
+    "tech": 0.92,
+    "ai": 0.92,
+    "data": 0.92,
+    "feedback": 0.95,
+    "general": 0.90
+}
+
+# Default latency budget (ms) per content tag when a request sets no deadline_ms.
+# Tags not listed fall back to GENERATION_DEADLINE_MS (0 = no deadline).
+TAG_DEADLINES_MS = {
+    "code": 30000,
+    "security": 20000,
+    "crypto": 10000,
+    "web3": 10000,
+    "tech": 10000,
+    "ai": 10000,
+    "data": 10000,
+    "feedback": 5000,
+    "general": 5000
+}
+
+# Why a generation ended, as reported in response metadata
+FINISH_REASONS = ["eos", "length", "stop", "deadline", "cancelled"]
+
+# Scheduling classes for fair queueing; bulk work only gets a small share while interactive traffic waits
+PRIORITY_CLASSES = ["interactive", "bulk"]
+
 TAG_PRIORITIES = {
     "crypto": 10,
     "tech": 8,
@@ -40,6 +74,17 @@ TAG_PRIORITIES = {
 MIN_PROMPT_WORDS = 4                     # Filter threshold for noisy or low-effort prompts
 MIN_PROMPT_SCORE = 0.3                   # Minimum semantic score for training eligibility
 
+# === Quantization ===
+# Small calibration set for the perplexity check after quantizing (QUANT_EVAL=true)
+QUANT_CALIBRATION_TEXTS = [
+    "A smart contract is a program stored on a blockchain that runs when predetermined conditions are met.",
+    "Proof of stake selects validators in proportion to the amount of cryptocurrency they lock as collateral.",
+    "Python is a high-level programming language known for its readability and large standard library.",
+    "Large language models predict the next token in a sequence based on the tokens that came before it.",
+    "A decentralized autonomous organization is governed by rules encoded in smart contracts and token votes.",
+    "Public key cryptography uses a pair of keys: a public key for encryption and a private key for decryption."
+]
+
 # === Vector Search Settings ===
 VECTOR_DIMENSIONS = 768                  # Default embedding vector size
 VECTOR_DISTANCE_METRIC = "cosine"        # Supported: cosine, euclidean, dot
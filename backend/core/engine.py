@@ -1,9 +1,25 @@
 import logging
+import threading
 import time
+from concurrent.futures import Future
+from contextlib import nullcontext
 from datetime import datetime
 
+from backend.core.admission import AdmissionController
 from backend.core.config import settings
+from backend.core.executor import InferenceExecutor
+from backend.core.scheduler import BatchScheduler, GenerationRequest
+from backend.core.sidecar import SidecarClient, SidecarError
+from backend.core.single_flight import SingleFlight
+from backend.core.warmup import compile_model, run_warmup, uncompile_model
+from backend.models.embedding import embedding_batcher, embedding_service
 from backend.models.loader import load_model
+from backend.models.kv_cache import PrefixKVCache, SessionKVStore
+from backend.models.lora import LoRAManager
+from backend.models.onnx_backend import get_backend
+from backend.models.speculative import get_draft_model, get_mode
+from backend.models.stopping import cancellation_stats
+from backend.services.cache_service import ResponseCache, SemanticCache, make_cache_key
 from backend.db.connection import init_db
 
 logger = logging.getLogger("locentra")
@@ -12,12 +28,29 @@ logger = logging.getLogger("locentra")
 class SyntharaEngine:
     def __init__(self):
         self.model = None
+        self.tokenizer = None
         self.model_meta = {}
+        self.executor = None
+        self.admission = None
+        self.prefix_cache = None
+        self.response_cache = None
+        self.semantic_cache = None
+        self.single_flight = None
+        self.sessions = None            # Chat transcripts + per-session KV (SessionKVStore)
+        self.lora = None
+        self.scheduler = None
         self.db = None
+        self.remote = None              # SidecarClient when models live in the inference sidecar
         self.boot_time = None
         self.booted = False
+        self.warmup_state = "cold"      # cold | warming | warm | failed
+        self.warmup_report = None
 
-    def boot(self, dry_run: bool = False, debug_mode: bool = False):
+    def boot(self, dry_run: bool = False, debug_mode: bool = False, use_sidecar: bool = None):
+        """
+        Load the model and serving subsystems. With SIDECAR_SOCKET set (and use_sidecar
+        not False), this process becomes a thin client of the inference sidecar instead.
+        """
         if self.booted:
             logger.warning("[LocentraOS] Engine already booted. Skipping reinitialization.")
             return
@@ -30,46 +63,364 @@ class SyntharaEngine:
             logger.info("[LocentraOS] Dry-run enabled. No subsystems will be loaded.")
             return
 
+        if use_sidecar is None:
+            use_sidecar = bool(settings.SIDECAR_SOCKET)
+
         try:
             self.db = init_db()
             logger.info("[LocentraOS] Database connection initialized.")
 
-            self.model = load_model()
+            if use_sidecar:
+                self._boot_client()
+                return
+
+            llm = load_model()
+            self.model = llm["model"]
+            self.tokenizer = llm["tokenizer"]
             self.model_meta = self._extract_model_metadata(self.model)
             logger.info(f"[LocentraOS] Model loaded: {self.model_meta.get('name')}")
 
+            if get_mode() == "draft":
+                get_draft_model(self.model.device)
+
+            self.executor = InferenceExecutor()
+            self.admission = AdmissionController()
+            if settings.RESPONSE_CACHE_ENABLED:
+                self.response_cache = ResponseCache()
+            if settings.SEMANTIC_CACHE_ENABLED:
+                self.semantic_cache = SemanticCache()
+            if settings.COALESCE_ENABLED:
+                self.single_flight = SingleFlight()
+            if settings.EMBEDDING_PRELOAD or settings.SEMANTIC_CACHE_ENABLED:
+                # Otherwise the first semantic-cache lookup would pay for loading the embedder
+                embedding_service.preload()
+            self._start_scheduler()
+
             self.booted = True
             duration = round(time.time() - start, 2)
             logger.info(f"[LocentraOS] Boot completed in {duration}s.")
+            self.start_warmup()
         except Exception as e:
             logger.error(f"[LocentraOS] Boot failed: {str(e)}")
             self.booted = False
 
+    def _boot_client(self):
+        """Serve through the inference sidecar: no models in this process, only admission control."""
+        self.remote = SidecarClient()
+        embedding_service.remote = self.remote
+        self.admission = AdmissionController()
+        try:
+            self.model_meta = self.remote.call("ping")["model_meta"]
+        except SidecarError as e:
+            # The sidecar may still be loading; readiness keeps reporting cold until it answers
+            logger.warning(f"[LocentraOS] {e}")
+        self.booted = True
+        logger.info(f"[LocentraOS] Boot completed as sidecar client ({self.remote.socket_path}).")
+
+    def _start_scheduler(self):
+        """Build model-bound serving state (prefix cache + scheduler) for the current model."""
+        torch_backend = get_backend() == "torch"
+        if not torch_backend and (settings.PREFIX_CACHE_ENABLED or settings.LORA_ENABLED):
+            logger.warning("[LocentraOS] Prefix KV cache and LoRA serving require the torch backend; disabled for onnx.")
+        self.prefix_cache = PrefixKVCache(self.model) if settings.PREFIX_CACHE_ENABLED and torch_backend else None
+        self.lora = LoRAManager(self.model) if settings.LORA_ENABLED and torch_backend else None
+        if self.sessions is None:
+            self.sessions = SessionKVStore(cache_kv=settings.SESSION_CACHE_ENABLED and torch_backend)
+        else:
+            self.sessions.clear()  # KV of the previous model is useless; transcripts survive a reload
+        scheduler = BatchScheduler(self.model, self.tokenizer, self.executor, self.prefix_cache, self.lora)
+        scheduler.start()
+        previous, self.scheduler = self.scheduler, scheduler
+        if previous is not None:
+            previous.stop(handoff=scheduler)
+
+    def reload_model(self, model_name: str = None):
+        """
+        Hot-swap the served model, e.g. with a fine-tuned checkpoint directory.
+        Queued requests move to the new scheduler and all caches tied to the old model are dropped.
+        If the new model fails to load, the old one keeps serving and the error is raised.
+        """
+        if not self.booted:
+            raise RuntimeError("Engine not booted.")
+
+        try:
+            llm = load_model(model_name)
+        except RuntimeError:
+            logger.error(f"[LocentraOS] Model reload failed; still serving {self.model_meta.get('name')}.")
+            raise
+        self.model = llm["model"]
+        self.tokenizer = llm["tokenizer"]
+        self.model_meta = self._extract_model_metadata(self.model)
+        self._start_scheduler()
+        self.start_warmup()
+
+        if self.response_cache is not None:
+            self.response_cache.invalidate()
+        if self.semantic_cache is not None:
+            self.semantic_cache.invalidate()
+        logger.info(f"[LocentraOS] Model reloaded: {self.model_meta.get('name')}")
+
+    # === Warmup / readiness ===
+
+    @property
+    def ready(self) -> bool:
+        return self.readiness()["ready"]
+
+    def readiness(self) -> dict:
+        if self.remote is not None:
+            try:
+                state = self.remote.call("ping", timeout=2.0)
+            except SidecarError:
+                return {"ready": False, "state": "unreachable", "model_meta": self.model_meta}
+            self.model_meta = state["model_meta"]
+            return state
+        return {
+            "ready": self.booted and self.warmup_state == "warm",
+            "state": self.warmup_state,
+            "model_meta": self.model_meta
+        }
+
+    def start_warmup(self):
+        """
+        Warm the freshly loaded model in the background; the engine reports ready once done.
+        Liveness is unaffected, so the process answers health checks while warming.
+        """
+        if not settings.WARMUP_ENABLED:
+            self.warmup_state = "warm"
+            return
+        self.warmup_state = "warming"
+        threading.Thread(target=self._warmup, name="locentra-warmup", daemon=True).start()
+
+    def _warmup(self):
+        model, scheduler = self.model, self.scheduler
+        compiled = settings.TORCH_COMPILE and get_backend() == "torch" and compile_model(model)
+        try:
+            try:
+                report = run_warmup(scheduler, self.tokenizer)
+            except Exception as e:
+                if not compiled:
+                    raise
+                logger.warning(f"[LocentraOS] Compiled model failed during warmup ({e}); falling back to eager.")
+                uncompile_model(model)
+                compiled = False
+                report = run_warmup(scheduler, self.tokenizer)
+        except Exception as e:
+            logger.error(f"[LocentraOS] Warmup failed: {e}")
+            self.warmup_state = "failed"
+            self.warmup_report = {"error": str(e)}
+            return
+
+        if model is not self.model:
+            return  # Reloaded meanwhile; the new model's warmup owns the state
+        report["compiled"] = compiled
+        self.warmup_report = report
+        self.warmup_state = "warm"
+        logger.info(f"[LocentraOS] Warmup completed in {report['total_seconds']}s; engine ready.")
+
     def get_model(self):
         return {
             "model": self.model,
+            "tokenizer": self.tokenizer,
             "meta": self.model_meta
         }
 
     def get_db(self):
         return self.db
 
+    def adapter_status(self, name: str) -> dict:
+        """Whether LoRA serving is enabled and adapter `name` exists (asked of the sidecar if remote)."""
+        if self.remote is not None:
+            return self.remote.call("adapter", name=name)
+        return {"enabled": self.lora is not None, "exists": self.lora is not None and self.lora.exists(name)}
+
+    def adapter_context(self, adapter: str = None):
+        """Context in which direct model calls see the requested LoRA adapter (or the base model)."""
+        if self.lora is None:
+            if adapter:
+                raise RuntimeError("LoRA serving is disabled (LORA_ENABLED=false).")
+            return nullcontext()
+        return self.lora.activate(adapter)
+
+    def submit(self, prompt: str, use_cache: bool = True, coalesce: bool = False, **kwargs):
+        """
+        Queue a prompt for batched generation and return a Future for its result.
+        Keyword arguments are forwarded to GenerationRequest. Requests are answered
+        from the exact-match cache (deterministic requests) or the semantic cache
+        (close paraphrases) when possible.
+
+        A greedy request (or a sampled one with `coalesce=True`) that matches a generation
+        already in flight waits for that generation instead of starting its own.
+        """
+        if self.remote is not None:
+            return self.remote.submit("submit", prompt=prompt, use_cache=use_cache, coalesce=coalesce, **kwargs)
+        if self.scheduler is None:
+            raise RuntimeError("Engine not booted: no scheduler available.")
+
+        # Tag, deadline and scheduling identity only select thresholds/budgets/order; they must not split cache entries
+        params = {k: v for k, v in kwargs.items() if k not in ("tag", "deadline_ms", "user", "priority")}
+        cache_key = None
+        scope = None
+
+        if use_cache and self.response_cache is not None and self.response_cache.cacheable(kwargs.get("temperature", 0.7)):
+            cache_key = make_cache_key(prompt, params, self.model_meta)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return self._completed(cached)
+
+        if use_cache and self.semantic_cache is not None:
+            scope = make_cache_key("", params, self.model_meta)
+            cached = self.semantic_cache.get(prompt, scope, kwargs.get("tag"))
+            if cached is not None:
+                request = GenerationRequest(prompt, **kwargs)
+                cached["text"] = f"{request.full_prompt}{cached['completion']}"
+                return self._completed(cached)
+
+        def start() -> Future:
+            request = GenerationRequest(prompt, **kwargs)
+            if cache_key is None and scope is None:
+                return self.scheduler.submit(request)
+            # Reported in the result the scheduler builds; a delivered result is never edited afterwards
+            request.cache = "miss"
+            future = self.scheduler.submit(request)
+            future.add_done_callback(lambda f: self._store_response(f, prompt, cache_key, scope))
+            return future
+
+        if self.single_flight is not None and (kwargs.get("temperature", 0.7) == 0 or coalesce):
+            # Deadlines stay in the key: a generation cut short for one budget must not answer a looser one
+            flight_key = make_cache_key(prompt, {**params, "deadline_ms": kwargs.get("deadline_ms")}, self.model_meta)
+            return self.single_flight.submit(flight_key, start)
+        return start()
+
+    def stream(self, prompt: str, **kwargs):
+        """Yield ("token", text) events and a final ("meta", dict), see infer.stream_response."""
+        if self.remote is not None:
+            return self.remote.stream(prompt=prompt, **kwargs)
+        from backend.models.infer import stream_response
+        return stream_response(prompt, **kwargs)
+
+    def chat(self, session_id: str, message: str, **kwargs):
+        """Yield ("token", text) events and a final ("meta", dict) for one chat turn, see infer.chat_response."""
+        if self.remote is not None:
+            return self.remote.stream(op="chat", session_id=session_id, message=message, **kwargs)
+        from backend.models.infer import chat_response
+        return chat_response(session_id, message, **kwargs)
+
+    def end_chat(self, session_id: str):
+        """Forget a chat session's transcript and KV (the client disconnected)."""
+        if self.remote is not None:
+            return self.remote.call("end_chat", session_id=session_id)
+        if self.sessions is not None:
+            self.sessions.end(session_id)
+        return {"session_id": session_id}
+
+    def run_bucket(self, bucket: list, max_tokens: int = 100, temperature: float = 0.7, adapter: str = None) -> Future:
+        """Run one length-bucket of /api/llm/batch as a padded generate() call, see batch_service.run_bucket."""
+        if self.remote is not None:
+            return self.remote.submit("bucket", bucket=bucket, max_tokens=max_tokens, temperature=temperature, adapter=adapter)
+        from backend.services.batch_service import run_bucket
+        return self.executor.submit(run_bucket, bucket, max_tokens, temperature, adapter)
+
+    def train(self, texts: list, adapter_name: str = None):
+        """
+        Fine-tune on `texts` (a full model copy, or a LoRA adapter if `adapter_name` is given).
+        A retrained adapter is detached so its next request loads it fresh, and cached answers are dropped.
+        """
+        if self.remote is not None:
+            return self.remote.call("train", timeout=settings.SIDECAR_TRAIN_TIMEOUT, texts=texts, adapter_name=adapter_name)
+        from backend.models.trainer import fine_tune_model
+        fine_tune_model(texts, adapter_name=adapter_name)
+        if adapter_name and self.lora is not None:
+            self.lora.unload(adapter_name)
+            if self.response_cache is not None:
+                self.response_cache.invalidate()
+            if self.semantic_cache is not None:
+                self.semantic_cache.invalidate()
+        return {"adapter_name": adapter_name}
+
+    def _completed(self, result: dict) -> Future:
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def _store_response(self, future: Future, prompt: str, cache_key: str = None, scope: str = None):
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if result.get("finish_reason") in ("deadline", "cancelled"):
+            # Cut short by this request's budget; another request may allow the full answer
+            return
+        value = {k: v for k, v in result.items() if k not in ("queue_wait", "batch_time")}
+        if cache_key is not None:
+            self.response_cache.set(cache_key, value)
+        if scope is not None:
+            self.semantic_cache.set(prompt, scope, value)
+
     def status(self):
+        if self.remote is not None:
+            try:
+                status = self.remote.call("status", timeout=5.0)
+            except SidecarError as e:
+                status = {"booted": False, "error": str(e)}
+            # Admission is enforced per HTTP worker, so report this worker's view
+            status["admission"] = self.admission.stats() if self.admission else None
+            status["sidecar"] = self.remote.socket_path
+            return status
+
+        scheduler = self.scheduler.stats() if self.scheduler else None
+        executor = self.executor.stats() if self.executor else None
+        admission = self.admission.stats() if self.admission else None
         return {
             "booted": self.booted,
+            "ready": self.ready,
+            "warmup": {"state": self.warmup_state, "report": self.warmup_report},
             "boot_time": self.boot_time,
             "model_loaded": self.model is not None,
             "model_name": self.model_meta.get("name", "N/A"),
             "db_connected": self.db is not None,
-            "debug_mode": settings.DEBUG
+            "debug_mode": settings.DEBUG,
+            "queue_depth": (
+                (scheduler["queue_depth"] if scheduler else 0)
+                + (executor["queued"] if executor else 0)
+                + (admission["waiting"] if admission else 0)
+            ),
+            "in_flight": executor["in_flight"] if executor else 0,
+            "admission": admission,
+            "scheduler": scheduler,
+            "cancellations": cancellation_stats(),
+            "executor": executor,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+            "response_cache": self.response_cache.stats() if self.response_cache else None,
+            "semantic_cache": self.semantic_cache.stats() if self.semantic_cache else None,
+            "single_flight": self.single_flight.stats() if self.single_flight else None,
+            "sessions": self.sessions.stats() if self.sessions else None,
+            "embeddings": {**embedding_service.stats(), "batching": embedding_batcher.stats()},
+            "lora": self.lora.stats() if self.lora else None
         }
 
     def shutdown(self):
         logger.info("[LocentraOS] Shutting down engine subsystems...")
+        if self.remote is not None:
+            self.remote.close()
+            self.remote = None
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            self.scheduler = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.admission = None
+        self.prefix_cache = None
+        self.response_cache = None
+        self.semantic_cache = None
+        self.single_flight = None
+        self.sessions = None
+        self.lora = None
         self.model = None
+        self.tokenizer = None
         self.model_meta = {}
         self.db = None
         self.booted = False
+        self.warmup_state = "cold"
         logger.info("[LocentraOS] Engine shutdown complete.")
 
     def _extract_model_metadata(self, model):
@@ -77,7 +428,9 @@ class SyntharaEngine:
             return {
                 "name": getattr(model, "name_or_path", "unknown"),
                 "type": type(model).__name__,
-                "has_tokenizer": hasattr(model, "tokenizer")
+                "backend": get_backend(),
+                "has_tokenizer": hasattr(model, "tokenizer"),
+                "quantization": getattr(model, "quant_report", None)
             }
         except Exception:
             return {}
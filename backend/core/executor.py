@@ -0,0 +1,80 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from backend.core.config import settings
+
+logger = logging.getLogger("locentra.executor")
+
+
+class ExecutorSaturated(RuntimeError):
+    """Raised when the inference executor queue is full."""
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool that owns all blocking model work.
+
+    Async routes submit callables here and await the returned Future, so
+    tokenization, generation and decoding never run on the event loop.
+    Keeps live counts of queued and in-flight jobs for engine.status().
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None):
+        self.max_workers = max_workers or settings.INFERENCE_WORKERS
+        self.max_queue = settings.INFERENCE_QUEUE_SIZE if max_queue is None else max_queue
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="locentra-infer")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(f"Inference queue full ({self._queued} jobs waiting).")
+            self._queued += 1
+
+        future = self._pool.submit(self._run, fn, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _run(self, fn: Callable, args: tuple, kwargs: dict):
+        with self._lock:
+            self._queued -= 1
+            self._in_flight += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _on_done(self, future: Future):
+        with self._lock:
+            if future.cancelled():
+                # Cancelled before a worker picked it up, so _run never decremented it
+                self._queued -= 1
+            elif future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        logger.info("[LocentraOS] Inference executor shut down.")
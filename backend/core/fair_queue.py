@@ -0,0 +1,230 @@
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional
+
+from backend.core.config import settings
+from backend.core.constants import PRIORITY_CLASSES
+
+logger = logging.getLogger("locentra.fair_queue")
+
+ANONYMOUS = "anonymous"
+
+# Per-user wait statistics are kept for at most this many users (least recently seen are dropped)
+_MAX_TRACKED_USERS = 1024
+
+
+def class_weights() -> Dict[str, float]:
+    return {"interactive": settings.FAIR_INTERACTIVE_WEIGHT, "bulk": settings.FAIR_BULK_WEIGHT}
+
+
+def user_weights() -> Dict[str, float]:
+    """Parse FAIR_USER_WEIGHTS ("alice=2,bot=0.5"); users not listed weigh 1."""
+    weights = {}
+    for item in settings.FAIR_USER_WEIGHTS.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            weights[name.strip()] = float(value)
+    return weights
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _WaitStats:
+    """Queue-wait samples for one user or class: totals plus a window for percentiles."""
+
+    def __init__(self, window: int):
+        self.served = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.waiting = 0
+        self.recent = deque(maxlen=window)
+
+    def record(self, wait: float):
+        self.served += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+        self.recent.append(wait)
+
+    def as_dict(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "served": self.served,
+            "avg_wait": round(self.total / self.served, 4) if self.served else 0.0,
+            "p50_wait": round(_percentile(self.recent, 0.50), 4),
+            "p99_wait": round(_percentile(self.recent, 0.99), 4),
+            "max_wait": round(self.max, 4),
+        }
+
+
+class _Flow:
+    """Backlog of one (priority class, user) pair."""
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = 0.0       # virtual finish tag of the last item taken from this flow
+        self.items = []         # heap of (order key, seq, entry)
+
+
+class FairQueue:
+    """
+    Thread-safe weighted fair queue (start-time fair queueing on virtual time).
+
+    Items are queued per flow = (priority class, user). Each flow's weight is its
+    class weight (FAIR_INTERACTIVE_WEIGHT / FAIR_BULK_WEIGHT) times the user's weight
+    (FAIR_USER_WEIGHTS). An item's cost is its predicted work (max_tokens), so a user
+    with many or long requests gets the same token share as a user with one short
+    request, and a bulk backlog cannot starve interactive users while still
+    progressing at its weighted share.
+
+    Within a flow items leave in arrival order, or shortest-cost first with `sjf`.
+    An idle flow does not bank credit: when it becomes backlogged again its virtual
+    start is raised to the current virtual time.
+
+    The get()/get_nowait()/qsize() interface mirrors queue.Queue. put() returns a
+    token identifying that one queued entry, for remove(); the same object can be
+    queued more than once.
+    """
+
+    def __init__(self, sjf: bool = None, window: int = None):
+        self.sjf = settings.FAIR_SJF if sjf is None else sjf
+        self._window = window or settings.FAIR_WAIT_WINDOW
+        self._class_weights = class_weights()
+        self._user_weights = user_weights()
+        self._flows: Dict[tuple, _Flow] = {}
+        self._entries: Dict[int, tuple] = {}      # put() token (seq) -> (flow key, entry) for remove()
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._users: "OrderedDict[str, _WaitStats]" = OrderedDict()
+        self._classes = {c: _WaitStats(self._window) for c in PRIORITY_CLASSES}
+
+    # === Producer ===
+
+    def put(self, item: Any, user: Optional[str] = None, priority: str = "interactive", cost: float = 1.0) -> int:
+        """Queue `item` and return its token for remove()."""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class '{priority}'. Expected one of {PRIORITY_CLASSES}.")
+        user = user or ANONYMOUS
+        key = (priority, user)
+        with self._cond:
+            flow = self._flows.get(key)
+            if flow is None:
+                weight = self._class_weights[priority] * self._user_weights.get(user, 1.0)
+                flow = self._flows[key] = _Flow(max(weight, 1e-6))
+            seq = next(self._seq)
+            entry = {"item": item, "cost": max(float(cost), 1.0), "enqueued_at": time.time()}
+            heapq.heappush(flow.items, (entry["cost"] if self.sjf else 0.0, seq, entry))
+            self._entries[seq] = (key, entry)
+            self._size += 1
+            self._user_stats(user).waiting += 1
+            self._classes[priority].waiting += 1
+            self._cond.notify()
+            return seq
+
+    # === Consumer ===
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """Take the next item in fair order, waiting up to `timeout` seconds (raises queue.Empty)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._size > 0, timeout=timeout):
+                raise queue.Empty
+            return self._pop()
+
+    def get_nowait(self) -> Any:
+        with self._cond:
+            if self._size == 0:
+                raise queue.Empty
+            return self._pop()
+
+    def remove(self, token: int) -> bool:
+        """Drop a still-queued entry by its put() token (e.g. its caller gave up). Returns False if it already left."""
+        with self._cond:
+            found = self._entries.pop(token, None)
+            if found is None:
+                return False
+            key, entry = found
+            flow = self._flows[key]
+            flow.items = [e for e in flow.items if e[2] is not entry]
+            heapq.heapify(flow.items)
+            self._size -= 1
+            self._user_stats(key[1]).waiting -= 1
+            self._classes[key[0]].waiting -= 1
+            self._drop_if_idle(key, flow)
+            return True
+
+    def _pop(self) -> Any:
+        # Pick the backlogged flow whose head item has the smallest virtual finish tag
+        best_key, best_start, best_finish = None, 0.0, None
+        for key, flow in self._flows.items():
+            if not flow.items:
+                continue
+            start = max(self._vtime, flow.finish)
+            finish = start + flow.items[0][2]["cost"] / flow.weight
+            if best_finish is None or finish < best_finish:
+                best_key, best_start, best_finish = key, start, finish
+
+        flow = self._flows[best_key]
+        _, seq, entry = heapq.heappop(flow.items)
+        flow.finish = best_finish
+        self._vtime = best_start
+        self._entries.pop(seq, None)
+        self._size -= 1
+
+        priority, user = best_key
+        wait = time.time() - entry["enqueued_at"]
+        user_stats = self._user_stats(user)
+        user_stats.waiting -= 1
+        user_stats.record(wait)
+        self._classes[priority].waiting -= 1
+        self._classes[priority].record(wait)
+        for key, idle in [(k, f) for k, f in self._flows.items() if not f.items]:
+            self._drop_if_idle(key, idle)
+        return entry["item"]
+
+    def _drop_if_idle(self, key: tuple, flow: _Flow):
+        # A flow whose finish tag is behind virtual time has no credit left to remember
+        if not flow.items and flow.finish <= self._vtime:
+            del self._flows[key]
+
+    # === Metrics ===
+
+    def _user_stats(self, user: str) -> _WaitStats:
+        stats = self._users.get(user)
+        if stats is None:
+            stats = self._users[user] = _WaitStats(self._window)
+            while len(self._users) > _MAX_TRACKED_USERS:
+                oldest, old_stats = next(iter(self._users.items()))
+                if old_stats.waiting:
+                    break
+                del self._users[oldest]
+        else:
+            self._users.move_to_end(user)
+        return stats
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._size
+
+    def __len__(self) -> int:
+        return self.qsize()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "sjf": self.sjf,
+                "waiting": self._size,
+                "flows": len(self._flows),
+                "classes": {c: s.as_dict() for c, s in self._classes.items()},
+                "users": {u: s.as_dict() for u, s in self._users.items()},
+            }
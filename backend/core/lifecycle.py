@@ -0,0 +1,22 @@
+import logging
+
+from backend.core.engine import engine
+from backend.services.search_service import prompt_index
+
+logger = logging.getLogger("locentra")
+
+
+def on_startup():
+    """Boot the engine (DB, model, scheduler) when the API process starts."""
+    logger.info("[LocentraOS] API startup hook triggered.")
+    engine.boot()
+
+
+def on_shutdown():
+    """Save new ANN index rows, drain the scheduler and release the model when the API process stops."""
+    logger.info("[LocentraOS] API shutdown hook triggered.")
+    try:
+        prompt_index.save()
+    except Exception as e:
+        logger.error(f"[LocentraOS] Could not save the ANN index rows: {e}")
+    engine.shutdown()
@@ -0,0 +1,424 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+import torch
+from transformers import StoppingCriteriaList
+
+from backend.core.config import settings
+from backend.core.fair_queue import FairQueue
+from backend.models.speculative import ForwardCounter, speculation_report, speculative_kwargs
+from backend.models.stopping import (
+    BudgetCriteria,
+    CancelCriteria,
+    GenerationCancelled,
+    record_cancellation,
+    truncate_at_stop,
+)
+
+logger = logging.getLogger("locentra.scheduler")
+
+
+class GenerationFuture(Future):
+    """
+    Future of a GenerationRequest. cancel() keeps the standard Future contract (only
+    a queued request can be cancelled); request_cancel() also stops a running one by
+    flagging the request, so its row stops decoding at the next step and the future
+    fails with GenerationCancelled.
+    """
+
+    def __init__(self, request: "GenerationRequest"):
+        super().__init__()
+        self._request = request
+
+    def request_cancel(self) -> bool:
+        if self.cancel():
+            return True
+        if self.done():
+            return False
+        self._request.cancelled.set()
+        return True
+
+
+class GenerationRequest:
+    """
+    A single prompt waiting in the scheduler queue.
+
+    The caller keeps a handle on `future`, which resolves to the result dict
+    of this request only, no matter how many prompts shared its batch.
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        max_tokens: int = 100,
+        temperature: float = 0.7,
+        top_k: Optional[int] = None,
+        top_p: Optional[float] = None,
+        repetition_penalty: Optional[float] = None,
+        system_prompt: Optional[str] = None,
+        tag: Optional[str] = None,
+        adapter: Optional[str] = None,
+        deadline_ms: Optional[int] = None,
+        stop: Optional[List[str]] = None,
+        user: Optional[str] = None,
+        priority: str = "interactive",
+    ):
+        self.prompt = prompt
+        self.system_prompt = system_prompt
+        self.tag = tag
+        self.adapter = adapter
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.stop = [s for s in stop or [] if s] or None
+        self.user = user
+        self.priority = priority
+        self.cancelled = threading.Event()
+        self.cache = "bypass"       # "miss" when the engine will cache the answer
+        self.future: Future = GenerationFuture(self)
+        self.enqueued_at = time.time()
+        # The latency budget counts from arrival, so queueing time is included
+        self.deadline = self.enqueued_at + deadline_ms / 1000.0 if deadline_ms else None
+
+    @property
+    def full_prompt(self) -> str:
+        return f"{self.system_prompt}\n{self.prompt}" if self.system_prompt else self.prompt
+
+    def batch_key(self) -> tuple:
+        """Requests can only share a forward pass if they decode the same way, share a prefix and an adapter."""
+        return (self.adapter, self.temperature, self.top_k, self.top_p, self.repetition_penalty, self.system_prompt)
+
+    def generation_kwargs(self) -> Dict[str, Any]:
+        """Sampling arguments for model.generate (greedy when temperature is 0)."""
+        kwargs: Dict[str, Any] = {"do_sample": self.temperature > 0}
+        if self.temperature > 0:
+            kwargs["temperature"] = self.temperature
+            if self.top_k is not None:
+                kwargs["top_k"] = self.top_k
+            if self.top_p is not None:
+                kwargs["top_p"] = self.top_p
+        if self.repetition_penalty is not None:
+            kwargs["repetition_penalty"] = self.repetition_penalty
+        return kwargs
+
+
+class BatchScheduler:
+    """
+    Micro-batching scheduler in front of model.generate.
+
+    Incoming requests are queued and a background thread merges them into
+    left-padded batches, bounded by `max_batch_size` and `max_wait_ms`.
+    The queue is a FairQueue: requests are taken in weighted fair order across
+    users and priority classes (cost = max_tokens), not first-come-first-served.
+    Requests with different sampling settings are split into separate
+    sub-batches; each caller gets its own slice of the output back.
+
+    With a LoRAManager attached, each sub-batch runs with its requests' adapter
+    active. When a PrefixKVCache is attached, requests sharing a system prompt reuse
+    its prefilled past key/values and only the user input is prefilled.
+
+    Every row stops on its own budget (max_tokens, deadline, stop strings) or when
+    its future is cancelled; the batch returns once all rows are finished. Each
+    result reports the `finish_reason`.
+
+    Batches run on the shared InferenceExecutor. The collector only forms a
+    new batch once a worker slot is free, so requests keep accumulating
+    while the previous batch is still decoding.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        executor,
+        prefix_cache=None,
+        lora=None,
+        max_batch_size: int = None,
+        max_wait_ms: int = None
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.executor = executor
+        self.prefix_cache = prefix_cache
+        self.lora = lora
+        self._slots = threading.Semaphore(executor.max_workers)
+        self.max_batch_size = max_batch_size or settings.BATCH_MAX_SIZE
+        wait_ms = settings.BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+        self.max_wait = wait_ms / 1000.0
+
+        # Decoder-only models must be padded on the left for batched generation
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self._queue = FairQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "generated_tokens": 0,
+            "busy_time": 0.0,
+            "errors": 0,
+            "cancelled": 0,
+        }
+
+    # === Lifecycle ===
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="locentra-scheduler", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"[LocentraOS] Scheduler started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={int(self.max_wait * 1000)})"
+        )
+
+    def stop(self, timeout: float = 5.0, handoff: "BatchScheduler" = None):
+        """
+        Stop collecting batches. Requests still queued are moved to `handoff` if given
+        (e.g. on model reload), otherwise failed so callers do not hang forever.
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+        while True:
+            try:
+                req = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if handoff is not None:
+                handoff.submit(req)
+            elif req.future.set_running_or_notify_cancel():
+                req.future.set_exception(RuntimeError("Scheduler stopped before request was served."))
+        logger.info("[LocentraOS] Scheduler stopped.")
+
+    # === Public API ===
+
+    def submit(self, request: GenerationRequest) -> Future:
+        if not self._running:
+            raise RuntimeError("Scheduler is not running.")
+        self._queue.put(request, request.user, request.priority, cost=request.max_tokens)
+        return request.future
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["fairness"] = self._queue.stats()
+        stats["avg_batch_size"] = round(stats["requests"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["tokens_per_sec"] = (
+            round(stats["generated_tokens"] / stats["busy_time"], 2) if stats["busy_time"] else 0.0
+        )
+        stats["busy_time"] = round(stats["busy_time"], 3)
+        return stats
+
+    # === Worker ===
+
+    def _collect(self) -> List[GenerationRequest]:
+        """Block for the first request, then gather more until the batch is full or the wait expires."""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while self._running:
+            if not self._slots.acquire(timeout=0.1):
+                continue
+
+            groups: Dict[tuple, List[GenerationRequest]] = {}
+            for req in self._collect():
+                if req.future.set_running_or_notify_cancel():
+                    groups.setdefault(req.batch_key(), []).append(req)
+                else:
+                    record_cancellation("queued")
+                    with self._stats_lock:
+                        self._stats["cancelled"] += 1
+
+            if not groups:
+                self._slots.release()
+                continue
+
+            for i, group in enumerate(groups.values()):
+                if i > 0:
+                    self._slots.acquire()
+                self._dispatch(group)
+
+    def _dispatch(self, group: List[GenerationRequest]):
+        try:
+            future = self.executor.submit(self._run_batch, group)
+        except Exception as e:
+            self._slots.release()
+            for req in group:
+                req.future.set_exception(e)
+            return
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _run_batch(self, group: List[GenerationRequest]):
+        start = time.time()
+        adapter = group[0].adapter
+        try:
+            with self.lora.activate(adapter) if self.lora is not None else nullcontext():
+                results = self._generate(group)
+        except Exception as e:
+            logger.error(f"[LocentraOS] Batch of {len(group)} failed: {e}")
+            with self._stats_lock:
+                self._stats["errors"] += 1
+            for req in group:
+                req.future.set_exception(e)
+            return
+
+        duration = time.time() - start
+        cancelled = [req.cancelled.is_set() for req in group]
+        with self._stats_lock:
+            self._stats["requests"] += len(group)
+            self._stats["batches"] += 1
+            self._stats["generated_tokens"] += sum(r["output_tokens"] for r in results)
+            self._stats["busy_time"] += duration
+            self._stats["cancelled"] += sum(cancelled)
+
+        for req, result, was_cancelled in zip(group, results, cancelled):
+            if was_cancelled:
+                record_cancellation("running", result["output_tokens"])
+                req.future.set_exception(GenerationCancelled("Request cancelled during generation."))
+                continue
+            result["queue_wait"] = round(start - req.enqueued_at, 4)
+            result["batch_time"] = round(duration, 3)
+            req.future.set_result(result)
+
+    def _tokenize(self, group: List[GenerationRequest]):
+        """
+        Build left-padded inputs for a group. If the group shares a cacheable system
+        prompt, returns [prefix | pad | rest] ids together with the cached prefix KV.
+
+        Each full prompt is tokenized whole, exactly as the uncached path does, and the
+        cache is only used when every row starts with the prefix's own token ids; a
+        prompt whose first tokens merge across the prefix boundary falls back to the
+        uncached path. The pads between prefix and rest are masked, and generate()
+        derives position ids from the attention mask, so they shift nothing.
+        """
+        tokenizer = self.tokenizer
+        system_prompt = group[0].system_prompt
+
+        if system_prompt and self.prefix_cache is not None:
+            prefix_ids = tokenizer(f"{system_prompt}\n", return_tensors="pt")["input_ids"]
+            prefix, width = prefix_ids[0].tolist(), prefix_ids.shape[-1]
+            rows = tokenizer([r.full_prompt for r in group])["input_ids"]
+            aligned = all(row[:width] == prefix and len(row) > width for row in rows)
+            if self.prefix_cache.cacheable(prefix_ids) and aligned:
+                rests = [row[width:] for row in rows]
+                longest = max(len(rest) for rest in rests)
+                inputs = {
+                    "input_ids": torch.tensor([
+                        prefix + [tokenizer.pad_token_id] * (longest - len(rest)) + rest for rest in rests
+                    ]),
+                    "attention_mask": torch.tensor([
+                        [1] * width + [0] * (longest - len(rest)) + [1] * len(rest) for rest in rests
+                    ]),
+                }
+                past = self.prefix_cache.get(prefix_ids, batch_size=len(group), namespace=group[0].adapter)
+                return inputs, past
+            if not aligned:
+                logger.debug("[LocentraOS] Prompt tokens cross the system-prompt boundary; prefix cache skipped.")
+
+        inputs = tokenizer([r.full_prompt for r in group], return_tensors="pt", padding=True)
+        return {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"]}, None
+
+    def _generate(self, group: List[GenerationRequest]) -> List[dict]:
+        tokenizer = self.tokenizer
+        inputs, past = self._tokenize(group)
+        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+        prompt_width = inputs["input_ids"].shape[-1]
+
+        extra = {"past_key_values": past} if past is not None else {}
+        # Speculative decoding needs batch size 1; use it when a request runs alone
+        if len(group) == 1 and past is None:
+            extra.update(speculative_kwargs(self.model))
+        speculative = "assistant_model" in extra or "prompt_lookup_num_tokens" in extra
+
+        budget = BudgetCriteria(
+            prompt_width,
+            max_tokens=[r.max_tokens for r in group],
+            deadlines=[r.deadline for r in group],
+            stops=[r.stop for r in group],
+            tokenizer=tokenizer,
+            eos_token_id=self.model.generation_config.eos_token_id or tokenizer.eos_token_id
+        )
+        stopping = StoppingCriteriaList([CancelCriteria([r.cancelled for r in group]), budget])
+
+        start = time.time()
+        with torch.no_grad(), ForwardCounter(self.model) as counter:
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max(r.max_tokens for r in group),
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=stopping,
+                **extra,
+                **group[0].generation_kwargs(),
+            )
+        elapsed = time.time() - start
+
+        results = []
+        for row, req in enumerate(group):
+            mask = inputs["attention_mask"][row].bool()
+            prompt_ids = inputs["input_ids"][row][mask]
+            new_ids = outputs[row, prompt_width:prompt_width + req.max_tokens]
+            new_ids = new_ids[new_ids != tokenizer.pad_token_id]
+
+            text = tokenizer.decode(torch.cat([prompt_ids, new_ids]), skip_special_tokens=True)
+            completion = tokenizer.decode(new_ids, skip_special_tokens=True)
+            output_tokens = int(new_ids.shape[-1])
+            trimmed, stopped = truncate_at_stop(completion, req.stop)
+            if stopped:
+                text = text[:len(text) - (len(completion) - len(trimmed))]
+                completion = trimmed
+                # Count what the caller receives, not the tokens decoded past the stop string
+                output_tokens = len(tokenizer(completion, add_special_tokens=False)["input_ids"])
+
+            results.append({
+                "text": text,
+                "completion": completion,
+                "finish_reason": self._finish_reason(req, budget, row, stopped),
+                "input_tokens": int(prompt_ids.shape[-1]),
+                "output_tokens": output_tokens,
+                "batch_size": len(group),
+                "prefix_cached": past is not None,
+                "cache": req.cache,
+                "adapter": req.adapter,
+                "speculative": speculation_report(counter, int(new_ids.shape[-1]), elapsed) if speculative else None,
+            })
+        return results
+
+    def _finish_reason(self, req: GenerationRequest, budget: BudgetCriteria, row: int, stopped: bool) -> str:
+        """cancelled > stop > deadline/length (recorded by the budget criteria) > eos."""
+        if req.cancelled.is_set():
+            return "cancelled"
+        if stopped:
+            return "stop"
+        # The budget records EOS itself; a row it never ended stopped on EOS in the final step
+        return budget.reasons[row] or "eos"
@@ -0,0 +1,326 @@
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Iterator, Optional
+
+from backend.core.config import settings
+from backend.core.executor import ExecutorSaturated
+from backend.models.embedding import embedding_service
+from backend.models.lora import AdapterNotFound
+from backend.models.stopping import GenerationCancelled, request_cancel
+
+logger = logging.getLogger("locentra.sidecar")
+
+# How often a handler waiting on a generation checks whether its client hung up
+DISCONNECT_POLL_INTERVAL = 0.25
+
+_HEADER = struct.Struct("!I")
+
+
+class SidecarError(RuntimeError):
+    """Raised by the client when the sidecar is unreachable or answered with an unknown error."""
+
+
+# Errors the sidecar reports by type name, re-raised as the same type in the worker
+_REMOTE_ERRORS = {
+    "AdapterNotFound": AdapterNotFound,
+    "GenerationCancelled": GenerationCancelled,
+    "ExecutorSaturated": ExecutorSaturated,
+    "ValueError": ValueError,
+}
+
+
+# === Wire protocol: 4-byte big-endian length + UTF-8 JSON ===
+
+def send_message(sock: socket.socket, message: dict):
+    body = json.dumps(message, default=str).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Connection closed by peer.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> dict:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+def _error_message(e: Exception) -> dict:
+    return {"error": str(e), "type": type(e).__name__}
+
+
+def _raise_remote(message: dict):
+    error_type = _REMOTE_ERRORS.get(message.get("type"), SidecarError)
+    raise error_type(message["error"])
+
+
+# === Server (runs in the sidecar process, owns the models) ===
+
+class _Handler(socketserver.BaseRequestHandler):
+    """One connection carries one request; streaming requests receive many frames."""
+
+    def handle(self):
+        from backend.core.engine import engine
+
+        try:
+            message = recv_message(self.request)
+        except (ConnectionError, struct.error, ValueError):
+            return
+
+        op = message.pop("op", None)
+        try:
+            if op == "stream":
+                self._stream(engine.stream(**message))
+                return
+            if op == "chat":
+                self._stream(engine.chat(**message))
+                return
+            if op == "ping":
+                reply = engine.readiness()
+            elif op == "status":
+                reply = engine.status()
+            elif op == "submit":
+                reply = self._wait(engine.submit(**message))
+            elif op == "bucket":
+                reply = self._wait(engine.run_bucket(**message))
+            elif op == "adapter":
+                reply = engine.adapter_status(message["name"])
+            elif op == "end_chat":
+                reply = engine.end_chat(message["session_id"])
+            elif op == "train":
+                reply = engine.train(**message)
+            elif op == "embed":
+                reply = embedding_service.embed(message["texts"], normalize=message.get("normalize", True)).tolist()
+            else:
+                raise ValueError(f"Unknown sidecar op: {op!r}")
+            if reply is None:
+                return  # Client went away; nothing to answer
+            send_message(self.request, {"result": reply})
+        except (BrokenPipeError, ConnectionError):
+            pass
+        except Exception as e:
+            try:
+                send_message(self.request, _error_message(e))
+            except OSError:
+                pass
+
+    def _client_gone(self) -> bool:
+        readable, _, _ = select.select([self.request], [], [], 0)
+        return bool(readable) and self.request.recv(1, socket.MSG_PEEK) == b""
+
+    def _wait(self, future: Future) -> Optional[dict]:
+        """Wait for a generation, cancelling it if the worker closes the connection."""
+        while True:
+            try:
+                return future.result(timeout=DISCONNECT_POLL_INTERVAL)
+            except FutureTimeout:
+                if self._client_gone():
+                    request_cancel(future)
+                    return None
+
+    def _stream(self, events):
+        try:
+            for kind, data in events:
+                send_message(self.request, {"event": kind, "data": data})
+            send_message(self.request, {"event": "end"})
+        except (BrokenPipeError, ConnectionError):
+            pass
+        except Exception as e:
+            send_message(self.request, {"event": "error", **_error_message(e)})
+        finally:
+            # Closing the generator stops the decode if the worker hung up mid-stream
+            events.close()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class InferenceServer:
+    """
+    Inference sidecar: one process that owns the LLM, caches, scheduler and embedding
+    models for every gunicorn worker on the host.
+
+    HTTP workers connect over a unix socket (SIDECAR_SOCKET) with SidecarClient,
+    so the model is resident once and the scheduler batches across all workers' traffic.
+    """
+
+    def __init__(self, socket_path: str = None):
+        self.socket_path = socket_path or settings.SIDECAR_SOCKET
+        if not self.socket_path:
+            raise ValueError("SIDECAR_SOCKET must be set to run the inference sidecar.")
+        self._server = None
+
+    def serve_forever(self):
+        from backend.core.engine import engine
+
+        engine.boot(use_sidecar=False)
+        if not engine.booted:
+            raise RuntimeError("Engine failed to boot; sidecar not started.")
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)   # Stale socket from a previous run
+        self._server = _UnixServer(self.socket_path, _Handler)
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"[LocentraOS] Inference sidecar listening on {self.socket_path}")
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            engine.shutdown()
+
+    def stop(self):
+        if self._server is not None:
+            # shutdown() blocks until serve_forever returns, so never call it from that thread
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+
+# === Client (runs in every HTTP worker) ===
+
+class RemoteFuture(Future):
+    """
+    Future of a sidecar call. cancel() is the standard one; request_cancel() also
+    closes the connection of a call in progress, which cancels the remote generation.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._sock: Optional[socket.socket] = None
+        self._cancel_requested = False
+
+    def request_cancel(self) -> bool:
+        if self.cancel():
+            return True
+        if self.done():
+            return False
+        self._cancel_requested = True
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return True
+
+
+class SidecarClient:
+    """
+    Thin client for InferenceServer. Each call uses its own short-lived connection;
+    blocking calls that return Futures run on a small local thread pool.
+    """
+
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        self.socket_path = socket_path or settings.SIDECAR_SOCKET
+        self.timeout = timeout or settings.SIDECAR_TIMEOUT
+        self._pool = ThreadPoolExecutor(max_workers=settings.SIDECAR_CLIENT_THREADS, thread_name_prefix="locentra-sidecar")
+
+    def _connect(self, timeout: Optional[float]) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise SidecarError(f"Inference sidecar unreachable at {self.socket_path}: {e}")
+        return sock
+
+    def call(self, op: str, timeout: float = None, **kwargs):
+        """Blocking request/response call."""
+        sock = self._connect(timeout or self.timeout)
+        try:
+            send_message(sock, {"op": op, **kwargs})
+            reply = recv_message(sock)
+        except (OSError, ConnectionError) as e:
+            raise SidecarError(f"Sidecar call '{op}' failed: {e}")
+        finally:
+            sock.close()
+        if "error" in reply:
+            _raise_remote(reply)
+        return reply["result"]
+
+    def submit(self, op: str, **kwargs) -> Future:
+        """Non-blocking call; the returned Future is cancellable while the sidecar works on it."""
+        future = RemoteFuture()
+        self._pool.submit(self._run, future, op, kwargs)
+        return future
+
+    def _run(self, future: RemoteFuture, op: str, kwargs: dict):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future._sock = self._connect(self.timeout)
+        except SidecarError as e:
+            future.set_exception(e)
+            return
+        if future._cancel_requested:
+            future._sock.close()
+            future.set_exception(GenerationCancelled("Request cancelled."))
+            return
+        try:
+            send_message(future._sock, {"op": op, **kwargs})
+            reply = recv_message(future._sock)
+        except (OSError, ConnectionError) as e:
+            if future._cancel_requested:
+                future.set_exception(GenerationCancelled("Request cancelled."))
+            else:
+                future.set_exception(SidecarError(f"Sidecar call '{op}' failed: {e}"))
+            return
+        finally:
+            future._sock.close()
+
+        if "error" in reply:
+            try:
+                _raise_remote(reply)
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future.set_result(reply["result"])
+
+    def stream(self, op: str = "stream", **kwargs) -> Iterator[tuple]:
+        """Yield (kind, data) events of a remote stream (or chat turn); closing the generator cancels it."""
+        sock = self._connect(self.timeout)
+        try:
+            send_message(sock, {"op": op, **kwargs})
+            while True:
+                frame = recv_message(sock)
+                if frame["event"] == "end":
+                    return
+                if frame["event"] == "error":
+                    _raise_remote(frame)
+                yield frame["event"], frame["data"]
+        finally:
+            sock.close()
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+
+def main():
+    logging.basicConfig(level=settings.LOG_LEVEL)
+    server = InferenceServer()
+    signal.signal(signal.SIGTERM, lambda *_: server.stop())
+    signal.signal(signal.SIGINT, lambda *_: server.stop())
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+from backend.models.stopping import GenerationCancelled, request_cancel
+
+logger = logging.getLogger("locentra.single_flight")
+
+
+class _Subscriber(Future):
+    """
+    One caller's view of a shared generation. Cancelling it only detaches this
+    caller; the shared generation is cancelled once every subscriber has left.
+    """
+
+    def __init__(self, flight: "_Flight", leader: bool):
+        super().__init__()
+        self._flight = flight
+        self.leader = leader
+        self._detached = False
+
+    def cancel(self) -> bool:
+        if self.done():
+            return False
+        cancelled = super().cancel()
+        self._flight.unsubscribe(self)
+        return cancelled
+
+
+class _Flight:
+    def __init__(self, key: str, future: Future):
+        self.key = key
+        self.future = future
+        self.subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, leader: bool) -> _Subscriber:
+        subscriber = _Subscriber(self, leader)
+        with self._lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def joinable(self) -> bool:
+        """Still running and still wanted: a flight everyone left is being cancelled."""
+        with self._lock:
+            return not self.future.done() and any(not s._detached for s in self.subscribers)
+
+    def unsubscribe(self, subscriber: _Subscriber):
+        with self._lock:
+            if subscriber._detached:
+                return
+            subscriber._detached = True
+            remaining = sum(not s._detached for s in self.subscribers)
+        if remaining == 0:
+            # Nobody is waiting for this generation any more
+            request_cancel(self.future)
+
+    def deliver(self, future: Future):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            if not subscriber.set_running_or_notify_cancel():
+                continue
+            if future.cancelled():
+                subscriber.set_exception(GenerationCancelled("Shared generation was cancelled."))
+            elif future.exception() is not None:
+                subscriber.set_exception(future.exception())
+            else:
+                # Each caller gets its own copy, since routes annotate the result in place
+                subscriber.set_result({**future.result(), "coalesced": not subscriber.leader})
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight generations.
+
+    The first request for a key starts the generation; requests with the same key
+    that arrive before it finishes subscribe to the same result instead of decoding
+    again. Every caller gets its own Future, so one caller cancelling (e.g. a client
+    disconnect) does not affect the others. This complements the response cache,
+    which can only answer once the first generation has finished.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.RLock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def submit(self, key: str, start: Callable[[], Future]) -> Future:
+        """Return a Future for `key`, calling `start()` only if no identical generation is running."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.joinable():
+                self.coalesced += 1
+                return flight.subscribe(leader=False)
+
+            flight = _Flight(key, start())
+            subscriber = flight.subscribe(leader=True)
+            self._flights[key] = flight
+            self.leaders += 1
+        flight.future.add_done_callback(lambda f: self._finish(flight, f))
+        return subscriber
+
+    def _finish(self, flight: _Flight, future: Future):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.deliver(future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._flights)
+            waiting = sum(len(f.subscribers) for f in self._flights.values())
+        requests = self.leaders + self.coalesced
+        return {
+            "in_flight": in_flight,
+            "subscribers": waiting,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesce_rate": round(self.coalesced / requests, 4) if requests else 0.0,
+        }
@@ -0,0 +1,74 @@
+import logging
+import time
+from typing import List
+
+import torch
+
+from backend.core.config import settings
+from backend.core.constants import QUANT_CALIBRATION_TEXTS
+from backend.core.scheduler import GenerationRequest
+
+logger = logging.getLogger("locentra.warmup")
+
+
+def warmup_lengths() -> List[int]:
+    return [int(n) for n in settings.WARMUP_PROMPT_TOKENS.split(",") if n.strip()]
+
+
+def warmup_prompt(tokenizer, num_tokens: int) -> str:
+    """A natural-text prompt of roughly `num_tokens` tokens, built from the calibration texts."""
+    text = " ".join(QUANT_CALIBRATION_TEXTS)
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    while len(ids) < num_tokens:
+        ids = ids + ids
+    return tokenizer.decode(ids[:num_tokens], skip_special_tokens=True)
+
+
+def compile_model(model) -> bool:
+    """
+    Wrap model.forward with torch.compile (dynamic shapes, since prompt and KV lengths vary).
+    Compilation itself happens lazily on the first forward pass, i.e. during warmup.
+    """
+    if not hasattr(torch, "compile"):
+        logger.warning("[LocentraOS] torch.compile is not available in this torch build; running eagerly.")
+        return False
+    model._eager_forward = model.forward
+    model.forward = torch.compile(model.forward, mode=settings.TORCH_COMPILE_MODE, dynamic=True)
+    logger.info(f"[LocentraOS] torch.compile enabled (mode={settings.TORCH_COMPILE_MODE}).")
+    return True
+
+
+def uncompile_model(model):
+    if hasattr(model, "_eager_forward"):
+        model.forward = model._eager_forward
+        del model._eager_forward
+
+
+def run_warmup(scheduler, tokenizer) -> dict:
+    """
+    Push representative generations through the scheduler: every configured prompt
+    length, alone and as a full batch. This pays for allocator growth, kernel
+    selection (and compilation) and tokenizer caches before real traffic arrives.
+    Responses are not cached. Returns per-shape timings.
+    """
+    runs = []
+    max_tokens = settings.WARMUP_MAX_TOKENS
+    for num_tokens in warmup_lengths():
+        prompt = warmup_prompt(tokenizer, num_tokens)
+        for batch_size in sorted({1, scheduler.max_batch_size}):
+            start = time.time()
+            futures = [
+                scheduler.submit(GenerationRequest(prompt, max_tokens=max_tokens, temperature=0.0))
+                for _ in range(batch_size)
+            ]
+            for future in futures:
+                future.result()
+            runs.append({
+                "prompt_tokens": num_tokens,
+                "batch_size": batch_size,
+                "seconds": round(time.time() - start, 3),
+            })
+            logger.info(
+                f"[LocentraOS] Warmup: {num_tokens} tokens x{batch_size} in {runs[-1]['seconds']}s"
+            )
+    return {"runs": runs, "total_seconds": round(sum(r["seconds"] for r in runs), 3)}
@@ -0,0 +1,403 @@
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from backend.data.embedding_store import FileLock
+
+logger = logging.getLogger("locentra.ann")
+
+INDEX_VERSION = 1
+MANIFEST_FILE = "index.json"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "index.lock"
+ROWS_DIR = "rows"
+
+# Rows per chunk when assigning vectors to centroids, bounds the [n, k] distance matrix
+_ASSIGN_CHUNK = 16384
+
+# Residuals used to train each PQ sub-quantizer (64 per codeword)
+_PQ_TRAIN_SIZE = 256 * 64
+
+
+# === k-means helpers ===
+
+def _assign(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) for every row of x."""
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _ASSIGN_CHUNK):
+        chunk = x[start:start + _ASSIGN_CHUNK]
+        # |x|^2 is constant per row, so it does not change the argmin
+        labels[start:start + len(chunk)] = np.argmin(c_sq[None, :] - 2.0 * chunk @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 20, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means in numpy. Empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    if len(x) < k:
+        raise ValueError(f"Need at least {k} training vectors, got {len(x)}.")
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+
+    for _ in range(iters):
+        labels = _assign(x, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+# === IVF-PQ index ===
+
+class IVFPQIndex:
+    """
+    Inverted-file index with product quantization (IVF-PQ), in numpy.
+
+    Vectors are expected L2-normalized (as embed_batch returns them), so ranking by
+    L2 distance equals ranking by cosine similarity; scores are reported as cosine
+    (1 - d^2 / 2).
+
+    - A coarse k-means quantizer splits the space into `nlist` cells (inverted lists).
+    - Each vector's residual to its cell centroid is compressed to `m` bytes: the
+      residual is cut into m sub-vectors, each replaced by the nearest of 256 codewords.
+    - A query visits the `nprobe` nearest cells and scores their codes with per-query
+      lookup tables (asymmetric distance), so no full vector is touched.
+    - With `keep_vectors`, float16 copies are kept and the best `k * refine` candidates
+      are re-ranked exactly. nprobe and refine are the recall/latency knobs.
+
+    Until train() is called (it needs a sample of vectors), added vectors live in a
+    flat buffer that is searched exactly.
+    """
+
+    def __init__(self, dim: int, nlist: int = 1024, m: int = 48, keep_vectors: bool = False):
+        if dim % m:
+            raise ValueError(f"PQ sub-quantizers ({m}) must divide the dimension ({dim}).")
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.dsub = dim // m
+        self.keep_vectors = keep_vectors
+        self.centroids: Optional[np.ndarray] = None     # [nlist, dim]
+        self.codebooks: Optional[np.ndarray] = None     # [m, 256, dsub]
+        self.list_ids: List[np.ndarray] = [np.zeros(0, np.int64) for _ in range(nlist)]
+        self.list_codes: List[np.ndarray] = [np.zeros((0, m), np.uint8) for _ in range(nlist)]
+        self.list_vectors: List[np.ndarray] = [np.zeros((0, dim), np.float16) for _ in range(nlist)]
+        self.flat_ids = np.zeros(0, np.int64)
+        self.flat_vectors = np.zeros((0, dim), np.float32)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return int(sum(len(ids) for ids in self.list_ids) + len(self.flat_ids))
+
+    # === Training / encoding ===
+
+    def train(self, sample: np.ndarray, iters: int = 20, seed: int = 0):
+        """Fit the coarse quantizer and PQ codebooks, then move the flat buffer into the lists."""
+        sample = np.ascontiguousarray(sample, dtype=np.float32)
+        start = time.time()
+        self.centroids = kmeans(sample, self.nlist, iters=iters, seed=seed)
+        residuals = sample - self.centroids[_assign(sample, self.centroids)]
+        # 256 codewords need far fewer points than the coarse quantizer
+        residuals = residuals[np.random.default_rng(seed).permutation(len(residuals))[:_PQ_TRAIN_SIZE]]
+        self.codebooks = np.stack([
+            kmeans(residuals[:, j * self.dsub:(j + 1) * self.dsub], 256, iters=iters, seed=seed + j + 1)
+            for j in range(self.m)
+        ])
+        logger.info(
+            f"[LocentraOS] ANN index trained on {len(sample)} vectors "
+            f"(nlist={self.nlist}, m={self.m}) in {time.time() - start:.1f}s"
+        )
+        flat_ids, flat_vectors = self.flat_ids, self.flat_vectors
+        self.flat_ids, self.flat_vectors = np.zeros(0, np.int64), np.zeros((0, self.dim), np.float32)
+        if len(flat_ids):
+            self.add(flat_ids, flat_vectors)
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _assign(residuals[:, j * self.dsub:(j + 1) * self.dsub], self.codebooks[j])
+        return codes
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """Append vectors under integer ids (e.g. PromptLog.id)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if not self.trained:
+            self.flat_ids = np.concatenate([self.flat_ids, ids])
+            self.flat_vectors = np.concatenate([self.flat_vectors, vectors])
+            return
+
+        labels = _assign(vectors, self.centroids)
+        codes = self._encode(vectors - self.centroids[labels])
+        for l in np.unique(labels):
+            rows = labels == l
+            self.list_ids[l] = np.concatenate([self.list_ids[l], ids[rows]])
+            self.list_codes[l] = np.concatenate([self.list_codes[l], codes[rows]])
+            if self.keep_vectors:
+                self.list_vectors[l] = np.concatenate([self.list_vectors[l], vectors[rows].astype(np.float16)])
+
+    # === Search ===
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: int = 16, refine: int = 0) -> List[Tuple[int, float]]:
+        """
+        Approximate top-k (id, cosine score) for one query vector, best first.
+        Higher `nprobe` visits more cells; `refine` > 0 re-ranks k * refine candidates
+        exactly (requires keep_vectors).
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        cand_ids, cand_dists = [], []
+
+        if len(self.flat_ids):
+            cand_ids.append(np.asarray(self.flat_ids))
+            cand_dists.append(np.sum((self.flat_vectors - query) ** 2, axis=1))
+
+        if self.trained:
+            ids, dists = self._search_lists(query, k, nprobe, refine)
+            cand_ids.append(ids)
+            cand_dists.append(dists)
+
+        if not cand_ids:
+            return []
+        ids = np.concatenate(cand_ids)
+        dists = np.concatenate(cand_dists)
+        k = min(k, len(ids))
+        if k <= 0:
+            return []
+        best = np.argpartition(dists, k - 1)[:k]
+        best = best[np.argsort(dists[best])]
+        return [(int(ids[i]), float(1.0 - dists[i] / 2.0)) for i in best]
+
+    def _search_lists(self, query: np.ndarray, k: int, nprobe: int, refine: int) -> Tuple[np.ndarray, np.ndarray]:
+        coarse = np.sum((self.centroids - query) ** 2, axis=1)
+        nprobe = min(nprobe, self.nlist)
+        probe = np.argpartition(coarse, nprobe - 1)[:nprobe]
+        probe = probe[[len(self.list_ids[l]) > 0 for l in probe]]
+        if not len(probe):
+            return np.zeros(0, np.int64), np.zeros(0, np.float32)
+
+        # |q - c - y|^2 = |q - c|^2 + (|y|^2 + 2<c, y>) - 2<q, y>, per sub-quantizer and codeword.
+        # The <q, y> table is shared by every probed list; the cross terms are one batched einsum.
+        codebooks = np.asarray(self.codebooks)
+        q_y = np.einsum("md,mkd->mk", query.reshape(self.m, self.dsub), codebooks)
+        c_y = np.einsum("pmd,mkd->pmk", self.centroids[probe].reshape(len(probe), self.m, self.dsub), codebooks)
+        y_sq = np.einsum("mkd,mkd->mk", codebooks, codebooks)
+        tables = (y_sq + 2.0 * c_y - 2.0 * q_y).reshape(len(probe), -1)          # [nprobe, m * 256]
+
+        sizes = np.array([len(self.list_ids[l]) for l in probe])
+        codes = np.concatenate([self.list_codes[l] for l in probe]).astype(np.int64)
+        owner = np.repeat(np.arange(len(probe)), sizes)
+        flat_index = owner[:, None] * tables.shape[1] + np.arange(self.m) * 256 + codes
+        dists = tables.ravel()[flat_index].sum(axis=1) + np.repeat(coarse[probe], sizes)
+        ids = np.concatenate([self.list_ids[l] for l in probe])
+
+        exact = refine and self.keep_vectors
+        pool = min(k * refine if exact else k, len(dists))
+        if pool < len(dists):
+            keep = np.argpartition(dists, pool - 1)[:pool]
+        else:
+            keep = np.arange(len(dists))
+        if exact:
+            # Fetch the float16 originals of the pool, list by list, and score them exactly
+            offsets = np.concatenate([[0], np.cumsum(sizes)])
+            lists = owner[keep]
+            vectors = np.empty((len(keep), self.dim), np.float32)
+            for p in np.unique(lists):
+                rows = lists == p
+                vectors[rows] = self.list_vectors[probe[p]][keep[rows] - offsets[p]]
+            return ids[keep], np.sum((vectors - query) ** 2, axis=1)
+        return ids[keep], dists[keep]
+
+    # === Persistence ===
+
+    def save(self, path: str, meta: dict = None):
+        """
+        Write the index under directory `path`. Each save goes to a fresh version
+        directory (.npy arrays plus a manifest), then the CURRENT file is atomically
+        replaced to point at it, so readers always find a complete index. Concurrent
+        savers (several workers) are serialized with a file lock; the previous version
+        is kept for readers still opening it and older ones are removed.
+        """
+        os.makedirs(path, exist_ok=True)
+        with FileLock(os.path.join(path, LOCK_FILE)):
+            version_path = tempfile.mkdtemp(prefix=f"v{time.time_ns()}-", dir=path)
+            self._write(version_path, meta)
+
+            previous = IVFPQIndex._current_version(path)
+            fd, pointer_tmp = tempfile.mkstemp(prefix=f"{CURRENT_FILE}.", dir=path)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(os.path.basename(version_path))
+            os.replace(pointer_tmp, os.path.join(path, CURRENT_FILE))
+
+            keep = {os.path.basename(version_path), previous}
+            for name in os.listdir(path):
+                if name.startswith("v") and name not in keep and os.path.isdir(os.path.join(path, name)):
+                    shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    def _write(self, version_path: str, meta: dict = None):
+        offsets = np.cumsum([0] + [len(ids) for ids in self.list_ids])
+        arrays = {
+            "list_offsets": offsets,
+            "ids": np.concatenate(self.list_ids),
+            "codes": np.concatenate(self.list_codes),
+            "flat_ids": self.flat_ids,
+            "flat_vectors": self.flat_vectors,
+        }
+        if self.trained:
+            arrays.update(centroids=self.centroids, codebooks=self.codebooks)
+        if self.keep_vectors:
+            arrays["vectors"] = np.concatenate(self.list_vectors)
+        for name, array in arrays.items():
+            np.save(os.path.join(version_path, f"{name}.npy"), array)
+
+        manifest = {
+            "version": INDEX_VERSION,
+            "created": datetime.utcnow().isoformat(),
+            "dim": self.dim,
+            "nlist": self.nlist,
+            "m": self.m,
+            "keep_vectors": self.keep_vectors,
+            "trained": self.trained,
+            "count": len(self),
+            **(meta or {}),
+        }
+        with open(os.path.join(version_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    @staticmethod
+    def _current_version(path: str) -> Optional[str]:
+        pointer = os.path.join(path, CURRENT_FILE)
+        if not os.path.isfile(pointer):
+            return None
+        with open(pointer, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+
+    @staticmethod
+    def _resolve(path: str) -> str:
+        """Directory holding the current version (indexes saved before versioning live in `path` itself)."""
+        version = IVFPQIndex._current_version(path)
+        return os.path.join(path, version) if version else path
+
+    @staticmethod
+    def read_manifest(path: str) -> Optional[dict]:
+        manifest_path = os.path.join(IVFPQIndex._resolve(path), MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            return None
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQIndex":
+        """Load an index saved with save(); the large code arrays are memory-mapped."""
+        path = cls._resolve(path)
+        manifest = cls.read_manifest(path)
+        if manifest is None or manifest.get("version") != INDEX_VERSION:
+            raise ValueError(f"No compatible ANN index at {path}.")
+
+        def array(name, mmap=False):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+
+        index = cls(manifest["dim"], manifest["nlist"], manifest["m"], manifest["keep_vectors"])
+        if manifest["trained"]:
+            index.centroids = array("centroids")
+            index.codebooks = array("codebooks")
+        offsets = array("list_offsets")
+        ids, codes = array("ids", mmap=True), array("codes", mmap=True)
+        vectors = array("vectors", mmap=True) if index.keep_vectors else None
+        for l in range(index.nlist):
+            lo, hi = offsets[l], offsets[l + 1]
+            index.list_ids[l] = ids[lo:hi]
+            index.list_codes[l] = codes[lo:hi]
+            if vectors is not None:
+                index.list_vectors[l] = vectors[lo:hi]
+        index.flat_ids = array("flat_ids")
+        index.flat_vectors = array("flat_vectors")
+        return index
+
+
+# === Row logs ===
+#
+# Rows added after a snapshot are appended by each writer (worker process) to its own
+# log under `path`/rows, named "<tag>.<dim>d.<writer>.rows", as fixed-size
+# (int64 id, float32 vector) records. Writers never touch each other's logs, so no
+# rows are lost when several workers save; readers merge every log matching a tag.
+
+def _row_dtype(dim: int) -> np.dtype:
+    return np.dtype([("id", "<i8"), ("vector", "<f4", (dim,))])
+
+
+def _row_logs(path: str, tag: str) -> List[Tuple[str, int]]:
+    logs = []
+    for log in sorted(glob.glob(os.path.join(path, ROWS_DIR, f"{glob.escape(tag)}.*d.*.rows"))):
+        match = re.match(r"\.(\d+)d\.", os.path.basename(log)[len(tag):])
+        if match:
+            logs.append((log, int(match.group(1))))
+    return logs
+
+
+def append_rows(path: str, tag: str, writer: str, ids: np.ndarray, vectors: np.ndarray):
+    """Append (id, vector) rows to this writer's log; a torn tail from a crash is cut off first."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    records = np.empty(len(ids), dtype=_row_dtype(vectors.shape[1]))
+    records["id"] = ids
+    records["vector"] = vectors
+    os.makedirs(os.path.join(path, ROWS_DIR), exist_ok=True)
+    log = os.path.join(path, ROWS_DIR, f"{tag}.{vectors.shape[1]}d.{writer}.rows")
+    with FileLock(os.path.join(path, LOCK_FILE)):
+        with open(log, "ab") as f:
+            f.truncate(f.tell() - f.tell() % records.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(records.tobytes())
+
+
+def read_rows(path: str, tag: str, after_id: int = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Rows (with id > after_id, if given) from every log for `tag`, deduplicated by id, or None if there are none."""
+    ids, vectors = [], []
+    with FileLock(os.path.join(path, LOCK_FILE)) if os.path.isdir(path) else nullcontext():
+        for log, dim in _row_logs(path, tag):
+            dtype = _row_dtype(dim)
+            records = np.fromfile(log, dtype=dtype, count=os.path.getsize(log) // dtype.itemsize)
+            if after_id is not None:
+                records = records[records["id"] > after_id]
+            ids.append(records["id"])
+            vectors.append(records["vector"])
+    if not ids or len({v.shape[1] for v in vectors}) > 1:
+        return None
+    ids, first = np.unique(np.concatenate(ids), return_index=True)
+    if not len(ids):
+        return None
+    return ids, np.concatenate(vectors)[first]
+
+
+def prune_rows(path: str, upto_id: int):
+    """Remove the logs whose rows all have ids <= upto_id (they are covered by a snapshot)."""
+    if not os.path.isdir(os.path.join(path, ROWS_DIR)):
+        return
+    with FileLock(os.path.join(path, LOCK_FILE)):
+        for log in glob.glob(os.path.join(path, ROWS_DIR, "*.rows")):
+            match = re.search(r"\.(\d+)d\.[^.]+\.rows$", log)
+            if not match:
+                continue
+            dtype = _row_dtype(int(match.group(1)))
+            records = np.fromfile(log, dtype=dtype, count=os.path.getsize(log) // dtype.itemsize)
+            if not len(records) or records["id"].max() <= upto_id:
+                os.remove(log)
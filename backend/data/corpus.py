@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from backend.core.config import settings
+
+METRICS = ("cosine", "dot", "euclidean")
+
+# Corpora embedded by most_similar, reused while the same texts are queried again.
+# Bounded by the bytes of their matrices (CORPUS_CACHE_MAX_MB), least recently used first out.
+_corpus_cache: "OrderedDict[tuple, EmbeddingCorpus]" = OrderedDict()
+_corpus_bytes = 0
+_corpus_lock = threading.Lock()
+
+
+class EmbeddingCorpus:
+    """
+    A corpus embedded once into a contiguous float32 matrix (one row per entry).
+
+    Queries are scored against every row with a single matrix-vector product (or a
+    matrix-matrix product for a batch of queries) and the top k are selected with
+    argpartition, so only k scores are ever sorted. Metrics:
+
+    - cosine: dot product over the row and query norms (rows' inverse norms are precomputed)
+    - dot: raw inner product
+    - euclidean: negated L2 distance, so that higher is more similar for every metric
+    """
+
+    def __init__(
+        self,
+        texts: Sequence[str],
+        embed_fn: Callable[..., np.ndarray],
+        keys: Optional[Sequence[Hashable]] = None,
+        normalize: bool = True,
+        batch_size: int = 256
+    ):
+        self.keys = list(keys) if keys is not None else list(texts)
+        self.normalize = normalize
+        chunks = [
+            embed_fn(list(texts[i:i + batch_size]), normalize=normalize)
+            for i in range(0, len(texts), batch_size)
+        ]
+        self.matrix = np.ascontiguousarray(np.vstack(chunks), dtype=np.float32) if chunks else np.zeros((0, 0), np.float32)
+        sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+        self._sq_norms = sq_norms
+        self._inv_norms = 1.0 / (np.sqrt(sq_norms) + 1e-10)
+
+    @classmethod
+    def from_corpus(cls, corpus: Union[List[str], Dict[str, str]], embed_fn, normalize: bool = True) -> "EmbeddingCorpus":
+        """Build from a list of texts (keys are the texts) or a dict of id -> text."""
+        if isinstance(corpus, dict):
+            return cls(list(corpus.values()), embed_fn, keys=list(corpus.keys()), normalize=normalize)
+        return cls(list(corpus), embed_fn, normalize=normalize)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    # === Scoring ===
+
+    def scores(self, queries: np.ndarray, metric: str = "cosine") -> np.ndarray:
+        """Similarity of each query (shape [d] or [q, d]) to every row: shape [n] or [q, n]."""
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        q = np.asarray(queries, dtype=np.float32)
+        if not len(self):
+            return np.zeros(q.shape[:-1] + (0,), dtype=np.float32)
+        dots = q @ self.matrix.T
+
+        if metric == "dot":
+            return dots
+        q_sq = np.einsum("...d,...d->...", q, q)
+        if metric == "cosine":
+            q_inv = 1.0 / (np.sqrt(q_sq) + 1e-10)
+            return np.clip(dots * self._inv_norms * np.expand_dims(q_inv, -1), -1.0, 1.0)
+        # |a - b|^2 = |a|^2 - 2 a.b + |b|^2, clamped against rounding below zero
+        sq_dist = self._sq_norms - 2.0 * dots + np.expand_dims(q_sq, -1)
+        return -np.sqrt(np.maximum(sq_dist, 0.0))
+
+    def top_k(
+        self,
+        queries: np.ndarray,
+        top_k: int = 5,
+        metric: str = "cosine",
+        min_score: float = None
+    ) -> Union[List[Tuple[Hashable, float]], List[List[Tuple[Hashable, float]]]]:
+        """
+        Best `top_k` (key, score) pairs, highest first. A single query vector returns one
+        list; a [q, d] matrix of queries returns one list per query.
+        """
+        scores = self.scores(queries, metric)
+        single = scores.ndim == 1
+        scores = np.atleast_2d(scores)
+        k = min(top_k, scores.shape[1])
+        if k <= 0:
+            return [] if single else [[] for _ in range(scores.shape[0])]
+
+        # argpartition finds the k best in O(n); only those k are sorted
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1)
+        best = np.take_along_axis(part, order, axis=1)
+        best_scores = np.take_along_axis(part_scores, order, axis=1)
+
+        results = []
+        for rows, row_scores in zip(best, best_scores):
+            results.append([
+                (self.keys[i], float(s))
+                for i, s in zip(rows, row_scores)
+                if min_score is None or s >= min_score
+            ])
+        return results[0] if single else results
+
+
+def corpus_for(corpus: Union[List[str], Dict[str, str]], embed_fn, normalize: bool = True) -> EmbeddingCorpus:
+    """
+    EmbeddingCorpus for `corpus`, reusing the matrix when the same texts (and keys)
+    were embedded recently, so repeated most_similar calls do not re-embed. A corpus
+    larger than the whole CORPUS_CACHE_MAX_MB budget is built but not kept.
+    """
+    global _corpus_bytes
+    if isinstance(corpus, dict):
+        key = (embed_fn, normalize, tuple(corpus.keys()), tuple(corpus.values()))
+    else:
+        key = (embed_fn, normalize, tuple(corpus))
+
+    with _corpus_lock:
+        cached = _corpus_cache.get(key)
+        if cached is not None:
+            _corpus_cache.move_to_end(key)
+            return cached
+
+    built = EmbeddingCorpus.from_corpus(corpus, embed_fn, normalize=normalize)
+    max_bytes = settings.CORPUS_CACHE_MAX_MB * 1024 * 1024
+    if built.matrix.nbytes > max_bytes:
+        return built
+    with _corpus_lock:
+        if key not in _corpus_cache:
+            _corpus_cache[key] = built
+            _corpus_bytes += built.matrix.nbytes
+        while _corpus_bytes > max_bytes and _corpus_cache:
+            _, evicted = _corpus_cache.popitem(last=False)
+            _corpus_bytes -= evicted.matrix.nbytes
+    return built
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+from backend.core.config import settings
+
+logger = logging.getLogger("locentra.embedding_store")
+
+STORE_VERSION = 1
+MANIFEST_FILE = "store.json"
+VECTORS_FILE = "vectors.bin"
+INDEX_FILE = "index.bin"
+LOCK_FILE = "store.lock"
+
+KEY_BYTES = 16
+DTYPES = ("float16", "float32")
+
+# Recently appended keys are looked up in a dict and merged into the sorted arrays in bulk
+_TAIL_MERGE = 65536
+
+
+def content_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class FileLock:
+    """Exclusive flock on a lock file, serializing writers across processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        self.handle = open(self.path, "a+b")
+        if fcntl is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+        self.handle.close()
+
+
+class EmbeddingStore:
+    """
+    Persistent embedding cache: content hash -> row of an append-only memory-mapped file.
+
+    Layout (one directory per embedding model, so a model change never serves stale vectors):
+    - vectors.bin: raw (unnormalized) embeddings, `dim` values of `dtype` per row
+    - index.bin:   one 16-byte BLAKE2b digest of the text per row; record i describes row i
+    - store.json:  model name, dim, dtype and format version
+
+    Appends take an exclusive flock, write the vectors first and the index records
+    last, so any process that sees a record can read its row. Every gunicorn worker
+    maps the same files read-only and picks up rows written by the others on its
+    next lookup. The hash index is kept in memory as sorted fixed-width keys
+    (16 bytes + a row number per entry) rather than a dict.
+
+    Returned vectors are always fresh float32 copies, so callers may modify them.
+    """
+
+    def __init__(self, path: str, model_name: str, dim: int, dtype: str = "float16", max_bytes: int = 0):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown embedding store dtype: {dtype}. Expected one of {DTYPES}.")
+        self.path = path
+        self.model_name = model_name
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.row_bytes = dim * self.dtype.itemsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._full_warned = False
+
+        self._keys = np.zeros(0, dtype=f"S{KEY_BYTES}")     # sorted
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._tail: Dict[bytes, int] = {}
+        self._count = 0                                      # index records loaded
+        self._map: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+
+        os.makedirs(path, exist_ok=True)
+        self._check_manifest()
+        self.refresh()
+
+    @staticmethod
+    def path_for(model_name: str) -> str:
+        return os.path.join(settings.EMBEDDING_STORE_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+    @classmethod
+    def recorded_dim(cls, model_name: str) -> Optional[int]:
+        """Dimension in the manifest of `model_name`'s store, or None if none has been written."""
+        try:
+            with open(os.path.join(cls.path_for(model_name), MANIFEST_FILE), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest.get("dim") if manifest.get("model") == model_name else None
+
+    @classmethod
+    def for_model(cls, model_name: str, dim: int) -> "EmbeddingStore":
+        """The store for `model_name` under EMBEDDING_STORE_DIR."""
+        return cls(
+            cls.path_for(model_name),
+            model_name,
+            dim,
+            dtype=settings.EMBEDDING_STORE_DTYPE,
+            max_bytes=settings.EMBEDDING_STORE_MAX_MB * 1024 * 1024,
+        )
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _check_manifest(self):
+        manifest = {"version": STORE_VERSION, "model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}
+        manifest_path = self._file(MANIFEST_FILE)
+        with self._file_lock():
+            if os.path.exists(manifest_path):
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    existing = json.load(f)
+                if existing != manifest:
+                    raise ValueError(f"Embedding store at {self.path} was written as {existing}, expected {manifest}.")
+                return
+            tmp_path = f"{manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, manifest_path)
+
+    def _file_lock(self) -> "FileLock":
+        return FileLock(self._file(LOCK_FILE))
+
+    # === Index ===
+
+    def refresh(self):
+        """Load index records appended (by any process) since the last refresh."""
+        with self._lock:
+            index_path = self._file(INDEX_FILE)
+            size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+            records = size // KEY_BYTES
+            if records <= self._count:
+                return
+            with open(index_path, "rb") as f:
+                f.seek(self._count * KEY_BYTES)
+                data = f.read((records - self._count) * KEY_BYTES)
+            # Sliced from the raw bytes: numpy "S" scalars would drop trailing NUL bytes
+            for i in range(records - self._count):
+                self._tail.setdefault(data[i * KEY_BYTES:(i + 1) * KEY_BYTES], self._count + i)
+            self._count = records
+            if len(self._tail) >= _TAIL_MERGE:
+                self._merge_tail()
+
+    def _merge_tail(self):
+        keys = np.concatenate([self._keys, np.array(list(self._tail.keys()), dtype=f"S{KEY_BYTES}")])
+        rows = np.concatenate([self._rows, np.fromiter(self._tail.values(), dtype=np.int64, count=len(self._tail))])
+        order = np.argsort(keys, kind="stable")
+        self._keys, self._rows = keys[order], rows[order]
+        self._tail = {}
+
+    def _find(self, keys: List[bytes]) -> np.ndarray:
+        """Row of each key, or -1."""
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._keys):
+            probe = np.array(keys, dtype=f"S{KEY_BYTES}")
+            pos = np.minimum(np.searchsorted(self._keys, probe), len(self._keys) - 1)
+            found = self._keys[pos] == probe
+            rows[found] = self._rows[pos[found]]
+        for i, key in enumerate(keys):
+            if rows[i] < 0:
+                rows[i] = self._tail.get(key, -1)
+        return rows
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        needed = int(rows.max()) + 1 if len(rows) else 0
+        if self._map is None or len(self._map) < needed:
+            self._map = np.memmap(self._file(VECTORS_FILE), dtype=self.dtype, mode="r", shape=(self._count, self.dim))
+        return np.asarray(self._map[rows], dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self._count
+
+    # === Lookup / fill-in ===
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Stored embedding of each text, or None."""
+        keys = [content_key(t) for t in texts]
+        with self._lock:
+            rows = self._find(keys)
+            if (rows < 0).any():
+                self.refresh()
+                rows = self._find(keys)
+            present = np.flatnonzero(rows >= 0)
+            vectors = self._vectors(rows[present]) if len(present) else None
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        for j, i in enumerate(present):
+            found[i] = vectors[j]
+        return found
+
+    def get_or_compute(self, texts: Sequence[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for `texts` as a [n, dim] float32 array. Texts not in the store are
+        encoded together in one `encode_fn` call (deduplicated) and appended.
+        """
+        texts = list(texts)
+        found = self.get_many(texts)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, found) if v is None))
+        with self._lock:
+            self.hits += len(texts) - sum(v is None for v in found)
+            self.misses += len(missing)
+
+        computed = {}
+        if missing:
+            vectors = np.asarray(encode_fn(missing), dtype=np.float32).reshape(len(missing), self.dim)
+            computed = dict(zip(missing, vectors))
+            self.append(missing, vectors)
+
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, (text, vec) in enumerate(zip(texts, found)):
+            out[i] = vec if vec is not None else computed[text]
+        return out
+
+    def append(self, texts: Sequence[str], vectors: np.ndarray):
+        """Persist embeddings for `texts`, skipping any another process stored meanwhile."""
+        if self.max_bytes and self._count * self.row_bytes >= self.max_bytes:
+            if not self._full_warned:
+                logger.warning(f"[LocentraOS] Embedding store {self.path} reached EMBEDDING_STORE_MAX_MB; not growing it.")
+                self._full_warned = True
+            return
+
+        keys = [content_key(t) for t in texts]
+        with self._lock, self._file_lock():
+            self.refresh()
+            fresh = [i for i, row in enumerate(self._find(keys)) if row < 0]
+            fresh = list({keys[i]: i for i in fresh}.values())
+            if not fresh:
+                return
+
+            vectors_path, index_path = self._file(VECTORS_FILE), self._file(INDEX_FILE)
+            # Drop torn tails left by a crashed writer: only complete index records count
+            for file_path, size in ((vectors_path, self._count * self.row_bytes), (index_path, self._count * KEY_BYTES)):
+                with open(file_path, "ab") as f:
+                    if f.tell() != size:
+                        f.truncate(size)
+            with open(vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(np.asarray(vectors)[fresh], dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(index_path, "ab") as f:
+                f.write(b"".join(keys[i] for i in fresh))
+            self.refresh()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "model": self.model_name,
+                "dtype": self.dtype.name,
+                "rows": self._count,
+                "bytes": self._count * self.row_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+_stores: Dict[str, Optional[EmbeddingStore]] = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(model_name: str, dim: int = None) -> Optional[EmbeddingStore]:
+    """
+    Process-wide store for `model_name`, or None when EMBEDDING_STORE_ENABLED is off
+    or the store directory is unusable (embeddings are then computed every time).
+
+    Without `dim` the dimension recorded in the store's manifest is used, so a
+    lookup needs no model; None is returned while no store has been written yet.
+    """
+    if not settings.EMBEDDING_STORE_ENABLED:
+        return None
+    with _stores_lock:
+        if model_name not in _stores:
+            if dim is None:
+                dim = EmbeddingStore.recorded_dim(model_name)
+                if dim is None:
+                    return None
+            try:
+                _stores[model_name] = EmbeddingStore.for_model(model_name, dim)
+            except (OSError, ValueError) as e:
+                logger.warning(f"[LocentraOS] Embedding store disabled for {model_name}: {e}")
+                _stores[model_name] = None
+        return _stores[model_name]
@@ -45,20 +45,39 @@ def tokenize_text(text: str, padding: bool = False, truncation: bool = True, max
         kwargs["max_length"] = max_length
     return tokenizer(text, **kwargs)
 
-def tokenize_batch(texts: list[str], padding: bool = True, truncation: bool = True, max_length: int = None) -> dict:
+def tokenize_batch(
+    texts: list[str],
+    padding: bool = True,
+    truncation: bool = True,
+    max_length: int = None,
+    padding_side: str = None
+) -> dict:
     """
     Tokenize a list of input strings in batch mode.
+    Use padding_side="left" for batched generation with decoder-only models; it
+    applies to this call only and leaves the shared tokenizer's default alone.
     """
     tokenizer = get_tokenizer()
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
     kwargs = {
         "return_tensors": "pt",
         "truncation": truncation,
         "padding": "max_length" if padding else "longest"
     }
+    if padding_side:
+        kwargs["padding_side"] = padding_side
     if max_length:
         kwargs["max_length"] = max_length
     return tokenizer(texts, **kwargs)
 
+def token_lengths(texts: list[str]) -> list[int]:
+    """
+    Returns the token count of each input string (single batched tokenizer call).
+    """
+    tokenizer = get_tokenizer()
+    return [len(ids) for ids in tokenizer(texts)["input_ids"]]
+
 def count_tokens(text: str) -> int:
     """
     Returns number of tokens in a given input string.
@@ -1,26 +1,36 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
 from typing import List, Tuple, Union, Dict, Optional
-from functools import lru_cache
+from backend.data.corpus import corpus_for
+from backend.core.config import settings
+from backend.models.embedding import embedding_batcher, embedding_service
 
-# Load pre-trained sentence transformer (MiniLM for fast inference)
-_model = SentenceTransformer("all-MiniLM-L6-v2")
+# Shared MiniLM sentence embedder, loaded on first use (see EmbeddingService)
+EMBEDDING_MODEL = embedding_service.model_name
 
 # === Text Embedding ===
 
-@lru_cache(maxsize=512)
 def embed_text(text: str, normalize: bool = True) -> np.ndarray:
-    """Generate a semantic embedding from a single text input."""
-    vec = _model.encode(text, convert_to_numpy=True)
-    return vec / np.linalg.norm(vec) if normalize else vec
+    """
+    Generate a semantic embedding from a single text input. Concurrent callers are
+    merged into one model call by the embedding batcher (EMBEDDING_BATCHING).
+    """
+    if settings.EMBEDDING_BATCHING:
+        return embedding_batcher.embed(text, normalize=normalize)
+    return embed_batch([text], normalize=normalize)[0]
+
+async def embed_text_async(text: str, normalize: bool = True) -> np.ndarray:
+    """embed_text for async callers: awaits the batcher instead of blocking the event loop."""
+    if settings.EMBEDDING_BATCHING:
+        return await embedding_batcher.aembed(text, normalize=normalize)
+    return embed_batch([text], normalize=normalize)[0]
 
 def embed_batch(texts: List[str], normalize: bool = True) -> np.ndarray:
-    """Generate embeddings for a batch of texts."""
-    vecs = _model.encode(texts, convert_to_numpy=True)
-    if normalize:
-        norms = np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-10
-        vecs = vecs / norms
-    return vecs
+    """
+    Generate embeddings for a batch of texts. Texts seen before (by any worker, or
+    before a restart) come from the on-disk embedding store; the rest are encoded
+    together and added to it.
+    """
+    return embedding_service.embed(texts, normalize=normalize)
 
 # === Cosine Similarity ===
 
@@ -38,7 +48,8 @@ def most_similar(
     corpus: Union[List[str], Dict[str, str]],
     top_k: int = 5,
     min_score: float = 0.0,
-    normalize: bool = True
+    normalize: bool = True,
+    metric: str = "cosine"
 ) -> List[Tuple[str, float]]:
     """
     Return top-k most similar texts (or IDs) from a corpus given a query.
@@ -46,18 +57,27 @@ def most_similar(
     corpus can be:
     - List[str] of raw texts
     - Dict[str, str] where keys are metadata IDs and values are texts
+
+    The corpus is embedded once in batches and kept as a matrix (see EmbeddingCorpus),
+    so repeated queries against the same corpus cost one matrix-vector product.
     """
     query_vec = embed_text(query, normalize=normalize)
+    return corpus_for(corpus, embed_batch, normalize).top_k(query_vec, top_k, metric, min_score)
 
-    if isinstance(corpus, dict):
-        items = corpus.items()
-    else:
-        items = [(text, text) for text in corpus]
-
-    results = []
-    for key, text in items:
-        score = cosine_similarity(query_vec, embed_text(text, normalize=normalize))
-        if score >= min_score:
-            results.append((key, score))
-
-    return sorted(results, key=lambda x: x[1], reverse=True)[:top_k]
+def most_similar_batch(
+    queries: List[str],
+    corpus: Union[List[str], Dict[str, str]],
+    top_k: int = 5,
+    *,
+    min_score: float = 0.0,
+    normalize: bool = True,
+    metric: str = "cosine"
+) -> List[List[Tuple[str, float]]]:
+    """
+    most_similar for many queries at once: one matrix-matrix product against the corpus.
+    Same signature as backend.db.schema.most_similar_batch; options are keyword-only.
+    """
+    if not queries:
+        return []
+    query_vecs = embed_batch(queries, normalize=normalize)
+    return corpus_for(corpus, embed_batch, normalize).top_k(query_vecs, top_k, metric, min_score)
@@ -1,32 +1,36 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from functools import lru_cache
 from typing import List, Tuple, Dict, Union, Optional
+from backend.data.corpus import corpus_for
+from backend.core.config import settings
+from backend.models.embedding import embedding_batcher, embedding_service
 
-# Load the embedding model once
-_model = SentenceTransformer("all-MiniLM-L6-v2")
+# === Schema ===
+
+def reflect_schema():
+    """
+    ORM metadata for every table (importing the models registers them).
+    """
+    from backend.db import models  # noqa: F401
+    from backend.db.connection import Base
+    return Base.metadata
 
 # === Embedding Utilities ===
 
-@lru_cache(maxsize=1024)
 def embed_text(text: str, normalize: bool = True) -> np.ndarray:
     """
     Embed a single string using sentence-transformers, with optional L2 normalization.
+    Concurrent callers share batched model calls (see EmbeddingBatcher).
     """
-    vec = _model.encode(text, convert_to_numpy=True)
-    if normalize:
-        vec = vec / (np.linalg.norm(vec) + 1e-10)
-    return vec
+    if settings.EMBEDDING_BATCHING:
+        return embedding_batcher.embed(text, normalize=normalize)
+    return embed_batch([text], normalize=normalize)[0]
 
 def embed_batch(texts: List[str], normalize: bool = True) -> np.ndarray:
     """
-    Embed a list of strings in batch mode.
+    Embed a list of strings in batch mode, via the shared embedding service (the
+    model is loaded on first use, and previously seen texts come from the store).
     """
-    vecs = _model.encode(texts, convert_to_numpy=True)
-    if normalize:
-        norms = np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-10
-        vecs = vecs / norms
-    return vecs
+    return embedding_service.embed(texts, normalize=normalize)
 
 # === Similarity Computation ===
 
@@ -60,34 +64,32 @@ def most_similar(
 
     Supports:
     - corpus as List[str] or Dict[id -> text]
-    - cosine, dot, or euclidean distance
+    - cosine, dot, or euclidean distance (negated, so higher is closer)
     - score filtering
+
+    The corpus is embedded once in batches into a matrix (see EmbeddingCorpus) and
+    scored with a single matrix-vector product.
     """
     query_vec = embed_text(query, normalize=normalize)
+    return corpus_for(corpus, embed_batch, normalize).top_k(query_vec, top_k, metric, min_score)
 
-    if isinstance(corpus, dict):
-        entries = corpus.items()
-    else:
-        entries = [(text, text) for text in corpus]
-
-    def score_fn(a, b):
-        if metric == "cosine":
-            return cosine_similarity(a, b)
-        elif metric == "dot":
-            return dot_product(a, b)
-        elif metric == "euclidean":
-            return -euclidean_distance(a, b)  # invert for similarity sorting
-        else:
-            raise ValueError(f"Unknown metric: {metric}")
-
-    scored = []
-    for key, text in entries:
-        vec = embed_text(text, normalize=normalize)
-        score = score_fn(query_vec, vec)
-        if score >= min_score:
-            scored.append((key, score))
-
-    return sorted(scored, key=lambda x: x[1], reverse=True)[:top_k]
+def most_similar_batch(
+    queries: List[str],
+    corpus: Union[List[str], Dict[str, str]],
+    top_k: int = 5,
+    *,
+    min_score: float = 0.0,
+    normalize: bool = True,
+    metric: str = "cosine"
+) -> List[List[Tuple[str, float]]]:
+    """
+    most_similar for a list of queries, scored with one matrix-matrix product.
+    Same signature as backend.data.vectorizer.most_similar_batch; options are keyword-only.
+    """
+    if not queries:
+        return []
+    query_vecs = embed_batch(queries, normalize=normalize)
+    return corpus_for(corpus, embed_batch, normalize).top_k(query_vecs, top_k, metric, min_score)
 
 # === Utility ===
 
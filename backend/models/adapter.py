@@ -1,15 +1,28 @@
+import os
+import re
+import math
+import time
 import logging
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
 from backend.core.config import settings
+from backend.core.constants import QUANT_CALIBRATION_TEXTS
+from backend.models.fingerprint import model_fingerprint
 
 logger = logging.getLogger("locentra.adapter")
 
+# Weight elements dequantized at a time by WeightOnlyLinear (4 MB of float32)
+_DEQUANT_BLOCK = 1 << 20
+
 # Apply adapter modifications to the base model
-def apply_adapter(model):
+def apply_adapter(model, tokenizer=None):
     """
     Inject adapter layers (e.g. LoRA, quantization) based on system config.
+    The tokenizer is only needed for the optional quantization quality report.
     """
     model_type = type(model).__name__
-    strategy = getattr(settings, "ADAPTER_STRATEGY", "none").lower()
+    strategy = settings.ADAPTER_STRATEGY.lower()
 
     logger.info(f"[LocentraOS] Adapter strategy: {strategy}")
     logger.info(f"[LocentraOS] Model type: {model_type}")
@@ -22,39 +35,301 @@ def apply_adapter(model):
         return apply_lora(model)
 
     elif strategy == "quant":
-        return apply_quant(model)
+        return apply_quant(model, tokenizer)
 
     else:
         logger.warning(f"[LocentraOS] Unknown adapter strategy: {strategy}. Returning raw model.")
         return model
 
-# === Placeholder for LoRA (Low-Rank Adaptation) ===
+# === LoRA (Low-Rank Adaptation) ===
 def apply_lora(model):
     """
-    Apply LoRA-style adapter layers (requires PEFT integration).
+    Merge a single LoRA adapter (LORA_ADAPTER, a PEFT directory or hub id) into the
+    base weights, for deployments that serve exactly one fine-tune. Multi-adapter
+    serving is handled per request by LoRAManager instead.
     """
+    if not settings.LORA_ADAPTER:
+        logger.info("[LocentraOS] LORA_ADAPTER not set. Returning raw model.")
+        return model
     try:
-        # Example placeholder
-        # from peft import get_peft_model, LoraConfig
-        # lora_config = LoraConfig(...)
-        # model = get_peft_model(model, lora_config)
-        logger.info("[LocentraOS] LoRA adapter logic placeholder.")
+        from peft import PeftModel
+
+        model = PeftModel.from_pretrained(model, settings.LORA_ADAPTER)
+        model = model.merge_and_unload()
+        logger.info(f"[LocentraOS] LoRA adapter merged: {settings.LORA_ADAPTER}")
         return model
     except Exception as e:
         logger.warning(f"[LocentraOS] Failed to apply LoRA: {e}")
         return model
 
-# === Placeholder for Quantization ===
-def apply_quant(model):
+# === CPU Quantization ===
+
+QUANT_MODES = ("dynamic_int8", "weight_int8", "weight_int4")
+
+
+class WeightOnlyLinear(nn.Module):
+    """
+    Linear layer with int8 or packed int4 weights and float scales.
+
+    int8 uses one symmetric scale per output channel; int4 uses one scale per
+    `group_size` input columns and packs two values per byte. Activations stay in
+    float. int8 layers multiply the int8 weights directly with torch's weight-only
+    int8 kernel where it exists. int4 layers (and int8 without that kernel) are
+    dequantized on every call, a block of output rows at a time, and the float rows
+    are dropped after their matmul: the resident model stays at the quantized size,
+    at the cost of redoing the dequantization per forward pass.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bits: int = 8, group_size: int = 128, bias: bool = True):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.bits = bits
+        self.group_size = group_size if bits == 4 else in_features
+        groups = math.ceil(in_features / self.group_size)
+        packed_cols = math.ceil(in_features / 2) if bits == 4 else in_features
+
+        self.register_buffer("qweight", torch.zeros(out_features, packed_cols, dtype=torch.uint8 if bits == 4 else torch.int8))
+        self.register_buffer("scales", torch.ones(out_features, groups, dtype=torch.float32))
+        self.register_buffer("bias", torch.zeros(out_features) if bias else None)
+        self._int8_kernel = bits == 8 and hasattr(torch.ops.aten, "_weight_int8pack_mm")
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, bits: int = 8, group_size: int = 128) -> "WeightOnlyLinear":
+        module = cls(linear.in_features, linear.out_features, bits, group_size, linear.bias is not None)
+        weight = linear.weight.detach().float()
+        qmax = 2 ** (bits - 1) - 1
+
+        # Pad columns to a whole number of groups, compute symmetric per-group scales
+        pad = module.scales.shape[1] * module.group_size - module.in_features
+        grouped = F.pad(weight, (0, pad)).view(module.out_features, -1, module.group_size)
+        scales = grouped.abs().amax(dim=-1).clamp(min=1e-8) / qmax
+        q = torch.round(grouped / scales.unsqueeze(-1)).clamp(-qmax - 1, qmax)
+        q = q.view(module.out_features, -1)[:, :module.in_features].to(torch.int8)
+
+        if bits == 4:
+            q = (q + 8).to(torch.uint8)                      # shift to 0..15
+            if q.shape[1] % 2:
+                q = F.pad(q, (0, 1))
+            q = q[:, 0::2] | (q[:, 1::2] << 4)
+
+        module.qweight.copy_(q)
+        module.scales.copy_(scales)
+        if linear.bias is not None:
+            module.bias.copy_(linear.bias.detach().float())
+        return module
+
+    def dequantize(self, start: int = 0, end: int = None) -> torch.Tensor:
+        """Float weight rows [start, end) (all rows by default)."""
+        q = self.qweight[start:end]
+        scales = self.scales[start:end]
+        rows = q.shape[0]
+        if self.bits == 4:
+            low = (q & 0x0F).to(torch.int8) - 8
+            high = (q >> 4).to(torch.int8) - 8
+            q = torch.stack([low, high], dim=-1).view(rows, -1)
+        q = q[:, :self.in_features].float()
+
+        pad = scales.shape[1] * self.group_size - self.in_features
+        w = F.pad(q, (0, pad)).view(rows, -1, self.group_size) * scales.unsqueeze(-1)
+        return w.view(rows, -1)[:, :self.in_features]
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        bias = self.bias.to(x.dtype) if self.bias is not None else None
+        if self._int8_kernel and x.device.type == "cpu":
+            try:
+                flat = x.reshape(-1, self.in_features).contiguous()
+                out = torch.ops.aten._weight_int8pack_mm(flat, self.qweight, self.scales.view(-1).to(x.dtype))
+                out = out.view(*x.shape[:-1], self.out_features)
+                return out + bias if bias is not None else out
+            except RuntimeError:
+                # Older kernels only take some activation dtypes; dequantize from here on
+                self._int8_kernel = False
+        step = max(1, _DEQUANT_BLOCK // self.in_features)
+        out = torch.cat([
+            F.linear(x, self.dequantize(start, start + step).to(x.dtype))
+            for start in range(0, self.out_features, step)
+        ], dim=-1)
+        return out + bias if bias is not None else out
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, bits={self.bits}, group_size={self.group_size}"
+
+
+def _quantizable_linears(model) -> list:
+    """All nn.Linear modules except the output head, whose weight is usually tied to the embeddings."""
+    return [
+        (name, module) for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and not name.endswith("lm_head")
+    ]
+
+
+def _replace_module(model, name: str, new_module: nn.Module):
+    parent_name, _, child = name.rpartition(".")
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child, new_module)
+
+
+def _quantize_linears(model, mode: str, group_size: int, empty: bool = False):
+    """
+    Swap Linear layers for quantized ones. With empty=True only the module structure
+    is built (no weight math), ready for a cached state dict to be loaded into it.
+    """
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantLinear
+
+    for name, linear in _quantizable_linears(model):
+        has_bias = linear.bias is not None
+        if mode == "dynamic_int8":
+            if empty:
+                new = DynamicQuantLinear(linear.in_features, linear.out_features, bias_=has_bias, dtype=torch.qint8)
+            else:
+                linear.qconfig = torch.ao.quantization.default_dynamic_qconfig
+                new = DynamicQuantLinear.from_float(linear)
+        else:
+            bits = 8 if mode == "weight_int8" else 4
+            if empty:
+                new = WeightOnlyLinear(linear.in_features, linear.out_features, bits, group_size, has_bias)
+            else:
+                new = WeightOnlyLinear.from_linear(linear, bits, group_size)
+        _replace_module(model, name, new)
+    return model
+
+
+def model_nbytes(model) -> int:
+    """Bytes held by parameters, buffers and packed quantized weights (tied tensors counted once)."""
+    seen = set()
+    total = 0
+
+    def visit(value):
+        nonlocal total
+        if isinstance(value, torch.Tensor):
+            key = (value.data_ptr(), value.numel())
+            if key not in seen:
+                seen.add(key)
+                total += value.numel() * value.element_size()
+        elif isinstance(value, (tuple, list)):
+            for item in value:
+                visit(item)
+
+    for value in model.state_dict().values():
+        visit(value)
+    return total
+
+
+def measure_perplexity(model, tokenizer, texts: list = None) -> float:
+    """Perplexity over a small calibration set (mean token-level NLL)."""
+    texts = texts or QUANT_CALIBRATION_TEXTS
+    total_loss, total_tokens = 0.0, 0
+    with torch.no_grad():
+        for text in texts:
+            ids = tokenizer(text, return_tensors="pt")["input_ids"].to(model.device)
+            if ids.shape[1] < 2:
+                continue
+            loss = model(input_ids=ids, labels=ids).loss
+            total_loss += loss.item() * (ids.shape[1] - 1)
+            total_tokens += ids.shape[1] - 1
+    return math.exp(total_loss / total_tokens) if total_tokens else float("nan")
+
+
+def _quant_cache_path(model, mode: str, group_size: int, fingerprint: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", getattr(model, "name_or_path", "model"))
+    suffix = f"g{group_size}" if mode == "weight_int4" else "pc"
+    return os.path.join(settings.QUANT_CACHE_DIR, f"{name}.{fingerprint}.{mode}.{suffix}.pt")
+
+
+def _load_quant_cache(path: str, names: list, mode: str, fingerprint: str):
+    """Return a cached quantized state dict if it was built from these weights and covers every quantizable layer, else None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        cached = torch.load(path, map_location="cpu", weights_only=False)
+    except Exception as e:
+        logger.warning(f"[LocentraOS] Quantization cache unreadable ({e}); requantizing.")
+        return None
+
+    if not isinstance(cached, dict) or cached.get("fingerprint") != fingerprint:
+        logger.warning("[LocentraOS] Quantization cache was built from other weights; requantizing.")
+        return None
+    state = cached["state"]
+
+    marker = "_packed_params._packed_params" if mode == "dynamic_int8" else "qweight"
+    if not all(f"{name}.{marker}" in state for name in names):
+        logger.warning("[LocentraOS] Quantization cache does not match model layout; requantizing.")
+        return None
+    return state
+
+
+def apply_quant(model, tokenizer=None):
     """
-    Apply 8-bit or 4-bit quantization (e.g. bitsandbytes or Transformers native).
+    CPU quantization of Linear layers, selected by QUANT_MODE:
+
+    - dynamic_int8: torch dynamic quantization (int8 weights, int8 matmul with dynamic activation scales)
+    - weight_int8:  weight-only int8, per-output-channel scales
+    - weight_int4:  weight-only int4, group-wise scales (QUANT_GROUP_SIZE), two weights per byte
+
+    Quantized weights are cached under QUANT_CACHE_DIR, keyed and checked on a
+    fingerprint of the source weights, so later boots only load them.
+    The before/after size (and, with QUANT_EVAL, the perplexity delta) is logged and
+    attached to the model as `quant_report`.
     """
+    mode = settings.QUANT_MODE.lower()
+    group_size = settings.QUANT_GROUP_SIZE
+
+    if mode not in QUANT_MODES:
+        logger.warning(f"[LocentraOS] Unknown quantization mode: {mode}. Returning raw model.")
+        return model
+    if torch.cuda.is_available():
+        logger.warning("[LocentraOS] CPU quantization skipped: CUDA device available.")
+        return model
+
     try:
-        # Example placeholder
-        # from transformers import BitsAndBytesConfig
-        # quant_config = BitsAndBytesConfig(load_in_8bit=True)
-        # model = AutoModelForCausalLM.from_pretrained(..., quantization_config=quant_config)
-        logger.info("[LocentraOS] Quantization logic placeholder.")
+        start = time.time()
+        bytes_before = model_nbytes(model)
+        ppl_before = measure_perplexity(model, tokenizer) if settings.QUANT_EVAL and tokenizer else None
+
+        fingerprint = model_fingerprint(getattr(model, "name_or_path", "model"), model.config)
+        cache_path = _quant_cache_path(model, mode, group_size, fingerprint)
+        names = [name for name, _ in _quantizable_linears(model)]
+        cached = _load_quant_cache(cache_path, names, mode, fingerprint)
+
+        if cached is not None:
+            _quantize_linears(model, mode, group_size, empty=True)
+            model.load_state_dict(cached, strict=False)
+            logger.info(f"[LocentraOS] Loaded quantized weights from cache: {cache_path}")
+        else:
+            _quantize_linears(model, mode, group_size)
+            prefixes = tuple(f"{name}." for name in names)
+            state = {k: v for k, v in model.state_dict().items() if k.startswith(prefixes)}
+            os.makedirs(settings.QUANT_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{cache_path}.tmp"
+            torch.save({"fingerprint": fingerprint, "state": state}, tmp_path)
+            os.replace(tmp_path, cache_path)
+            logger.info(f"[LocentraOS] Quantized weights cached to: {cache_path}")
+
+        bytes_after = model_nbytes(model)
+        report = {
+            "mode": mode,
+            "group_size": group_size if mode == "weight_int4" else None,
+            "from_cache": cached is not None,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "compression": round(bytes_before / bytes_after, 2) if bytes_after else None,
+            "seconds": round(time.time() - start, 2),
+        }
+        if ppl_before is not None:
+            ppl_after = measure_perplexity(model, tokenizer)
+            report.update({
+                "perplexity_before": round(ppl_before, 3),
+                "perplexity_after": round(ppl_after, 3),
+                "perplexity_delta": round(ppl_after - ppl_before, 3),
+            })
+
+        logger.info(
+            f"[LocentraOS] Quantization ({mode}): {bytes_before / 1024 ** 2:.0f} MB -> "
+            f"{bytes_after / 1024 ** 2:.0f} MB"
+            + (f", perplexity delta {report['perplexity_delta']:+.3f}" if ppl_before is not None else "")
+        )
+        model.quant_report = report
         return model
     except Exception as e:
         logger.warning(f"[LocentraOS] Failed to apply quantization: {e}")
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.data.embedding_store import store_for
+
+logger = logging.getLogger("locentra.embedding")
+
+
+class EmbeddingService:
+    """
+    The process's single sentence-embedding model (EMBEDDING_MODEL).
+
+    vectorizer.py and schema.py both delegate here, so a process holds at most one
+    copy of the model, and only once something actually embeds: the model is loaded
+    on first use, or up front with preload() (the engine does this at boot when
+    EMBEDDING_PRELOAD or the semantic cache is enabled).
+
+    - EMBEDDING_DEVICE: "auto" (CUDA when available), "cpu", "cuda", "cuda:1", ...
+    - EMBEDDING_THREADS: torch intra-op threads; 0 leaves torch's default. torch
+      applies this process-wide, so it also affects an LLM served in the same process.
+    - EMBEDDING_BATCH_SIZE: texts per forward pass inside encode().
+
+    Lookups go through the persistent embedding store first; only misses are encoded.
+
+    In a sidecar client (an HTTP worker with SIDECAR_SOCKET set) `remote` is the
+    SidecarClient and embed() is answered by the sidecar's copy of the model, so
+    workers never load it.
+    """
+
+    def __init__(self, model_name: str = None, device: str = None, threads: int = None, batch_size: int = None):
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        self.device = device or settings.EMBEDDING_DEVICE
+        self.threads = settings.EMBEDDING_THREADS if threads is None else threads
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self._model = None
+        self.remote = None              # SidecarClient when the model lives in the inference sidecar
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.encoded = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Load the model once; concurrent first callers wait for the same load."""
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+
+                start = time.time()
+                if self.threads:
+                    import torch
+                    torch.set_num_threads(self.threads)
+                device = None if self.device == "auto" else self.device
+                self._model = SentenceTransformer(self.model_name, device=device)
+                self.load_seconds = round(time.time() - start, 2)
+                logger.info(
+                    f"[LocentraOS] Embedding model {self.model_name} loaded on {self._model.device} "
+                    f"in {self.load_seconds}s"
+                )
+        return self._model
+
+    def preload(self) -> dict:
+        self.load()
+        return self.stats()
+
+    @property
+    def dimension(self) -> int:
+        return self.load().get_sentence_embedding_dimension()
+
+    # === Embedding ===
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Raw (unnormalized) float32 embeddings straight from the model."""
+        vecs = self.load().encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+        self.encoded += len(texts)
+        return np.asarray(vecs, dtype=np.float32)
+
+    def cached(self, text: str) -> Optional[np.ndarray]:
+        """Raw embedding of `text` from the store, or None (never loads the model)."""
+        if self.remote is not None:
+            return None     # The store belongs to the sidecar
+        store = store_for(self.model_name)
+        return store.get_many([text])[0] if store is not None else None
+
+    def embed(self, texts: List[str], normalize: bool = True) -> np.ndarray:
+        """[n, dim] embeddings, served from the embedding store where possible."""
+        if self.remote is not None:
+            return np.asarray(self.remote.call("embed", texts=list(texts), normalize=normalize), dtype=np.float32)
+        store = store_for(self.model_name, self.dimension)
+        vecs = store.get_or_compute(texts, self.encode) if store is not None else self.encode(texts)
+        if normalize:
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-10
+            vecs = vecs / norms
+        return vecs
+
+    def stats(self) -> dict:
+        store = store_for(self.model_name, self.dimension) if self.loaded else None
+        return {
+            "model": self.model_name,
+            "loaded": self.loaded,
+            "device": str(self._model.device) if self.loaded else self.device,
+            "threads": self.threads,
+            "batch_size": self.batch_size,
+            "load_seconds": self.load_seconds,
+            "encoded": self.encoded,
+            "remote": self.remote.socket_path if self.remote is not None else None,
+            "store": store.stats() if store is not None else None,
+        }
+
+
+def _normalized(vec: np.ndarray, normalize: bool) -> np.ndarray:
+    return vec / (np.linalg.norm(vec) + 1e-10) if normalize else vec
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching front-end for single-text embeddings.
+
+    Concurrent embed_text() callers would otherwise each run the model with a batch
+    of one. Here they enqueue their text and block (embed) or await (aembed); a
+    worker thread takes the first queued text, gathers more for up to
+    EMBEDDING_BATCH_WAIT_MS or until EMBEDDING_BATCH_SIZE, encodes the distinct
+    texts in one call and hands each caller its own copy. Texts already in the
+    embedding store are answered directly without queueing.
+    """
+
+    def __init__(self, service: EmbeddingService, max_batch_size: int = None, max_wait_ms: int = None, window: int = 1000):
+        self.service = service
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_wait = (settings.EMBEDDING_BATCH_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "store_hits": 0, "batches": 0, "batched_requests": 0, "encoded_texts": 0, "errors": 0}
+        self._batch_sizes = deque(maxlen=window)
+        self._waits = deque(maxlen=window)
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # === Front-ends ===
+
+    def submit(self, text: str) -> Future:
+        """Future of the raw (unnormalized) embedding of `text`."""
+        with self._lock:
+            self._stats["requests"] += 1
+        future: Future = Future()
+        cached = self.service.cached(text)
+        if cached is not None:
+            with self._lock:
+                self._stats["store_hits"] += 1
+            future.set_result(cached)
+            return future
+        if not self._running:
+            self.start()
+        self._queue.put((text, future, time.time()))
+        return future
+
+    def embed(self, text: str, normalize: bool = True) -> np.ndarray:
+        return _normalized(self.submit(text).result(), normalize)
+
+    async def aembed(self, text: str, normalize: bool = True) -> np.ndarray:
+        # submit() may load the model or read the store from disk; keep both off the event loop
+        future = await asyncio.get_running_loop().run_in_executor(None, self.submit, text)
+        return _normalized(await asyncio.wrap_future(future), normalize)
+
+    # === Worker ===
+
+    def _collect(self) -> list:
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: list):
+        started = time.time()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = dict(zip(texts, self.service.embed(texts, normalize=False)))
+        except Exception as e:
+            logger.error(f"[LocentraOS] Embedding batch of {len(texts)} failed: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for text, future, _ in batch:
+            future.set_result(vectors[text].copy())
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["batched_requests"] += len(batch)
+            self._stats["encoded_texts"] += len(texts)
+            self._batch_sizes.append(len(batch))
+            self._waits.extend(started - enqueued for _, _, enqueued in batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            sizes, waits = list(self._batch_sizes), list(self._waits)
+        stats.update(
+            running=self._running,
+            queue_depth=self._queue.qsize(),
+            max_batch_size=self.max_batch_size,
+            max_wait_ms=round(self.max_wait * 1000, 2),
+            avg_batch_size=round(stats["batched_requests"] / stats["batches"], 2) if stats["batches"] else 0.0,
+            p50_batch_size=_percentile(sizes, 0.50),
+            max_recent_batch_size=max(sizes, default=0),
+            avg_queue_wait_ms=round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+            p50_queue_wait_ms=round(_percentile(waits, 0.50) * 1000, 3),
+            p99_queue_wait_ms=round(_percentile(waits, 0.99) * 1000, 3),
+        )
+        return stats
+
+
+# Global singletons
+embedding_service = EmbeddingService()
+embedding_batcher = EmbeddingBatcher(embedding_service)
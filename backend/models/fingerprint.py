@@ -0,0 +1,29 @@
+import hashlib
+import os
+
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth")
+
+
+def model_fingerprint(model_name: str, config=None) -> str:
+    """
+    Short hash of the weights `model_name` resolves to, for keying derived artifacts
+    (ONNX exports, quantized weights) so they are rebuilt when the model changes.
+
+    Covers the model config, the hub revision (commit hash) and, for a local
+    directory such as a fine-tuned output, the name, size and mtime of every weight file.
+    Pass the loaded model's `config` to skip reading it again.
+    """
+    if config is None:
+        from transformers import AutoConfig
+
+        config = AutoConfig.from_pretrained(model_name)
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(model_name.encode("utf-8"))
+    digest.update(config.to_json_string().encode("utf-8"))
+    digest.update(str(getattr(config, "_commit_hash", None)).encode("utf-8"))
+    if os.path.isdir(model_name):
+        for name in sorted(os.listdir(model_name)):
+            if name.endswith(WEIGHT_SUFFIXES):
+                stat = os.stat(os.path.join(model_name, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()
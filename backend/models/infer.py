@@ -1,7 +1,29 @@
 import torch
+import threading
 import time
+from transformers import StoppingCriteriaList, TextIteratorStreamer
 from backend.core.engine import engine
 from backend.data.cleaner import full_clean  # NEU
+from backend.services.cache_service import make_cache_key
+from backend.models.speculative import ForwardCounter, speculation_report, speculative_kwargs
+from backend.models.stopping import BudgetCriteria, CancelCriteria, record_cancellation, truncate_at_stop
+
+
+class TimedTextStreamer(TextIteratorStreamer):
+    """
+    TextIteratorStreamer that also records when each generated token arrived,
+    so streaming callers can report time-to-first-token and inter-token latency.
+    """
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.token_times = []
+
+    def put(self, value):
+        if not (self.skip_prompt and self.next_tokens_are_prompt):
+            self.token_times.extend([time.time()] * value.numel())
+        super().put(value)
+
 
 def generate_response(
     prompt: str,
@@ -13,6 +35,7 @@ def generate_response(
     num_beams: int = 1,
     return_metadata: bool = False,
     return_cleaned: bool = False,
+    adapter: str = None,
 ):
     """
     Generate a response from the loaded LLM with optional generation config.
@@ -27,6 +50,7 @@ def generate_response(
         num_beams (int): Beam search (set to 1 for greedy)
         return_metadata (bool): If True, return additional stats
         return_cleaned (bool): If True, apply post-cleaning to output
+        adapter (str): Optional LoRA adapter name (requires LORA_ENABLED)
 
     Returns:
         str or dict: Response or response + metadata
@@ -40,13 +64,36 @@ def generate_response(
 
     device = model.device if torch.cuda.is_available() else torch.device("cpu")
 
+    # Deterministic calls can be answered from the shared response cache
+    cache = engine.response_cache
+    cache_key = None
+    if cache is not None and num_beams == 1 and cache.cacheable(temperature):
+        cache_key = make_cache_key(cleaned_prompt, {
+            "source": "generate_response",
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_k": top_k,
+            "top_p": top_p,
+            "repetition_penalty": repetition_penalty,
+            "adapter": adapter,
+        }, engine.model_meta)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            final_output = full_clean(cached["response"]) if return_cleaned else cached["response"]
+            if return_metadata:
+                return {**cached, "response": final_output, "latency": 0.0, "device": str(device)}
+            return final_output
+
     inputs = tokenizer(cleaned_prompt, return_tensors="pt").to(device)
 
     if inputs["input_ids"].shape[1] > 1024:
         print(f"[LocentraOS] Warning: prompt length ({inputs['input_ids'].shape[1]}) may exceed context window.")
 
+    # Speculative decoding (draft model or prompt lookup) only applies to single-sequence decoding
+    spec_kwargs = speculative_kwargs(model) if num_beams == 1 else {}
+
     start = time.time()
-    with torch.no_grad():
+    with torch.no_grad(), engine.adapter_context(adapter), ForwardCounter(model) as counter:
         outputs = model.generate(
             **inputs,
             max_new_tokens=max_tokens,
@@ -55,13 +102,22 @@ def generate_response(
             top_p=top_p,
             repetition_penalty=repetition_penalty,
             num_beams=num_beams,
-            do_sample=True if num_beams == 1 else False
+            do_sample=num_beams == 1 and temperature > 0,
+            **spec_kwargs
         )
     end = time.time()
+    new_tokens = outputs.shape[-1] - inputs["input_ids"].shape[1]
 
     raw_output = tokenizer.decode(outputs[0], skip_special_tokens=True)
     final_output = full_clean(raw_output) if return_cleaned else raw_output
 
+    if cache_key is not None:
+        cache.set(cache_key, {
+            "response": raw_output,
+            "tokens_generated": len(outputs[0]),
+            "prompt_length": inputs["input_ids"].shape[1],
+        })
+
     if return_metadata:
         return {
             "response": final_output,
@@ -69,6 +125,220 @@ def generate_response(
             "latency": round(end - start, 3),
             "prompt_length": inputs["input_ids"].shape[1],
             "device": str(device),
+            "cache": "miss" if cache_key is not None else "bypass",
+            "speculative": speculation_report(counter if spec_kwargs else None, new_tokens, end - start),
         }
 
     return final_output
+
+
+def stream_response(
+    prompt: str,
+    max_tokens: int = 100,
+    temperature: float = 0.7,
+    top_k: int = 50,
+    top_p: float = 0.95,
+    repetition_penalty: float = 1.1,
+    adapter: str = None,
+    deadline_ms: int = None,
+    stop: list = None,
+):
+    """
+    Stream a response from the loaded LLM as it is decoded.
+
+    Yields ("token", text) tuples for each decoded chunk, followed by a single
+    ("meta", dict) tuple with token counts, time-to-first-token, per-token timing
+    and the finish reason (eos, length, stop or deadline).
+    Closing the generator early (client disconnected) stops the decode at the next step.
+    """
+    llm = engine.get_model()
+    model = llm["model"]
+    tokenizer = llm["tokenizer"]
+
+    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    streamer = TimedTextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    cancelled = threading.Event()
+    start = time.time()
+    budget = BudgetCriteria(
+        inputs["input_ids"].shape[1],
+        max_tokens=[max_tokens],
+        deadlines=[start + deadline_ms / 1000.0 if deadline_ms else None],
+        stops=[stop],
+        tokenizer=tokenizer
+    )
+
+    gen_kwargs = dict(
+        **inputs,
+        streamer=streamer,
+        stopping_criteria=StoppingCriteriaList([CancelCriteria([cancelled]), budget]),
+        max_new_tokens=max_tokens,
+        repetition_penalty=repetition_penalty,
+        pad_token_id=tokenizer.pad_token_id,
+        do_sample=temperature > 0,
+    )
+    if temperature > 0:
+        gen_kwargs.update(temperature=temperature, top_k=top_k, top_p=top_p)
+
+    def _run():
+        try:
+            with torch.no_grad(), engine.adapter_context(adapter):
+                model.generate(**gen_kwargs)
+        except Exception:
+            streamer.end()
+            raise
+
+    # Decode on the inference executor; this generator only drains the streamer
+    future = engine.executor.submit(_run)
+
+    finished = False
+    emitted = ""
+    stopped = False
+    try:
+        for text in streamer:
+            if not text or stopped:
+                continue
+            # Hold back everything from a stop string on; the decode ends at the next step
+            trimmed, stopped = truncate_at_stop(emitted + text, stop)
+            if len(trimmed) > len(emitted):
+                yield "token", trimmed[len(emitted):]
+                emitted = trimmed
+        finished = True
+    finally:
+        if not finished:
+            cancelled.set()
+            record_cancellation("stream", len(streamer.token_times))
+
+    future.result()
+
+    end = time.time()
+    times = streamer.token_times
+    gaps = [round((b - a) * 1000, 2) for a, b in zip(times, times[1:])]
+
+    yield "meta", {
+        "input_tokens": inputs["input_ids"].shape[1],
+        "output_tokens": len(times),
+        "time_to_first_token": round(times[0] - start, 3) if times else None,
+        "per_token_ms": gaps,
+        "avg_token_ms": round(sum(gaps) / len(gaps), 2) if gaps else None,
+        "tokens_per_sec": round(len(times) / (end - start), 2) if end > start else None,
+        "latency": round(end - start, 3),
+        "finish_reason": "stop" if stopped else budget.reasons[0] or "eos",
+        "deadline_ms": deadline_ms,
+    }
+
+
+# Transcript format for chat sessions (plain-text turns for base causal LMs)
+CHAT_USER_TURN = "User: {message}\nAssistant:"
+CHAT_TURN_SEPARATOR = "\n"
+
+
+def chat_response(
+    session_id: str,
+    message: str,
+    max_tokens: int = 100,
+    temperature: float = 0.7,
+    system_prompt: str = None,
+    top_k: int = 50,
+    top_p: float = 0.95,
+    repetition_penalty: float = 1.1,
+):
+    """
+    Stream one turn of a chat session, like stream_response.
+
+    The transcript and its past key/values live in engine.sessions, so only the new
+    message is prefilled when the session's KV is still cached; otherwise (evicted,
+    idle, or KV caching off) the whole transcript is prefilled again. The system
+    prompt is only used on a session's first turn. Sessions always run on the base
+    model, whatever LoRA adapter another request left active, since their cached KV
+    was computed with the base weights. The meta event reports how many
+    tokens were served from the cache and how many had to be prefilled.
+    """
+    llm = engine.get_model()
+    model = llm["model"]
+    tokenizer = llm["tokenizer"]
+    sessions = engine.sessions
+
+    state = sessions.checkout(session_id)
+    history, past = state["ids"], state["past"]
+    if history:
+        turn_ids = tokenizer(
+            CHAT_TURN_SEPARATOR + CHAT_USER_TURN.format(message=message), add_special_tokens=False
+        )["input_ids"]
+    else:
+        opening = CHAT_USER_TURN.format(message=message)
+        turn_ids = tokenizer(f"{system_prompt}\n{opening}" if system_prompt else opening)["input_ids"]
+    ids = history + turn_ids
+
+    # Keep the transcript inside the context window; dropping old turns invalidates the KV
+    window = getattr(model.config, "max_position_embeddings", None) or 2048
+    if len(ids) + max_tokens > window:
+        ids = ids[-(window - max_tokens):]
+        past = None
+    cached_tokens = past.get_seq_length() if past is not None and hasattr(past, "get_seq_length") else 0
+    if past is not None and not cached_tokens:
+        past = None
+
+    input_ids = torch.tensor([ids], device=model.device)
+    streamer = TimedTextStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    cancelled = threading.Event()
+    budget = BudgetCriteria(len(ids), max_tokens=[max_tokens])
+
+    gen_kwargs = dict(
+        input_ids=input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        streamer=streamer,
+        stopping_criteria=StoppingCriteriaList([CancelCriteria([cancelled]), budget]),
+        max_new_tokens=max_tokens,
+        repetition_penalty=repetition_penalty,
+        pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+        do_sample=temperature > 0,
+        use_cache=True,
+        return_dict_in_generate=True,
+    )
+    if past is not None:
+        gen_kwargs["past_key_values"] = past
+    if temperature > 0:
+        gen_kwargs.update(temperature=temperature, top_k=top_k, top_p=top_p)
+
+    def _run():
+        try:
+            with torch.no_grad(), engine.adapter_context(None):
+                return model.generate(**gen_kwargs)
+        except Exception:
+            streamer.end()
+            raise
+
+    start = time.time()
+    future = engine.executor.submit(_run)
+
+    finished = False
+    try:
+        for text in streamer:
+            if text:
+                yield "token", text
+        finished = True
+    finally:
+        if not finished:
+            cancelled.set()
+            record_cancellation("stream", len(streamer.token_times))
+            # The turn was abandoned: keep the transcript as it was, without the half-extended KV
+            sessions.checkin(session_id, history)
+
+    outputs = future.result()
+    end = time.time()
+    sequence = outputs.sequences[0].tolist()
+    sessions.checkin(session_id, sequence, outputs.past_key_values)
+
+    times = streamer.token_times
+    yield "meta", {
+        "session_id": session_id,
+        "turn_tokens": len(turn_ids),
+        "context_tokens": len(ids),
+        "cached_tokens": cached_tokens,
+        "prefilled_tokens": len(ids) - cached_tokens,
+        "output_tokens": len(sequence) - len(ids),
+        "time_to_first_token": round(times[0] - start, 3) if times else None,
+        "tokens_per_sec": round(len(times) / (end - start), 2) if end > start else None,
+        "latency": round(end - start, 3),
+        "finish_reason": budget.reasons[0] or "eos",
+    }
@@ -0,0 +1,257 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+
+from backend.core.config import settings
+
+logger = logging.getLogger("locentra.kv_cache")
+
+
+# === Past key/value helpers ===
+
+def _iter_tensors(past):
+    """Yield every tensor held by a past_key_values object (Cache class or legacy tuples)."""
+    if past is None:
+        return
+    if isinstance(past, torch.Tensor):
+        yield past
+    elif isinstance(past, (list, tuple)):
+        for item in past:
+            yield from _iter_tensors(item)
+    elif hasattr(past, "key_cache") and hasattr(past, "value_cache"):
+        yield from _iter_tensors(past.key_cache)
+        yield from _iter_tensors(past.value_cache)
+    elif hasattr(past, "layers"):
+        for layer in past.layers:
+            yield from _iter_tensors([getattr(layer, "keys", None), getattr(layer, "values", None)])
+
+
+def cache_nbytes(past) -> int:
+    """Memory held by a past_key_values object, in bytes."""
+    return sum(t.numel() * t.element_size() for t in _iter_tensors(past))
+
+
+def expand_cache(past, batch_size: int = 1):
+    """
+    Return an independent copy of `past`, repeated along the batch dimension.
+    generate() extends the cache in place, so stored entries must never be handed out directly.
+    """
+    past = copy.deepcopy(past)
+    if batch_size <= 1:
+        return past
+    if hasattr(past, "batch_repeat_interleave"):
+        past.batch_repeat_interleave(batch_size)
+        return past
+    return tuple(tuple(t.repeat_interleave(batch_size, dim=0) for t in layer) for layer in past)
+
+
+# === Shared-prefix cache ===
+
+class PrefixKVCache:
+    """
+    LRU cache of prefilled past key/values for shared prompt prefixes (system prompts).
+
+    Entries are keyed by the exact prefix token ids (plus a namespace such as the
+    active LoRA adapter, since adapters change the KV) and evicted least-recently-used
+    first once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, model, max_bytes: int = None, min_tokens: int = None):
+        self.model = model
+        self.max_bytes = max_bytes if max_bytes is not None else settings.PREFIX_CACHE_MAX_MB * 1024 ** 2
+        self.min_tokens = settings.PREFIX_CACHE_MIN_TOKENS if min_tokens is None else min_tokens
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cacheable(self, prefix_ids: torch.Tensor) -> bool:
+        return prefix_ids.shape[-1] >= self.min_tokens
+
+    def get(self, prefix_ids: torch.Tensor, batch_size: int = 1, namespace: Optional[str] = None):
+        """
+        Return past key/values for `prefix_ids` (shape [1, n]) expanded to `batch_size`,
+        prefilling and storing them on a miss. Must be called with the matching adapter active.
+        """
+        key = (namespace, tuple(prefix_ids[0].tolist()))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry["hits"] += 1
+                self.hits += 1
+                return expand_cache(entry["past"], batch_size)
+            self.misses += 1
+
+        start = time.time()
+        with torch.no_grad():
+            past = self.model(input_ids=prefix_ids.to(self.model.device), use_cache=True).past_key_values
+        size = cache_nbytes(past)
+        logger.info(
+            f"[LocentraOS] Prefilled prefix of {prefix_ids.shape[-1]} tokens "
+            f"({size / 1024 ** 2:.1f} MB) in {time.time() - start:.3f}s"
+        )
+
+        if size <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = {"past": past, "bytes": size, "hits": 0}
+                    self._bytes += size
+                    self._evict()
+
+        return expand_cache(past, batch_size)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry["bytes"]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# === Per-session conversation cache ===
+
+# A session's transcript ids are forgotten after this long without a turn (its KV goes much sooner)
+SESSION_HISTORY_TTL = 24 * 3600
+
+
+class SessionKVStore:
+    """
+    Conversation state of chat sessions: the token ids of the transcript so far and,
+    memory permitting, the past key/values covering them, so a new turn only
+    prefills the new message.
+
+    Past key/values are dropped least-recently-used once their total exceeds
+    `max_bytes`, and for sessions idle longer than `idle_timeout` seconds. The
+    transcript ids are tiny and kept until the session ends, so a turn whose KV
+    was dropped transparently re-prefills the whole conversation instead.
+
+    A session's state is checked out for the duration of a turn (generate() extends
+    the cache in place) and checked back in afterwards. With `cache_kv=False` only
+    transcripts are kept and every turn re-prefills.
+    """
+
+    def __init__(self, max_bytes: int = None, idle_timeout: float = None, cache_kv: bool = True):
+        self.cache_kv = cache_kv
+        self.max_bytes = max_bytes if max_bytes is not None else settings.SESSION_CACHE_MAX_MB * 1024 ** 2
+        self.idle_timeout = settings.SESSION_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.reprefills = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def checkout(self, session_id: str) -> dict:
+        """
+        Take a session's state for one turn: {"ids": transcript ids, "past": KV or None}.
+        The KV, if any, covers a prefix of `ids`; it is removed from the store until checkin().
+        """
+        with self._lock:
+            self._expire()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return {"ids": [], "past": None}
+            self._sessions.move_to_end(session_id)
+            past, entry["past"] = entry["past"], None
+            self._bytes -= entry["bytes"]
+            entry["bytes"] = 0
+            if entry["ids"]:
+                if past is not None:
+                    self.hits += 1
+                else:
+                    self.reprefills += 1
+            return {"ids": list(entry["ids"]), "past": past}
+
+    def checkin(self, session_id: str, ids: list, past=None):
+        """Store the transcript after a turn, with the KV covering it (None to keep ids only)."""
+        if not self.cache_kv:
+            past = None
+        size = cache_nbytes(past)
+        with self._lock:
+            if size > self.max_bytes:
+                past, size = None, 0
+                self.evictions += 1
+            self._sessions[session_id] = {"ids": list(ids), "past": past, "bytes": size, "last_used": time.time()}
+            self._sessions.move_to_end(session_id)
+            self._bytes += size
+            self._evict()
+
+    def end(self, session_id: str):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry["bytes"]
+
+    def _evict(self):
+        # Oldest sessions lose their KV first; their transcripts stay for re-prefill
+        for entry in self._sessions.values():
+            if self._bytes <= self.max_bytes:
+                break
+            if entry["past"] is not None:
+                self._bytes -= entry["bytes"]
+                entry["past"], entry["bytes"] = None, 0
+                self.evictions += 1
+
+    def _expire(self):
+        now = time.time()
+        for session_id, entry in list(self._sessions.items()):
+            idle = now - entry["last_used"]
+            if idle > SESSION_HISTORY_TTL:
+                self._bytes -= entry["bytes"]
+                del self._sessions[session_id]
+            elif idle > self.idle_timeout and entry["past"] is not None:
+                self._bytes -= entry["bytes"]
+                entry["past"], entry["bytes"] = None, 0
+                self.expirations += 1
+
+    def clear(self):
+        """Drop every cached KV (e.g. the model changed); transcripts are kept."""
+        with self._lock:
+            for entry in self._sessions.values():
+                entry["past"], entry["bytes"] = None, 0
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire()
+            turns = self.hits + self.reprefills
+            return {
+                "cache_kv": self.cache_kv,
+                "sessions": len(self._sessions),
+                "cached_sessions": sum(e["past"] is not None for e in self._sessions.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "idle_timeout": self.idle_timeout,
+                "hits": self.hits,
+                "reprefills": self.reprefills,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / turns, 3) if turns else 0.0,
+            }
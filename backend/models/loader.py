@@ -1,49 +1,75 @@
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from backend.models.adapter import apply_adapter
+from backend.models.snapshot import load_snapshot, snapshot_usable
+from backend.models.onnx_backend import get_backend, load_onnx_model
 from backend.core.config import settings
 import torch
 import logging
-import sys
 
 logger = logging.getLogger("locentra.model")
 
 MODEL_NAME = settings.MODEL_NAME
 
 def _log_model_info(model):
-    total_params = sum(p.numel() for p in model.parameters())
-    trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    # Single pass over the parameters
+    total_params = trainable = 0
+    for p in model.parameters():
+        n = p.numel()
+        total_params += n
+        if p.requires_grad:
+            trainable += n
     logger.info(f"[LocentraOS] Model architecture: {type(model).__name__}")
     logger.info(f"[LocentraOS] Total parameters: {total_params:,}")
     logger.info(f"[LocentraOS] Trainable parameters: {trainable:,}")
 
-def load_model():
+def load_model(model_name: str = None, backend: str = None):
     """
     Load a causal language model and tokenizer, apply adapters, 
     and place on the best available device.
+
+    model_name overrides settings.MODEL_NAME (e.g. a fine-tuned output directory).
+    Without an override, a matching snapshot in SNAPSHOT_DIR (see backend.cli.snapshot)
+    is memory-mapped instead, skipping hub loading and adapter application.
+    Raises RuntimeError if the model cannot be loaded.
+    With INFERENCE_BACKEND=onnx the model runs on ONNX Runtime instead (see onnx_backend);
+    `backend` overrides that setting (training always needs "torch").
     """
-    logger.info("[LocentraOS] Loading language model...")
+    if (backend or get_backend()) == "onnx":
+        # Adapters, quantization and snapshots are torch-side; ONNX Runtime has its own int8 path
+        try:
+            return load_onnx_model(model_name)
+        except Exception as e:
+            logger.error(f"[LocentraOS] Failed to load ONNX model: {e}")
+            raise RuntimeError(f"Failed to load ONNX model: {e}") from e
+
+    use_snapshot = model_name is None and settings.SNAPSHOT_DIR and snapshot_usable(settings.SNAPSHOT_DIR)
+    model_name = model_name or MODEL_NAME
+    logger.info(f"[LocentraOS] Loading language model: {model_name}")
 
     try:
-        # Load tokenizer
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-        
-        # Handle FP16 or bfloat16 if CUDA is available
-        torch_dtype = None
-        if torch.cuda.is_available():
-            if getattr(settings, "LOAD_FP16", True):
-                torch_dtype = torch.float16
-            elif getattr(settings, "LOAD_BFLOAT16", False):
-                torch_dtype = torch.bfloat16
+        if use_snapshot:
+            model, tokenizer = load_snapshot(settings.SNAPSHOT_DIR)
+        else:
+            # Load tokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+            # Handle FP16 or bfloat16 if CUDA is available
+            torch_dtype = None
+            if torch.cuda.is_available():
+                if getattr(settings, "LOAD_FP16", True):
+                    torch_dtype = torch.float16
+                elif getattr(settings, "LOAD_BFLOAT16", False):
+                    torch_dtype = torch.bfloat16
 
-        # Load model
-        model = AutoModelForCausalLM.from_pretrained(
-            MODEL_NAME,
-            torch_dtype=torch_dtype,
-            device_map="auto" if torch.cuda.is_available() else None,
-        )
+            # Load model
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=torch_dtype,
+                device_map="auto" if torch.cuda.is_available() else None,
+            )
 
-        # Apply adapters (LoRA, quantization, etc.)
-        model = apply_adapter(model)
+            # Apply adapters (LoRA, quantization, etc.)
+            model = apply_adapter(model, tokenizer)
         model.eval()
 
         # Move to device explicitly if not using auto device_map
@@ -66,4 +92,4 @@ def load_model():
 
     except Exception as e:
         logger.error(f"[LocentraOS] Failed to load model: {e}")
-        sys.exit(1)
+        raise RuntimeError(f"Failed to load model {model_name}: {e}") from e
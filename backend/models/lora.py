@@ -0,0 +1,113 @@
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from backend.core.config import settings
+
+logger = logging.getLogger("locentra.lora")
+
+
+class AdapterNotFound(ValueError):
+    """Raised when a request names an adapter that does not exist on disk."""
+
+
+class LoRAManager:
+    """
+    Serves many LoRA adapters on top of one base model.
+
+    Adapters live in LORA_ADAPTER_DIR/<name> (PEFT format) and are attached to the
+    base model on first use via the transformers PEFT integration, so the model
+    object itself never changes. At most `max_loaded` adapters stay attached;
+    the least recently used one is detached to make room.
+
+    Adapter selection is global state on the model, so every generation must run
+    inside `activate(name)`, which holds the manager lock for its duration.
+    """
+
+    def __init__(self, model, adapter_dir: str = None, max_loaded: int = None):
+        self.model = model
+        self.adapter_dir = adapter_dir or settings.LORA_ADAPTER_DIR
+        self.max_loaded = max_loaded or settings.LORA_MAX_LOADED
+        self._loaded: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+        self.requests = {}
+
+    # === Discovery ===
+
+    def adapter_path(self, name: str) -> str:
+        if not name or os.sep in name or name.startswith("."):
+            raise AdapterNotFound(f"Invalid adapter name: {name!r}")
+        return os.path.join(self.adapter_dir, name)
+
+    def exists(self, name: str) -> bool:
+        try:
+            return os.path.isfile(os.path.join(self.adapter_path(name), "adapter_config.json"))
+        except AdapterNotFound:
+            return False
+
+    def available(self) -> list:
+        if not os.path.isdir(self.adapter_dir):
+            return []
+        return sorted(name for name in os.listdir(self.adapter_dir) if self.exists(name))
+
+    # === Loading / eviction ===
+
+    def _ensure_loaded(self, name: str):
+        if name in self._loaded:
+            self._loaded.move_to_end(name)
+            return
+        if not self.exists(name):
+            raise AdapterNotFound(f"Adapter not found: {name}")
+
+        while len(self._loaded) >= self.max_loaded:
+            self._detach(next(iter(self._loaded)))
+            self.evictions += 1
+
+        self.model.load_adapter(self.adapter_path(name), adapter_name=name)
+        self._loaded[name] = time.time()
+        self.loads += 1
+        logger.info(f"[LocentraOS] LoRA adapter attached: {name} ({len(self._loaded)}/{self.max_loaded} loaded)")
+
+    def _detach(self, name: str):
+        self._loaded.pop(name, None)
+        if hasattr(self.model, "delete_adapter"):
+            self.model.delete_adapter(name)
+            logger.info(f"[LocentraOS] LoRA adapter detached: {name}")
+        else:
+            logger.warning(f"[LocentraOS] Installed transformers cannot delete adapters; {name} stays in memory.")
+
+    def unload(self, name: str):
+        """Detach an adapter so its next use reloads it from disk (e.g. after retraining)."""
+        with self._lock:
+            if name in self._loaded:
+                self._detach(name)
+
+    @contextmanager
+    def activate(self, name: Optional[str] = None):
+        """Run the enclosed generation with adapter `name`, or the plain base model if None."""
+        with self._lock:
+            self.requests[name or "base"] = self.requests.get(name or "base", 0) + 1
+            if name:
+                self._ensure_loaded(name)
+                self.model.set_adapter(name)
+                self.model.enable_adapters()
+            elif self._loaded:
+                self.model.disable_adapters()
+            yield
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "adapter_dir": self.adapter_dir,
+                "loaded": list(self._loaded),
+                "max_loaded": self.max_loaded,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "requests": dict(self.requests),
+            }
@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import logging
+
+from backend.core.config import settings
+from backend.models.fingerprint import model_fingerprint
+
+logger = logging.getLogger("locentra.onnx")
+
+INFERENCE_BACKENDS = ("torch", "onnx")
+ONNX_QUANT_ISAS = ("avx2", "avx512", "avx512_vnni", "arm64")
+
+
+def get_backend() -> str:
+    backend = settings.INFERENCE_BACKEND.lower()
+    if backend not in INFERENCE_BACKENDS:
+        logger.warning(f"[LocentraOS] Unknown inference backend: {backend}. Falling back to 'torch'.")
+        return "torch"
+    return backend
+
+
+def _export_dir(model_name: str) -> str:
+    # Keyed on the weights as well as the name, so a retrained model is exported again
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    return os.path.join(settings.ONNX_CACHE_DIR, f"{name}-{model_fingerprint(model_name)}")
+
+
+def _onnx_file(optimized: bool, quantized: bool) -> str:
+    stem = "model_optimized" if optimized else "model"
+    return f"{stem}_quantized.onnx" if quantized else f"{stem}.onnx"
+
+
+def _optimize(path: str) -> bool:
+    """Offline graph fusion (attention, layer norm, GELU). Not every architecture is supported."""
+    from optimum.onnxruntime import ORTOptimizer
+    from optimum.onnxruntime.configuration import OptimizationConfig
+
+    if os.path.exists(os.path.join(path, _onnx_file(optimized=True, quantized=False))):
+        return True
+    try:
+        optimizer = ORTOptimizer.from_pretrained(path, file_names=["model.onnx"])
+        optimizer.optimize(
+            save_dir=path,
+            optimization_config=OptimizationConfig(optimization_level=settings.ONNX_OPTIMIZATION_LEVEL),
+        )
+        return True
+    except Exception as e:
+        logger.warning(f"[LocentraOS] ONNX graph optimization unavailable for this model ({e}); using the plain export.")
+        return False
+
+
+def _quantize(path: str, source_file: str) -> str:
+    """Dynamic int8 quantization of MatMul weights for the CPU instruction set in ONNX_QUANT_ISA."""
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    isa = settings.ONNX_QUANT_ISA.lower()
+    if isa not in ONNX_QUANT_ISAS:
+        raise ValueError(f"Unknown ONNX_QUANT_ISA: {isa}. Expected one of {ONNX_QUANT_ISAS}.")
+    quantized_file = source_file.replace(".onnx", "_quantized.onnx")
+    if not os.path.exists(os.path.join(path, quantized_file)):
+        qconfig = getattr(AutoQuantizationConfig, isa)(is_static=False, per_channel=False)
+        ORTQuantizer.from_pretrained(path, file_name=source_file).quantize(save_dir=path, quantization_config=qconfig)
+    return quantized_file
+
+
+def export_onnx(model_name: str = None) -> tuple:
+    """
+    Export `model_name` to ONNX once (decoder with past key/value inputs and outputs),
+    then optionally graph-optimize and int8-quantize it. Artifacts are cached under
+    ONNX_CACHE_DIR, one directory per model name and weights fingerprint.
+    Returns (directory, onnx file name).
+    """
+    from optimum.onnxruntime import ORTModelForCausalLM
+    from transformers import AutoTokenizer
+
+    model_name = model_name or settings.MODEL_NAME
+    path = _export_dir(model_name)
+
+    if not os.path.exists(os.path.join(path, "model.onnx")):
+        start = time.time()
+        logger.info(f"[LocentraOS] Exporting {model_name} to ONNX (with past key/values)...")
+        model = ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True)
+        model.save_pretrained(path)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(path)
+        logger.info(f"[LocentraOS] ONNX export written to {path} in {time.time() - start:.1f}s")
+
+    file_name = "model.onnx"
+    if settings.ONNX_OPTIMIZATION_LEVEL > 0 and _optimize(path):
+        file_name = _onnx_file(optimized=True, quantized=False)
+    if settings.ONNX_QUANTIZE:
+        file_name = _quantize(path, file_name)
+    return path, file_name
+
+
+def load_onnx_model(model_name: str = None) -> dict:
+    """
+    Load `model_name` on ONNX Runtime's CPU execution provider. The returned
+    ORTModelForCausalLM implements generate(), so it drops into the scheduler,
+    streaming and batch paths in place of the torch model.
+    """
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForCausalLM
+    from transformers import AutoTokenizer
+
+    model_name = model_name or settings.MODEL_NAME
+    path, file_name = export_onnx(model_name)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if settings.ONNX_THREADS:
+        options.intra_op_num_threads = settings.ONNX_THREADS
+
+    start = time.time()
+    model = ORTModelForCausalLM.from_pretrained(
+        path,
+        file_name=file_name,
+        provider="CPUExecutionProvider",
+        session_options=options,
+        use_cache=True,
+    )
+    model.name_or_path = model_name
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    logger.info(f"[LocentraOS] ONNX Runtime session ready ({file_name}) in {time.time() - start:.2f}s")
+    return {"model": model, "tokenizer": tokenizer}
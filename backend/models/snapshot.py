@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+
+import torch
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+from backend.core.config import settings
+from backend.models.adapter import _quantize_linears, apply_adapter
+
+logger = logging.getLogger("locentra.snapshot")
+
+WEIGHTS_FILE = "model.safetensors"
+MANIFEST_FILE = "snapshot.json"
+SNAPSHOT_VERSION = 1
+
+
+def _serving_config() -> dict:
+    """Settings that shape the exported weights; a snapshot is only valid for the same values."""
+    strategy = settings.ADAPTER_STRATEGY.lower()
+    return {
+        "model_name": settings.MODEL_NAME,
+        "adapter_strategy": strategy,
+        "lora_adapter": settings.LORA_ADAPTER if strategy == "lora" else None,
+        "quant_mode": settings.QUANT_MODE.lower() if strategy == "quant" else None,
+        "quant_group_size": settings.QUANT_GROUP_SIZE if strategy == "quant" else None,
+    }
+
+
+def _read_manifest(path: str):
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def snapshot_usable(path: str) -> bool:
+    """True if `path` holds a complete snapshot built from the current model/adapter settings."""
+    manifest = _read_manifest(path)
+    if manifest is None or not os.path.isfile(os.path.join(path, WEIGHTS_FILE)):
+        return False
+    if manifest.get("version") != SNAPSHOT_VERSION or manifest.get("serving") != _serving_config():
+        logger.warning(f"[LocentraOS] Snapshot at {path} was built for different settings; ignoring it.")
+        return False
+    return True
+
+
+# === Export ===
+
+def export_snapshot(path: str = None) -> dict:
+    """
+    Build the serving model once (base weights + LoRA merge / quantization) and write it to
+    `path` as a single safetensors file plus config, tokenizer and a manifest.
+
+    Shared tensors (tied embeddings) are stored once and re-tied on load. dynamic_int8
+    packed weights cannot be stored in safetensors, so for that mode the float weights
+    are exported and quantized again at boot.
+    """
+    from safetensors.torch import save_file
+
+    path = path or settings.SNAPSHOT_DIR
+    if not path:
+        raise ValueError("No snapshot directory given (set SNAPSHOT_DIR or pass a path).")
+
+    start = time.time()
+    serving = _serving_config()
+    tokenizer = AutoTokenizer.from_pretrained(serving["model_name"])
+    model = AutoModelForCausalLM.from_pretrained(serving["model_name"], torch_dtype=torch.float32)
+    requantize = serving["quant_mode"] == "dynamic_int8"
+    if not requantize:
+        model = apply_adapter(model, tokenizer)
+    model.eval()
+
+    # safetensors refuses aliased storage: keep the first name per tensor, remember the rest
+    tensors, aliases, seen = {}, {}, {}
+    for name, tensor in model.state_dict().items():
+        if not isinstance(tensor, torch.Tensor):
+            continue
+        key = (tensor.data_ptr(), tensor.numel(), tensor.dtype)
+        if key in seen:
+            aliases[name] = seen[key]
+            continue
+        seen[key] = name
+        tensors[name] = tensor.detach().contiguous()
+
+    tmp_path = f"{path.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    save_file(tensors, os.path.join(tmp_path, WEIGHTS_FILE), metadata={"format": "pt"})
+    model.config.save_pretrained(tmp_path)
+    tokenizer.save_pretrained(tmp_path)
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "created": datetime.utcnow().isoformat(),
+        "serving": serving,
+        "requantize": requantize,
+        "aliases": aliases,
+        "tensors": len(tensors),
+        "bytes": sum(t.numel() * t.element_size() for t in tensors.values()),
+        "quant_report": getattr(model, "quant_report", None),
+        "torch": torch.__version__,
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap in atomically so a booting server never sees a half-written snapshot
+    old_path = f"{path.rstrip(os.sep)}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    manifest["seconds"] = round(time.time() - start, 2)
+    logger.info(
+        f"[LocentraOS] Snapshot exported to {path}: {manifest['tensors']} tensors, "
+        f"{manifest['bytes'] / 1024 ** 2:.0f} MB in {manifest['seconds']}s"
+    )
+    return manifest
+
+
+# === Load ===
+
+def load_snapshot(path: str = None):
+    """
+    Load a snapshot without copying weights: the module tree is built with empty
+    parameters and the tensors are assigned straight from the memory-mapped safetensors
+    file. Pages are read lazily and shared by every process that maps the same file.
+    Returns (model, tokenizer).
+    """
+    from accelerate import init_empty_weights
+    from safetensors.torch import load_file
+
+    path = path or settings.SNAPSHOT_DIR
+    start = time.time()
+    manifest = _read_manifest(path)
+    serving = manifest["serving"]
+
+    config = AutoConfig.from_pretrained(path)
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32)
+    if serving["quant_mode"] and not manifest["requantize"]:
+        _quantize_linears(model, serving["quant_mode"], serving["quant_group_size"], empty=True)
+
+    state = load_file(os.path.join(path, WEIGHTS_FILE))  # CPU tensors backed by the file mapping
+    for alias, name in manifest["aliases"].items():
+        state[alias] = state[name]
+    missing, unexpected = model.load_state_dict(state, strict=False, assign=True)
+    if unexpected:
+        logger.warning(f"[LocentraOS] Snapshot has {len(unexpected)} tensors the model does not use.")
+    still_empty = [n for n, p in model.named_parameters() if p.is_meta]
+    if still_empty:
+        raise RuntimeError(f"Snapshot is missing {len(still_empty)} parameters, e.g. {still_empty[0]}")
+    model.tie_weights()
+
+    if manifest["requantize"]:
+        _quantize_linears(model, "dynamic_int8", serving["quant_group_size"])
+    if manifest.get("quant_report"):
+        model.quant_report = {**manifest["quant_report"], "from_snapshot": True}
+    model.name_or_path = serving["model_name"]
+
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    logger.info(f"[LocentraOS] Snapshot loaded from {path} in {time.time() - start:.2f}s (mmap)")
+    return model, tokenizer
@@ -0,0 +1,121 @@
+import logging
+import threading
+from typing import Optional
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from backend.core.config import settings
+
+logger = logging.getLogger("locentra.speculative")
+
+SPECULATIVE_MODES = ("none", "draft", "prompt_lookup")
+
+# Lazily loaded draft model (shared by all requests)
+_draft_model = None
+_draft_lock = threading.Lock()
+
+
+def get_mode() -> str:
+    mode = settings.SPECULATIVE_MODE.lower()
+    if mode not in SPECULATIVE_MODES:
+        logger.warning(f"[LocentraOS] Unknown speculative mode: {mode}. Falling back to 'none'.")
+        return "none"
+    return mode
+
+
+def get_draft_model(device=None):
+    """
+    Load the small draft causal LM once. It must share the main model's tokenizer/vocabulary.
+    """
+    global _draft_model
+    with _draft_lock:
+        if _draft_model is None:
+            if not settings.DRAFT_MODEL_NAME:
+                raise ValueError("DRAFT_MODEL_NAME must be set when SPECULATIVE_MODE=draft.")
+            logger.info(f"[LocentraOS] Loading draft model: {settings.DRAFT_MODEL_NAME}")
+            _draft_model = AutoModelForCausalLM.from_pretrained(settings.DRAFT_MODEL_NAME)
+            _draft_model.eval()
+            if device is not None:
+                _draft_model = _draft_model.to(device)
+    return _draft_model
+
+
+def speculative_kwargs(model) -> dict:
+    """
+    Extra model.generate() arguments for the configured speculative mode.
+
+    - draft: a small assistant model proposes k tokens, the main model verifies them in one pass
+    - prompt_lookup: draft-free, proposes continuations by matching n-grams from the prompt
+    """
+    mode = get_mode()
+    k = settings.SPECULATIVE_NUM_TOKENS
+    if mode != "none" and not isinstance(model, torch.nn.Module):
+        return {}  # Assisted generation needs a torch main model (not the ONNX Runtime backend)
+
+    if mode == "draft":
+        draft = get_draft_model(model.device)
+        # Keep k fixed so acceptance rate is measured against a known proposal length
+        draft.generation_config.num_assistant_tokens = k
+        draft.generation_config.num_assistant_tokens_schedule = "constant"
+        return {"assistant_model": draft}
+
+    if mode == "prompt_lookup":
+        return {"prompt_lookup_num_tokens": k}
+
+    return {}
+
+
+class ForwardCounter:
+    """
+    Counts forward passes of the main model issued from the current thread.
+    With speculative decoding each verification pass can accept several tokens,
+    so tokens / passes is the effective speedup over one-token-per-pass decoding.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.passes = 0
+        self._thread = threading.get_ident()
+        self._handle = None
+
+    def _hook(self, module, args, output):
+        if threading.get_ident() == self._thread:
+            self.passes += 1
+
+    def __enter__(self):
+        if isinstance(self.model, torch.nn.Module):
+            self._handle = self.model.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        if self._handle is not None:
+            self._handle.remove()
+        return False
+
+
+def speculation_report(counter: Optional[ForwardCounter], new_tokens: int, elapsed: float) -> dict:
+    """
+    Acceptance rate and speedup metadata for a speculative generation.
+
+    The first pass prefills the prompt and emits one token; every later pass verifies
+    k proposed tokens and emits the accepted ones plus one corrected token.
+    """
+    mode = get_mode()
+    if counter is None or mode == "none":
+        return {"mode": "none"}
+
+    k = settings.SPECULATIVE_NUM_TOKENS
+    passes = max(counter.passes, 1)
+    verify_passes = max(passes - 1, 1)
+    accepted = max(new_tokens - passes, 0)
+
+    return {
+        "mode": mode,
+        "num_tokens": k,
+        "main_model_passes": passes,
+        "acceptance_rate": round(accepted / (verify_passes * k), 3),
+        "tokens_per_pass": round(new_tokens / passes, 3),
+        "estimated_speedup": round(new_tokens / passes, 2),
+        "tokens_per_sec": round(new_tokens / elapsed, 2) if elapsed > 0 else None,
+    }
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple, Union
+
+import torch
+from transformers import StoppingCriteria
+
+logger = logging.getLogger("locentra.stopping")
+
+
+class GenerationCancelled(RuntimeError):
+    """Raised in place of a result when the caller cancelled (e.g. the client disconnected)."""
+
+
+class CancelCriteria(StoppingCriteria):
+    """
+    Stops decoding for rows whose request was cancelled.
+
+    Each batch row has its own threading.Event. A cancelled row is reported as
+    finished, so generate() pads it from then on and returns as soon as every
+    row is finished, instead of decoding dead rows to max_new_tokens.
+    """
+
+    def __init__(self, events: List[threading.Event]):
+        self.events = events
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.tensor([e.is_set() for e in self.events], dtype=torch.bool, device=input_ids.device)
+
+
+class BudgetCriteria(StoppingCriteria):
+    """
+    Per-row generation budgets: token limit, wall-clock deadline and stop strings.
+
+    Rows in one batch can have different budgets; a row that runs out is reported
+    as finished while the others keep decoding. `reasons[row]` records what ended
+    the row ("eos", "length", "deadline" or "stop") and `steps[row]` how many new
+    tokens it had at that point. A row that emitted EOS is done: it is recorded as
+    "eos" and never checked against the budget again while longer rows decode.
+    """
+
+    def __init__(
+        self,
+        prompt_width: int,
+        max_tokens: List[int],
+        deadlines: List[Optional[float]] = None,
+        stops: List[Optional[List[str]]] = None,
+        tokenizer=None,
+        eos_token_id: Union[int, List[int], None] = None
+    ):
+        rows = len(max_tokens)
+        self.prompt_width = prompt_width
+        self.max_tokens = max_tokens
+        self.deadlines = deadlines or [None] * rows
+        self.stops = stops or [None] * rows
+        self.tokenizer = tokenizer
+        if eos_token_id is None and tokenizer is not None:
+            eos_token_id = tokenizer.eos_token_id
+        self.eos_ids = [eos_token_id] if isinstance(eos_token_id, int) else list(eos_token_id or [])
+        self.reasons: List[Optional[str]] = [None] * rows
+        self.steps: List[Optional[int]] = [None] * rows
+        longest = max((len(s) for row in self.stops if row for s in row), default=0)
+        # Tail of tokens to decode when looking for a stop string, with slack for multi-token characters
+        self._window = longest + 8
+
+    def _hit_stop(self, row_ids: torch.LongTensor, stops: List[str]) -> bool:
+        tail = row_ids[max(self.prompt_width, row_ids.shape[-1] - self._window):]
+        text = self.tokenizer.decode(tail, skip_special_tokens=True)
+        return any(s in text for s in stops)
+
+    def _eos_step(self, row_ids: torch.LongTensor) -> Optional[int]:
+        """New-token count up to and including the row's first EOS, or None."""
+        if not self.eos_ids:
+            return None
+        new_ids = row_ids[self.prompt_width:]
+        hits = torch.isin(new_ids, torch.tensor(self.eos_ids, device=new_ids.device)).nonzero()
+        return int(hits[0]) + 1 if len(hits) else None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        now = time.time()
+        new_tokens = input_ids.shape[-1] - self.prompt_width
+        for row in range(input_ids.shape[0]):
+            if self.reasons[row] is not None:
+                continue
+            # Checked on every step, so EOS (possibly several tokens back after a speculative step) wins
+            eos_step = self._eos_step(input_ids[row])
+            if eos_step is not None:
+                self.reasons[row], self.steps[row] = "eos", eos_step
+                continue
+            if new_tokens >= self.max_tokens[row]:
+                self.reasons[row] = "length"
+            elif self.deadlines[row] is not None and now >= self.deadlines[row]:
+                self.reasons[row] = "deadline"
+            elif self.stops[row] and self._hit_stop(input_ids[row], self.stops[row]):
+                self.reasons[row] = "stop"
+            else:
+                continue
+            self.steps[row] = new_tokens
+        return torch.tensor([r is not None for r in self.reasons], dtype=torch.bool, device=input_ids.device)
+
+
+def request_cancel(future: Future) -> bool:
+    """
+    Cancel a generation, even one that is already decoding. Scheduler and sidecar
+    futures stop their running work through request_cancel(); any other future gets
+    the standard Future.cancel().
+    """
+    method = getattr(future, "request_cancel", None)
+    return method() if method is not None else future.cancel()
+
+
+def truncate_at_stop(text: str, stops: Optional[List[str]]) -> Tuple[str, bool]:
+    """Cut `text` before the earliest stop string. Returns (text, whether a stop string was found)."""
+    if not stops:
+        return text, False
+    cuts = [text.find(s) for s in stops if s and s in text]
+    if not cuts:
+        return text, False
+    return text[:min(cuts)], True
+
+
+# === Cancellation metrics (shared by the batched and streaming paths) ===
+
+_stats_lock = threading.Lock()
+_stats = {
+    "queued": 0,        # cancelled before a batch picked the request up
+    "running": 0,       # cancelled mid-decode inside a batch
+    "stream": 0,        # streaming clients that went away before the end
+    "tokens_discarded": 0,
+}
+
+
+def record_cancellation(stage: str, tokens: int = 0):
+    with _stats_lock:
+        _stats[stage] += 1
+        _stats["tokens_discarded"] += tokens
+    logger.info(f"[LocentraOS] Generation cancelled ({stage}, {tokens} tokens discarded)")
+
+
+def cancellation_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["total"] = stats["queued"] + stats["running"] + stats["stream"]
+    return stats
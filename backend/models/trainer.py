@@ -19,12 +19,17 @@ def fine_tune_model(
     batch_size: int = 2,
     save_total_limit: int = 2,
     use_early_stopping: bool = True,
-    patience: int = 3
+    patience: int = 3,
+    adapter_name: str = None
 ):
+    """
+    Fine-tune on the given texts. With `adapter_name`, only a LoRA adapter is trained
+    and saved to LORA_ADAPTER_DIR/<adapter_name> instead of a full model copy.
+    """
     print("[LocentraOS] Starting fine-tuning...")
 
-    # Load model and tokenizer
-    llm = load_model()
+    # Load model and tokenizer (always torch: ONNX Runtime sessions cannot be trained)
+    llm = load_model(backend="torch")
     model = llm["model"]
     tokenizer = llm["tokenizer"]
 
@@ -43,9 +48,22 @@ def fine_tune_model(
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"[LocentraOS] Using device: {device}")
 
-    # Timestamped output path
+    # Timestamped output path (full fine-tune) or named adapter directory (LoRA)
     timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    output_path = f"outputs/fine_tuned_{timestamp}"
+    if adapter_name:
+        from peft import LoraConfig, get_peft_model
+
+        lora_config = LoraConfig(
+            task_type="CAUSAL_LM",
+            r=settings.LORA_RANK,
+            lora_alpha=settings.LORA_ALPHA,
+            lora_dropout=settings.LORA_DROPOUT,
+        )
+        model = get_peft_model(model, lora_config)
+        model.print_trainable_parameters()
+        output_path = os.path.join(settings.LORA_ADAPTER_DIR, adapter_name)
+    else:
+        output_path = f"outputs/fine_tuned_{timestamp}"
     os.makedirs(output_path, exist_ok=True)
 
     # Training config
@@ -85,6 +103,11 @@ def fine_tune_model(
     train_output = trainer.train()
     train_loss = train_output.training_loss
 
+    # Persist final weights + tokenizer so the engine can hot-load this checkpoint
+    # (for LoRA, save_model writes only the adapter weights and config)
+    trainer.save_model(output_path)
+    tokenizer.save_pretrained(output_path)
+
     print(f"[LocentraOS] Fine-tuning complete. Final loss: {train_loss:.4f}")
     print(f"[LocentraOS] Model saved to: {output_path}")
 
@@ -92,4 +115,5 @@ def fine_tune_model(
         "model": model,
         "loss": train_loss,
         "output_path": output_path,
+        "adapter_name": adapter_name,
     }
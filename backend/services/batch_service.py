@@ -0,0 +1,86 @@
+import time
+import logging
+from typing import List, Optional
+
+import torch
+
+from backend.core.engine import engine
+from backend.data.tokenizer import token_lengths
+
+logger = logging.getLogger("locentra.batch")
+
+
+def plan_buckets(prompts: List[str], batch_size: int) -> List[List[dict]]:
+    """
+    Sort prompts by token length and cut them into buckets of `batch_size`,
+    so each padded batch holds prompts of similar length and wastes little padding.
+    Items keep their original index so results can be matched back to the input.
+    """
+    lengths = token_lengths(prompts)
+    order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+    items = [{"index": i, "prompt": prompts[i], "input_tokens": lengths[i]} for i in order]
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def run_bucket(
+    bucket: List[dict],
+    max_tokens: int = 100,
+    temperature: float = 0.7,
+    adapter: Optional[str] = None
+) -> dict:
+    """
+    Generate completions for one length-bucket with a single padded generate() call.
+    Returns per-item results plus bucket timing and padding efficiency.
+    """
+    llm = engine.get_model()
+    model, tokenizer = llm["model"], llm["tokenizer"]
+
+    # The serving model's own tokenizer, left-padded for this call only (the scheduler shares it)
+    inputs = tokenizer(
+        [item["prompt"] for item in bucket],
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+        padding_side="left"
+    )
+    inputs = {k: v.to(model.device) for k, v in inputs.items() if k in ("input_ids", "attention_mask")}
+    prompt_width = inputs["input_ids"].shape[-1]
+
+    gen_kwargs = {"do_sample": temperature > 0}
+    if temperature > 0:
+        gen_kwargs["temperature"] = temperature
+
+    start = time.time()
+    with torch.no_grad(), engine.adapter_context(adapter):
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_tokens,
+            pad_token_id=tokenizer.pad_token_id,
+            **gen_kwargs
+        )
+    elapsed = time.time() - start
+
+    results = []
+    for row, item in enumerate(bucket):
+        new_ids = outputs[row, prompt_width:]
+        new_ids = new_ids[new_ids != tokenizer.pad_token_id]
+        output_tokens = int(new_ids.shape[-1])
+        results.append({
+            "index": item["index"],
+            "prompt": item["prompt"],
+            "response": tokenizer.decode(new_ids, skip_special_tokens=True),
+            "input_tokens": int(inputs["attention_mask"][row].sum()),
+            "output_tokens": output_tokens,
+            "latency": round(elapsed, 3),
+            "tokens_per_sec": round(output_tokens / elapsed, 2) if elapsed > 0 else None,
+        })
+
+    real_tokens = int(inputs["attention_mask"].sum())
+    return {
+        "results": results,
+        "batch_size": len(bucket),
+        "latency": elapsed,
+        "output_tokens": sum(r["output_tokens"] for r in results),
+        "prompt_tokens": real_tokens,
+        "padded_tokens": prompt_width * len(bucket),
+    }
@@ -0,0 +1,319 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.core.constants import SEMANTIC_CACHE_TAG_THRESHOLDS
+from backend.data.vectorizer import embed_text
+
+logger = logging.getLogger("locentra.cache")
+
+
+# === Key Construction ===
+
+def normalize_prompt(text: Optional[str]) -> str:
+    """Collapse whitespace so trivially different prompts share a cache entry."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def make_cache_key(prompt: str, params: dict, model_meta: dict) -> str:
+    """
+    Hash of the normalized prompt, generation parameters and model identity.
+    Any change to the served model produces a different key space.
+    """
+    material = {
+        "prompt": normalize_prompt(prompt),
+        "system_prompt": normalize_prompt(params.get("system_prompt")),
+        "params": {k: v for k, v in sorted(params.items()) if k != "system_prompt"},
+        "model": [model_meta.get("name"), model_meta.get("type")],
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+# === Disk Backend ===
+
+class DiskCacheBackend:
+    """
+    SQLite-backed store shared by all gunicorn workers on the same host.
+    Each call opens its own short-lived connection, so it is safe across threads and processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, expires REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """A connection for one transaction (committed on success), always closed afterwards."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict, ttl: int):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, expires) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now + ttl),
+            )
+            conn.execute("DELETE FROM responses WHERE expires < ?", (now,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+# === Response Cache ===
+
+class ResponseCache:
+    """
+    Exact-match cache of generation results with LRU + TTL eviction.
+
+    Lookups hit the in-process LRU first, then the optional shared disk backend.
+    Only deterministic requests (temperature 0) are cached unless
+    RESPONSE_CACHE_SAMPLED is enabled.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: int = None, disk_path: str = None):
+        self.max_entries = max_entries or settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = ttl or settings.RESPONSE_CACHE_TTL
+        disk_path = disk_path if disk_path is not None else settings.RESPONSE_CACHE_PATH
+        self.disk = DiskCacheBackend(disk_path) if disk_path else None
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def cacheable(self, temperature: float) -> bool:
+        return temperature == 0 or settings.RESPONSE_CACHE_SAMPLED
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return {**value, "cache": "hit", "cache_source": "memory"}
+                del self._entries[key]
+
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"[LocentraOS] Response cache disk read failed: {e}")
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self.disk_hits += 1
+                return {**value, "cache": "hit", "cache_source": "disk"}
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: dict):
+        self._remember(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, self.ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"[LocentraOS] Response cache disk write failed: {e}")
+
+    def _remember(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached response (e.g. after a new fine-tuned model is loaded)."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+        if self.disk is not None:
+            try:
+                self.disk.clear()
+            except sqlite3.Error as e:
+                logger.warning(f"[LocentraOS] Response cache disk clear failed: {e}")
+        logger.info("[LocentraOS] Response cache invalidated.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk": self.disk.path if self.disk else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+# === Semantic Cache ===
+
+def _embed(text: str) -> np.ndarray:
+    return embed_text(normalize_prompt(text)).astype(np.float32)
+
+
+class SemanticCache:
+    """
+    Paraphrase-tolerant cache in front of generation.
+
+    Answered prompts are embedded with the MiniLM vectorizer and stored as rows of a
+    preallocated float32 matrix. A lookup is one matrix-vector product over the rows
+    that share the request scope (generation parameters + model), accepted when the
+    best cosine similarity clears the threshold for the request tag. When full, the
+    least recently used row is overwritten. Scopes are numbered while they own rows,
+    so the scope table never outgrows the matrix.
+    """
+
+    def __init__(self, capacity: int = None, threshold: float = None, ttl: int = None):
+        self.capacity = capacity or settings.SEMANTIC_CACHE_MAX_ENTRIES
+        self.threshold = threshold if threshold is not None else settings.SEMANTIC_CACHE_THRESHOLD
+        self.ttl = ttl or settings.RESPONSE_CACHE_TTL
+
+        self._vectors = None                    # (capacity, dim) float32, allocated on first insert
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._expires = np.zeros(self.capacity, dtype=np.float64)
+        self._scope_of = np.full(self.capacity, -1, dtype=np.int64)
+        self._scope_ids: dict = {}              # scope -> id, for scopes that own rows
+        self._scope_rows: dict = {}             # id -> [scope, rows owned]
+        self._next_scope = 0
+        self._values: list = [None] * self.capacity
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def threshold_for(self, tag: Optional[str]) -> float:
+        return SEMANTIC_CACHE_TAG_THRESHOLDS.get(tag, self.threshold) if tag else self.threshold
+
+    def get(self, prompt: str, scope: str, tag: Optional[str] = None) -> Optional[dict]:
+        query = _embed(prompt)
+        now = time.time()
+
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if self._size == 0 or scope_id is None:
+                self.misses += 1
+                return None
+
+            n = self._size
+            valid = (self._expires[:n] >= now) & (self._scope_of[:n] == scope_id)
+            if not valid.any():
+                self.misses += 1
+                return None
+
+            scores = self._vectors[:n] @ query
+            scores[~valid] = -np.inf
+            row = int(np.argmax(scores))
+            score = float(scores[row])
+
+            if score < self.threshold_for(tag):
+                self.misses += 1
+                return None
+
+            self._last_used[row] = now
+            self.hits += 1
+            value = self._values[row]
+
+        return {**value, "cache": "hit", "cache_source": "semantic", "similarity": round(score, 4)}
+
+    def set(self, prompt: str, scope: str, value: dict):
+        vec = _embed(prompt)
+        now = time.time()
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vec.shape[-1]), dtype=np.float32)
+
+            if self._size < self.capacity:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used))
+                self.evictions += 1
+                self._release_scope(int(self._scope_of[row]))
+
+            self._vectors[row] = vec
+            self._last_used[row] = now
+            self._expires[row] = now + self.ttl
+            self._scope_of[row] = self._claim_scope(scope)
+            self._values[row] = value
+
+    def _claim_scope(self, scope: str) -> int:
+        scope_id = self._scope_ids.get(scope)
+        if scope_id is None:
+            scope_id = self._scope_ids[scope] = self._next_scope
+            self._scope_rows[scope_id] = [scope, 0]
+            self._next_scope += 1
+        self._scope_rows[scope_id][1] += 1
+        return scope_id
+
+    def _release_scope(self, scope_id: int):
+        entry = self._scope_rows[scope_id]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._scope_rows[scope_id]
+            del self._scope_ids[entry[0]]
+
+    def invalidate(self):
+        with self._lock:
+            self._size = 0
+            self._scope_of[:] = -1
+            self._scope_ids.clear()
+            self._scope_rows.clear()
+            self._values = [None] * self.capacity
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "bytes": self._vectors.nbytes if self._vectors is not None else 0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 from backend.db.connection import get_db
 from backend.db.models import PromptLog
 from backend.data.cleaner import full_clean
+from backend.core.config import settings
+from backend.services.search_service import prompt_index
 from backend.utils.tokenizer import count_tokens  # Optional
 
 import logging
@@ -46,6 +48,13 @@ def log_prompt(
     db.commit()
     logger.info(f"[LocentraOS] Logged prompt (user={user_id}, tag={tag})")
 
+    # Keep the prompt ANN index current; indexing must never fail the insert
+    if settings.ANN_INDEX_ENABLED:
+        try:
+            prompt_index.add(entry.id, cleaned)
+        except Exception as e:
+            logger.warning(f"[LocentraOS] Failed to index prompt {entry.id}: {e}")
+
 
 # Retrieve recent prompts with optional filters
 def get_recent_prompts(
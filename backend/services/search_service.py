@@ -0,0 +1,287 @@
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.data.ann_index import IVFPQIndex, append_rows, prune_rows, read_rows
+from backend.data.vectorizer import embed_batch, embed_text
+from backend.models.embedding import embedding_service
+
+logger = logging.getLogger("locentra.search")
+
+
+class PromptIndex:
+    """
+    ANN index over PromptLog embeddings, persisted under ANN_INDEX_DIR.
+
+    - build() embeds the whole table in chunks (keyset pagination on id), trains the
+      IVF-PQ quantizers on the first ANN_TRAIN_SIZE rows and snapshots to disk,
+      recording the last id it covers.
+    - add() is called by log_prompt for every new row. Rows are buffered and embedded
+      ANN_ADD_BATCH at a time (and before any search), outside the lock. Every
+      ANN_SAVE_EVERY additions a background thread appends the new rows to this
+      process's own row log (and save() does so at shutdown), so a request never
+      writes to disk. A small table is searched exactly until it reaches
+      ANN_TRAIN_SIZE rows; the quantizers are then trained in a background thread on
+      a copy of those rows and the trained index is swapped in, so adds and searches
+      never wait for k-means.
+    - search() returns (prompt id, cosine score) pairs.
+
+    The snapshot is tied to the embedding model recorded in its manifest; a
+    snapshot from another model is ignored and must be rebuilt.
+
+    Each process holds its own copy. Only build() writes the snapshot; workers each
+    append to their own row log, and loading merges the snapshot with the rows every
+    log holds past its last id, so no worker's additions are lost. `make index` folds
+    the logs back into a fresh (trained) snapshot and removes the ones it covers.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.ANN_INDEX_DIR
+        self.index: Optional[IVFPQIndex] = None
+        self._loaded = False
+        self._pending: List[Tuple[int, str]] = []
+        self._unsaved: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._since_save = 0
+        self._training: Optional[threading.Thread] = None
+        self._saving: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+
+    # === Lifecycle ===
+
+    @staticmethod
+    def _model_name() -> str:
+        return embedding_service.model_name
+
+    @classmethod
+    def _rows_tag(cls) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]+", "_", cls._model_name())
+
+    def _new_index(self, dim: int) -> IVFPQIndex:
+        return IVFPQIndex(dim, nlist=settings.ANN_NLIST, m=settings.ANN_PQ_M, keep_vectors=settings.ANN_KEEP_VECTORS)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        last_id = None
+        manifest = IVFPQIndex.read_manifest(self.path)
+        if manifest is not None and manifest.get("embedding_model") == self._model_name():
+            try:
+                self.index = IVFPQIndex.load(self.path)
+                last_id = manifest.get("last_id")
+                logger.info(f"[LocentraOS] ANN index loaded from {self.path} ({len(self.index)} prompts)")
+            except ValueError as e:
+                logger.warning(f"[LocentraOS] {e} Starting an empty index.")
+        elif manifest is not None:
+            logger.warning(
+                f"[LocentraOS] ANN index at {self.path} was built with {manifest.get('embedding_model')}; "
+                "ignoring it. Rebuild with `python -m backend.cli.index build`."
+            )
+        else:
+            logger.info(f"[LocentraOS] No ANN index at {self.path}; build one with `python -m backend.cli.index build`.")
+
+        # Rows every worker logged after the snapshot was built
+        rows = read_rows(self.path, self._rows_tag(), after_id=last_id)
+        if rows is not None and (self.index is None or self.index.dim == rows[1].shape[1]):
+            if self.index is None:
+                self.index = self._new_index(rows[1].shape[1])
+            self.index.add(*rows)
+            self._train_in_background()
+            logger.info(f"[LocentraOS] ANN index: merged {len(rows[0])} logged prompts")
+
+    def build(self, chunk_size: int = 1024) -> dict:
+        """(Re)build the index from every PromptLog row and snapshot it."""
+        from backend.db.connection import get_db
+        from backend.db.models import PromptLog
+
+        start = time.time()
+        index, last_id, rows = None, 0, 0
+        with get_db() as db:
+            while True:
+                batch = (
+                    db.query(PromptLog.id, PromptLog.prompt)
+                    .filter(PromptLog.id > last_id)
+                    .order_by(PromptLog.id)
+                    .limit(chunk_size)
+                    .all()
+                )
+                if not batch:
+                    break
+                vectors = embed_batch([prompt for _, prompt in batch])
+                if index is None:
+                    index = self._new_index(vectors.shape[1])
+                index.add([prompt_id for prompt_id, _ in batch], vectors)
+                self._maybe_train(index)
+                last_id = batch[-1][0]
+                rows += len(batch)
+
+        with self._lock:
+            self.index = index
+            self._loaded = True
+            self._pending.clear()
+            self._unsaved.clear()
+            self._since_save = 0
+            if index is not None:
+                index.save(self.path, meta={"embedding_model": self._model_name(), "last_id": int(last_id)})
+                prune_rows(self.path, last_id)
+        stats = {"rows": rows, "trained": bool(index and index.trained), "seconds": round(time.time() - start, 2)}
+        logger.info(f"[LocentraOS] ANN index built: {stats}")
+        return stats
+
+    @staticmethod
+    def _maybe_train(index: IVFPQIndex):
+        if not index.trained and len(index.flat_ids) >= settings.ANN_TRAIN_SIZE:
+            index.train(np.asarray(index.flat_vectors))
+
+    def _train_in_background(self):
+        """Start training a copy of the untrained index once it holds ANN_TRAIN_SIZE rows (call under the lock)."""
+        index = self.index
+        if index.trained or len(index.flat_ids) < settings.ANN_TRAIN_SIZE:
+            return
+        if self._training is not None and self._training.is_alive():
+            return
+        snapshot = (np.array(index.flat_ids), np.array(index.flat_vectors))
+        self._training = threading.Thread(target=self._train, args=(index, snapshot), name="ann-train", daemon=True)
+        self._training.start()
+
+    def _train(self, index: IVFPQIndex, snapshot: tuple):
+        ids, vectors = snapshot
+        trained = self._new_index(index.dim)
+        trained.add(ids, vectors)
+        try:
+            self._maybe_train(trained)
+        except Exception as e:
+            logger.error(f"[LocentraOS] ANN index training failed: {e}")
+            return
+        with self._lock:
+            if self.index is not index:
+                return      # Rebuilt meanwhile
+            # Rows added while training ran are still only in the flat buffer
+            if len(index.flat_ids) > len(ids):
+                trained.add(index.flat_ids[len(ids):], index.flat_vectors[len(ids):])
+            self.index = trained
+
+    def _save_in_background(self):
+        """Start appending the unsaved rows to this process's row log (call under the lock)."""
+        if self._saving is not None and self._saving.is_alive():
+            return
+        self._saving = threading.Thread(target=self._save, name="ann-save", daemon=True)
+        self._saving.start()
+
+    def _save(self):
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, []
+            self._since_save = 0
+        if not unsaved:
+            return
+        ids = np.concatenate([ids for ids, _ in unsaved])
+        vectors = np.concatenate([vectors for _, vectors in unsaved])
+        try:
+            append_rows(self.path, self._rows_tag(), str(os.getpid()), ids, vectors)
+        except OSError as e:
+            logger.error(f"[LocentraOS] Could not save {len(ids)} prompts to the ANN row log: {e}")
+
+    def save(self):
+        """Embed buffered rows and append everything unsaved to the row log (called at shutdown)."""
+        with self._lock:
+            self._flush()
+            saving = self._saving
+        if saving is not None:
+            saving.join()
+        self._save()
+
+    # === Updates ===
+
+    def add(self, prompt_id: int, text: str):
+        with self._lock:
+            self._pending.append((prompt_id, text))
+            if len(self._pending) < settings.ANN_ADD_BATCH:
+                return
+            pending, self._pending = self._pending, []
+        self._add(pending)
+
+    def _flush(self):
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self._add(pending)
+
+    def _add(self, pending: List[Tuple[int, str]]):
+        # Embedding runs outside the lock unless the caller (search, save) holds it
+        vectors = embed_batch([text for _, text in pending])
+        ids = np.array([prompt_id for prompt_id, _ in pending], dtype=np.int64)
+        with self._lock:
+            self._ensure_loaded()
+            if self.index is None:
+                self.index = self._new_index(vectors.shape[1])
+            self.index.add(ids, vectors)
+            self._train_in_background()
+
+            if settings.ANN_SAVE_EVERY:
+                self._unsaved.append((ids, vectors))
+                self._since_save += len(ids)
+                if self._since_save >= settings.ANN_SAVE_EVERY:
+                    self._save_in_background()
+
+    # === Queries ===
+
+    def search(self, query: str, k: int = 10, nprobe: int = None, refine: int = None) -> List[Tuple[int, float]]:
+        query_vec = embed_text(query)
+        with self._lock:
+            self._flush()
+            self._ensure_loaded()
+            if self.index is None:
+                return []
+            return self.index.search(
+                query_vec,
+                k=k,
+                nprobe=settings.ANN_NPROBE if nprobe is None else nprobe,
+                refine=settings.ANN_REFINE if refine is None else refine,
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "path": self.path,
+                "loaded": self.index is not None,
+                "trained": bool(self.index and self.index.trained),
+                "size": len(self.index) if self.index is not None else 0,
+                "pending": len(self._pending),
+                "nlist": settings.ANN_NLIST,
+                "nprobe": settings.ANN_NPROBE,
+                "refine": settings.ANN_REFINE,
+            }
+
+
+# Global singleton
+prompt_index = PromptIndex()
+
+
+def search_prompts(query: str, limit: int = 10, nprobe: int = None, refine: int = None) -> List[dict]:
+    """Prompt history most similar to `query`, as dicts with the PromptLog fields and a score."""
+    from backend.db.connection import get_db
+    from backend.db.models import PromptLog
+
+    hits = prompt_index.search(query, k=limit, nprobe=nprobe, refine=refine)
+    if not hits:
+        return []
+    with get_db() as db:
+        rows = {row.id: row for row in db.query(PromptLog).filter(PromptLog.id.in_([i for i, _ in hits])).all()}
+        return [
+            {
+                "id": prompt_id,
+                "prompt": rows[prompt_id].prompt,
+                "tag": rows[prompt_id].tag,
+                "source": rows[prompt_id].source,
+                "created_at": rows[prompt_id].created_at.isoformat() if rows[prompt_id].created_at else None,
+                "score": round(score, 4),
+            }
+            for prompt_id, score in hits
+            if prompt_id in rows
+        ]
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import time
+import traceback
+from backend.services.cache_service import ResponseCache, make_cache_key
+
+# Exact-match response cache: key stability, LRU/TTL eviction, shared disk backend
+def test_response_cache(verbose: bool = True) -> dict:
+    results = {"test": "response_cache", "status": "pass", "errors": []}
+    meta = {"name": "tiiuae/falcon-rw-1b", "type": "FalconForCausalLM"}
+
+    try:
+        if verbose: print("[TEST] Whitespace-normalized prompts share a key...")
+        params = {"max_tokens": 50, "temperature": 0.0}
+        key = make_cache_key("What is  a DAO? ", params, meta)
+        assert key == make_cache_key("What is a DAO?", params, meta)
+        assert key != make_cache_key("What is a DAO?", {**params, "max_tokens": 51}, meta)
+        assert key != make_cache_key("What is a DAO?", params, {**meta, "name": "outputs/fine_tuned_1"})
+
+        if verbose: print("[TEST] LRU eviction at max_entries...")
+        cache = ResponseCache(max_entries=2, ttl=60, disk_path="")
+        cache.set("a", {"text": "A"})
+        cache.set("b", {"text": "B"})
+        assert cache.get("a")["text"] == "A"
+        cache.set("c", {"text": "C"})
+        assert cache.get("b") is None, "Least recently used entry was not evicted"
+        assert cache.get("a")["cache"] == "hit"
+
+        if verbose: print("[TEST] TTL expiry...")
+        cache = ResponseCache(max_entries=10, ttl=1, disk_path="")
+        cache.set("k", {"text": "K"})
+        time.sleep(1.1)
+        assert cache.get("k") is None, "Expired entry was returned"
+
+        if verbose: print("[TEST] Disk backend shared between cache instances...")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "responses.db")
+            writer = ResponseCache(max_entries=10, ttl=60, disk_path=path)
+            reader = ResponseCache(max_entries=10, ttl=60, disk_path=path)
+            writer.set(key, {"text": "shared"})
+            hit = reader.get(key)
+            assert hit["text"] == "shared" and hit["cache_source"] == "disk"
+
+            writer.invalidate()
+            assert ResponseCache(max_entries=10, ttl=60, disk_path=path).get(key) is None
+
+    except Exception as e:
+        results["status"] = "fail"
+        results["errors"].append(str(e))
+        results["trace"] = traceback.format_exc()
+
+    return results
+
+# Semantic cache: paraphrases hit, unrelated prompts and other scopes miss
+def test_semantic_cache(verbose: bool = True) -> dict:
+    from backend.services.cache_service import SemanticCache
+
+    results = {"test": "semantic_cache", "status": "pass", "errors": []}
+
+    try:
+        cache = SemanticCache(capacity=2, threshold=0.75, ttl=60)
+        cache.set("what is solana", "scope-a", {"completion": "Solana is a blockchain."})
+
+        hit = cache.get("explain solana briefly", "scope-a")
+        if verbose: print(f"[TEST] Paraphrase lookup: {hit}")
+        assert hit is not None and hit["cache_source"] == "semantic"
+
+        assert cache.get("how do I bake bread", "scope-a") is None, "Unrelated prompt matched"
+        assert cache.get("what is solana", "scope-b") is None, "Entry leaked across scopes"
+
+        if verbose: print("[TEST] Per-tag threshold is stricter for code...")
+        assert cache.threshold_for("code") > cache.threshold_for(None)
+
+        if verbose: print("[TEST] Eviction when capacity is reached...")
+        cache.set("what is ethereum", "scope-a", {"completion": "Ethereum is a blockchain."})
+        cache.set("what is a wallet", "scope-a", {"completion": "A wallet holds keys."})
+        assert cache.stats()["evictions"] == 1
+
+        # Scopes whose rows were all evicted are forgotten
+        for i in range(10):
+            cache.set("what is solana", f"scope-{i}", {"completion": "Solana is a blockchain."})
+        assert len(cache._scope_ids) <= cache.capacity, f"{len(cache._scope_ids)} scopes for {cache.capacity} rows"
+        assert cache.get("what is solana", "scope-9") is not None
+
+    except Exception as e:
+        results["status"] = "fail"
+        results["errors"].append(str(e))
+        results["trace"] = traceback.format_exc()
+
+    return results
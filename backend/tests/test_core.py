@@ -1,5 +1,13 @@
 from backend.core.registry import registry
 from backend.core.config import settings
+from backend.data.corpus import EmbeddingCorpus
+from backend.data.ann_index import IVFPQIndex
+from backend.data.embedding_store import EmbeddingStore
+from backend.models.embedding import EmbeddingService
+import numpy as np
+import os
+import tempfile
+import time
 import traceback
 
 # Extended test for registry behavior
@@ -62,3 +70,270 @@ def test_settings(verbose: bool = True) -> dict:
         results["trace"] = traceback.format_exc()
 
     return results
+
+# Matrix top-k over an embedded corpus must match brute-force scoring for every metric
+def test_embedding_corpus(verbose: bool = True, size: int = 100000, dim: int = 384) -> dict:
+    results = {"test": "embedding_corpus", "status": "pass", "errors": []}
+
+    try:
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        texts = [str(i) for i in range(size)]
+        lookup = {t: v for t, v in zip(texts, vectors)}
+        embed_fn = lambda batch, normalize=True: np.stack([lookup[t] for t in batch])
+
+        corpus = EmbeddingCorpus(texts, embed_fn, normalize=False, batch_size=4096)
+        queries = rng.standard_normal((8, dim)).astype(np.float32)
+
+        brute = {
+            "cosine": lambda q: vectors @ q / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(q)),
+            "dot": lambda q: vectors @ q,
+            "euclidean": lambda q: -np.linalg.norm(vectors - q, axis=1),
+        }
+        for metric, score_fn in brute.items():
+            start = time.time()
+            batch = corpus.top_k(queries, top_k=5, metric=metric)
+            elapsed = time.time() - start
+            for q, found in zip(queries, batch):
+                expected = [str(i) for i in np.argsort(-score_fn(q))[:5]]
+                assert [k for k, _ in found] == expected, f"{metric}: {found} != {expected}"
+            if verbose:
+                print(f"[TEST] {metric}: 8 queries x {size} rows in {elapsed * 1000:.1f} ms")
+
+        single = corpus.top_k(queries[0], top_k=3, metric="cosine")
+        assert single == corpus.top_k(queries[:1], top_k=3, metric="cosine")[0]
+
+    except Exception as e:
+        results["status"] = "fail"
+        results["errors"].append(str(e))
+        results["trace"] = traceback.format_exc()
+
+    return results
+
+
+def test_ann_index(verbose: bool = True, size: int = 20000, dim: int = 64) -> dict:
+    results = {"test": "ann_index", "status": "pass", "errors": []}
+
+    try:
+        rng = np.random.default_rng(0)
+        latent = rng.standard_normal((size + 50, 8)).astype(np.float32) @ rng.standard_normal((8, dim)).astype(np.float32)
+        vectors = latent + 0.3 * rng.standard_normal((size + 50, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        data, queries = vectors[:size], vectors[size:]
+
+        index = IVFPQIndex(dim, nlist=64, m=16, keep_vectors=True)
+
+        # Untrained: the flat buffer is searched exactly
+        index.add(np.arange(1000), data[:1000])
+        exact = int(np.argmax(data[:1000] @ queries[0]))
+        assert index.search(queries[0], k=1)[0][0] == exact
+
+        index.train(data[:10000], iters=10)
+        index.add(np.arange(1000, size), data[1000:])
+        assert len(index) == size and not len(index.flat_ids)
+
+        def recall(idx, nprobe, refine):
+            hits = 0
+            for q in queries:
+                truth = set(np.argsort(-(data @ q))[:10].tolist())
+                hits += len(truth & {i for i, _ in idx.search(q, k=10, nprobe=nprobe, refine=refine)})
+            return hits / (10 * len(queries))
+
+        low, high = recall(index, 1, 0), recall(index, 16, 4)
+        assert high >= 0.9, f"recall {high:.3f} with nprobe=16, refine=4"
+        assert high > low, f"more probes should not lower recall ({low:.3f} -> {high:.3f})"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/ann"
+            index.save(path, meta={"embedding_model": "test"})
+            index.save(path, meta={"embedding_model": "test"})      # Overwrite swaps in place
+            index.save(path, meta={"embedding_model": "test"})
+            versions = [name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name))]
+            assert len(versions) == 2, f"expected current + previous version, found {versions}"
+            loaded = IVFPQIndex.load(path)
+            assert IVFPQIndex.read_manifest(path)["embedding_model"] == "test"
+            assert loaded.search(queries[0], k=5, nprobe=8) == index.search(queries[0], k=5, nprobe=8)
+
+            # Incremental add after load appends to the memory-mapped lists
+            loaded.add([size + 1], queries[1:2])
+            assert loaded.search(queries[1], k=1, nprobe=8, refine=4)[0][0] == size + 1
+
+        if verbose:
+            print(f"[TEST] ANN recall@10: nprobe=1 {low:.3f}, nprobe=16+refine {high:.3f}")
+
+    except Exception as e:
+        results["status"] = "fail"
+        results["errors"].append(str(e))
+        results["trace"] = traceback.format_exc()
+
+    return results
+
+
+def test_embedding_store(verbose: bool = True, dim: int = 32) -> dict:
+    results = {"test": "embedding_store", "status": "pass", "errors": []}
+
+    try:
+        calls = []
+
+        def encode(texts):
+            calls.append(list(texts))
+            return np.stack([np.random.default_rng(abs(hash(t)) % 2**32).standard_normal(dim) for t in texts])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            worker_a = EmbeddingStore(tmp, "test-model", dim, dtype="float32")
+            worker_b = EmbeddingStore(tmp, "test-model", dim, dtype="float32")
+
+            first = worker_a.get_or_compute(["a", "b", "a"], encode)
+            assert calls == [["a", "b"]], f"misses should be encoded once, together: {calls}"
+            assert np.array_equal(first[0], first[2])
+
+            # Another worker (or a restart) reads the same rows without encoding
+            second = worker_b.get_or_compute(["b", "a"], encode)
+            assert len(calls) == 1 and np.array_equal(second, first[[1, 0]])
+            assert worker_b.stats()["hits"] == 2
+
+            # Returned arrays are copies
+            second[0] += 1.0
+            assert np.array_equal(worker_b.get_many(["b"])[0], first[1])
+
+            worker_b.get_or_compute(["c"], encode)
+            assert worker_a.get_many(["c"])[0] is not None and len(worker_a) == 3
+
+            # A torn write (vectors without an index record) is dropped on the next append
+            with open(os.path.join(tmp, "vectors.bin"), "ab") as f:
+                f.write(b"\0" * 7)
+            worker_a.get_or_compute(["d"], encode)
+            assert os.path.getsize(os.path.join(tmp, "vectors.bin")) == 4 * dim * 4
+            assert np.allclose(worker_b.get_many(["d"])[0], encode(["d"])[0])
+
+            try:
+                EmbeddingStore(tmp, "other-model", dim, dtype="float32")
+                raise AssertionError("a store written by another model must not be reused")
+            except ValueError:
+                pass
+
+        # A store hit is answered from the manifest's dimension, without loading the model
+        store_dir, enabled = settings.EMBEDDING_STORE_DIR, settings.EMBEDDING_STORE_ENABLED
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                settings.EMBEDDING_STORE_DIR, settings.EMBEDDING_STORE_ENABLED = tmp, True
+                service = EmbeddingService(model_name=f"store-only-{time.time_ns()}")
+                assert service.cached("a") is None, "no store written yet"
+                EmbeddingStore.for_model(service.model_name, dim).get_or_compute(["a"], encode)
+                assert np.allclose(service.cached("a"), encode(["a"])[0], atol=1e-2)
+                assert not service.loaded, "a store lookup loaded the embedding model"
+        finally:
+            settings.EMBEDDING_STORE_DIR, settings.EMBEDDING_STORE_ENABLED = store_dir, enabled
+
+        if verbose:
+            print(f"[TEST] Embedding store: {worker_a.stats()}")
+
+    except Exception as e:
+        results["status"] = "fail"
+        results["errors"].append(str(e))
+        results["trace"] = traceback.format_exc()
+
+    return results
+
+
+def test_prompt_index_db(verbose: bool = True, rows: int = 50, dim: int = 96) -> dict:
+    results = {"test": "prompt_index_db", "status": "pass", "errors": []}
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from backend.db import connection
+    from backend.db.models import PromptLog
+    from backend.services import search_service
+
+    def encode(texts):
+        vectors = np.stack([
+            np.random.default_rng(sum(map(ord, text))).standard_normal(dim).astype(np.float32) for text in texts
+        ])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    patched = {
+        "session": connection.SessionLocal,
+        "embed_batch": search_service.embed_batch,
+        "embed_text": search_service.embed_text,
+        "prompt_index": search_service.prompt_index,
+    }
+    try:
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        connection.Base.metadata.create_all(engine)
+        connection.SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+        search_service.embed_batch = encode
+        search_service.embed_text = lambda text: encode([text])[0]
+
+        with connection.get_db() as db:
+            db.add_all([PromptLog(prompt=f"prompt number {i}", tag="test") for i in range(rows)])
+            db.commit()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            search_service.prompt_index = search_service.PromptIndex(tmp)
+            stats = search_service.prompt_index.build(chunk_size=16)
+            assert stats["rows"] == rows, stats
+
+            hits = search_service.search_prompts("prompt number 7", limit=3)
+            assert hits and hits[0]["prompt"] == "prompt number 7", hits
+            assert hits[0]["tag"] == "test" and hits[0]["score"] > 0.99
+
+        if verbose:
+            print(f"[TEST] Prompt index over sqlite: {stats}")
+
+    except Exception as e:
+        results["status"] = "fail"
+        results["errors"].append(str(e))
+        results["trace"] = traceback.format_exc()
+
+    finally:
+        connection.SessionLocal = patched["session"]
+        search_service.embed_batch = patched["embed_batch"]
+        search_service.embed_text = patched["embed_text"]
+        search_service.prompt_index = patched["prompt_index"]
+
+    return results
+
+
+def test_prompt_index_rows(verbose: bool = True, rows: int = 40, dim: int = 96) -> dict:
+    results = {"test": "prompt_index_rows", "status": "pass", "errors": []}
+
+    from backend.services import search_service
+
+    def encode(texts):
+        vectors = np.stack([
+            np.random.default_rng(sum(map(ord, text))).standard_normal(dim).astype(np.float32) for text in texts
+        ])
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    patched = (search_service.embed_batch, search_service.embed_text, settings.ANN_ADD_BATCH, settings.ANN_SAVE_EVERY)
+    try:
+        search_service.embed_batch = encode
+        search_service.embed_text = lambda text: encode([text])[0]
+        settings.ANN_ADD_BATCH, settings.ANN_SAVE_EVERY = 8, 16
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Two workers add disjoint rows; neither overwrites the other's on save
+            workers = [search_service.PromptIndex(tmp), search_service.PromptIndex(tmp)]
+            for i in range(rows):
+                workers[i % 2].add(i + 1, f"logged prompt {i + 1}")
+            for worker in workers:
+                worker.save()
+
+            merged = search_service.PromptIndex(tmp)
+            assert merged.stats()["size"] == rows, merged.stats()
+            assert merged.search("logged prompt 7", k=1)[0][0] == 7
+
+        if verbose:
+            print(f"[TEST] Prompt index row logs: {rows} rows merged from 2 workers")
+
+    except Exception as e:
+        results["status"] = "fail"
+        results["errors"].append(str(e))
+        results["trace"] = traceback.format_exc()
+
+    finally:
+        search_service.embed_batch, search_service.embed_text = patched[:2]
+        settings.ANN_ADD_BATCH, settings.ANN_SAVE_EVERY = patched[2:]
+
+    return results
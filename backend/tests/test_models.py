@@ -74,3 +74,178 @@ def test_generate_response(verbose: bool = True, max_tokens: int = 100) -> dict:
         result["errors"].append(str(e))
 
     return result
+
+
+def test_weight_only_quant(verbose: bool = True) -> dict:
+    """
+    Weight-only int8/int4 linears should closely reproduce the float layer, and keep
+    no float copy of the weight resident after a forward pass.
+    """
+    import torch
+    from backend.models.adapter import WeightOnlyLinear, model_nbytes
+
+    def resident_bytes(module):
+        # Every tensor the module holds, including ones outside its state dict
+        seen, stack = {}, [vars(module)]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, torch.Tensor):
+                seen[value.data_ptr()] = value.numel() * value.element_size()
+            elif isinstance(value, dict):
+                stack.extend(value.values())
+            elif isinstance(value, (list, tuple)):
+                stack.extend(value)
+        return sum(seen.values())
+
+    result = {"test": "weight_only_quant", "status": "pass", "errors": []}
+
+    try:
+        torch.manual_seed(0)
+        linear = torch.nn.Linear(257, 64)   # odd width exercises group padding and int4 packing
+        x = torch.randn(4, 257)
+        reference = linear(x)
+
+        for bits, tolerance in ((8, 0.01), (4, 0.15)):
+            q = WeightOnlyLinear.from_linear(linear, bits=bits, group_size=32)
+            rel_error = ((q(x) - reference).norm() / reference.norm()).item()
+            weight_bytes = q.qweight.numel() * q.qweight.element_size()
+            resident = resident_bytes(q)
+            assert resident == model_nbytes(q), f"int{bits} holds {resident - model_nbytes(q)} uncounted bytes"
+            assert resident < linear.weight.numel() * linear.weight.element_size(), f"int{bits} is larger than fp32"
+
+            if verbose:
+                print(f"[TEST] int{bits}: relative error {rel_error:.4f}, weight bytes {weight_bytes}")
+
+            assert rel_error < tolerance, f"int{bits} error too large: {rel_error:.4f}"
+            result[f"int{bits}_error"] = round(rel_error, 5)
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+
+def test_snapshot_roundtrip(verbose: bool = True) -> dict:
+    """
+    A model loaded from an exported snapshot should produce the same logits as the source model.
+    """
+    import tempfile
+    import torch
+    from backend.core.config import settings
+    from backend.models.snapshot import export_snapshot, load_snapshot, snapshot_usable
+
+    result = {"test": "snapshot_roundtrip", "status": "pass", "errors": []}
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/snapshot"
+            export_snapshot(path)
+            assert snapshot_usable(path), "Exported snapshot is not usable"
+
+            start = time.time()
+            model, tokenizer = load_snapshot(path)
+            load_time = time.time() - start
+            reference = load_model(settings.MODEL_NAME)["model"]
+
+            ids = tokenizer("Smart contracts run on", return_tensors="pt")["input_ids"]
+            with torch.no_grad():
+                diff = (model(input_ids=ids).logits - reference(input_ids=ids).logits).abs().max().item()
+
+            if verbose:
+                print(f"[TEST] Snapshot load {load_time:.2f}s, max logit difference {diff:.6f}")
+
+            assert diff < 1e-4, f"Snapshot logits differ by {diff}"
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+
+def test_embedding_service(verbose: bool = True) -> dict:
+    """
+    vectorizer.py and schema.py should share one lazily loaded embedding model.
+    """
+    import numpy as np
+    from backend.models.embedding import EmbeddingService, embedding_service
+    from backend.data import vectorizer
+    from backend.db import schema
+
+    result = {"test": "embedding_service", "status": "pass", "errors": []}
+
+    try:
+        assert not EmbeddingService().loaded, "Constructing the service must not load the model"
+
+        a = vectorizer.embed_text("Validators stake SOL to secure the network.")
+        b = schema.embed_batch(["Validators stake SOL to secure the network."])[0]
+        assert embedding_service.loaded
+        assert np.allclose(a, b, atol=1e-3), "Both modules should embed with the same model"
+        assert abs(float(np.linalg.norm(a)) - 1.0) < 1e-3
+
+        stats = embedding_service.stats()
+        if verbose:
+            print(f"[TEST] Embedding model on {stats['device']}, loaded in {stats['load_seconds']}s")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+
+def test_embedding_batcher(verbose: bool = True, callers: int = 32) -> dict:
+    """
+    Concurrent single-text requests should be merged into batched model calls,
+    each caller still getting its own vector (sync and async front-ends).
+    """
+    import asyncio
+    import numpy as np
+    from concurrent.futures import ThreadPoolExecutor
+    from backend.models.embedding import EmbeddingBatcher
+
+    class SlowService:
+        def __init__(self):
+            self.calls = []
+
+        def cached(self, text):
+            return None
+
+        def embed(self, texts, normalize=True):
+            self.calls.append(len(texts))
+            time.sleep(0.02)  # A forward pass costs about the same for 1 or 32 texts
+            return np.stack([np.full(4, float(t.split()[-1])) for t in texts])
+
+    result = {"test": "embedding_batcher", "status": "pass", "errors": []}
+    service = SlowService()
+    batcher = EmbeddingBatcher(service, max_batch_size=16, max_wait_ms=5)
+
+    try:
+        texts = [f"text {i % 24}" for i in range(callers)]
+        with ThreadPoolExecutor(max_workers=callers) as pool:
+            vectors = list(pool.map(lambda t: batcher.embed(t, normalize=False), texts))
+        for text, vec in zip(texts, vectors):
+            assert vec[0] == float(text.split()[-1]), f"{text} got the wrong vector"
+        vectors[0][0] = -1.0
+        assert vectors[24][0] == 0.0, "Callers with the same text must not share an array"
+
+        async def many():
+            return await asyncio.gather(*(batcher.aembed(f"text {i + 1}") for i in range(8)))
+        for vec in asyncio.run(many()):
+            assert abs(float(np.linalg.norm(vec)) - 1.0) < 1e-6
+
+        stats = batcher.stats()
+        assert stats["batches"] < callers, f"{callers} callers ran {stats['batches']} model calls"
+        assert max(service.calls) <= 16
+        if verbose:
+            print(f"[TEST] {stats['requests']} requests in {stats['batches']} batches "
+                  f"(avg {stats['avg_batch_size']}), p99 wait {stats['p99_queue_wait_ms']} ms")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+    finally:
+        batcher.stop()
+
+    return result
@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 from backend.api.server import app
+from backend.core.engine import engine
 import time
 
 client = TestClient(app)
@@ -49,6 +50,53 @@ def test_llm_query(verbose: bool = True) -> dict:
 
     return result
 
+def test_chat_session(verbose: bool = True) -> dict:
+    result = {"test": "chat_session", "status": "pass"}
+
+    def run_turn(ws, message):
+        ws.send_json({"message": message, "max_tokens": 20, "temperature": 0.0})
+        text = ""
+        while True:
+            msg = ws.receive_json()
+            if msg["type"] == "token":
+                text += msg["text"]
+            elif msg["type"] == "meta":
+                return text, msg
+            else:
+                raise AssertionError(f"Unexpected message: {msg}")
+
+    try:
+        base_requests = engine.lora.stats()["requests"].get("base", 0) if engine.lora is not None else 0
+        with client.websocket_connect("/api/llm/chat") as ws:
+            session = ws.receive_json()
+            assert session["type"] == "session" and session["session_id"]
+
+            # A message that is not a ChatTurn object is answered with an error; the session stays open
+            ws.send_json(["not", "a", "turn"])
+            assert ws.receive_json()["type"] == "error"
+
+            _, first = run_turn(ws, "What is Solana?")
+            _, second = run_turn(ws, "And how fast is it?")
+            assert first["cached_tokens"] == 0
+            assert second["context_tokens"] > first["context_tokens"], "Second turn lost the history"
+            if engine.sessions is not None and engine.sessions.cache_kv:
+                # The second turn reuses the first turn's KV and only prefills the new message
+                assert second["cached_tokens"] > 0, "Second turn did not reuse the session KV"
+                assert second["prefilled_tokens"] < second["context_tokens"]
+        if engine.lora is not None:
+            # Chat turns are routed to the base model, never to the last adapter activated
+            assert engine.lora.stats()["requests"].get("base", 0) == base_requests + 2
+
+        if verbose:
+            print(f"[✓] Chat turns: prefilled {first['prefilled_tokens']} then {second['prefilled_tokens']} tokens")
+        result["cached_tokens"] = second["cached_tokens"]
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["error"] = str(e)
+
+    return result
+
 def test_train_endpoint(verbose: bool = True) -> dict:
     result = {"test": "llm_train", "status": "pass"}
     try:
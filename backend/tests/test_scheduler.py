@@ -0,0 +1,285 @@
+import time
+from concurrent.futures import CancelledError, Future, wait
+from backend.core.admission import AdmissionController, AdmissionRejected
+from backend.core.engine import engine
+from backend.core.fair_queue import FairQueue
+from backend.core.scheduler import GenerationRequest
+from backend.core.single_flight import SingleFlight
+from backend.models.stopping import GenerationCancelled, cancellation_stats, request_cancel
+
+# Concurrent submissions should be merged into shared batches and each caller
+# should get its own result back
+def test_batched_generation(verbose: bool = True, concurrency: int = 4) -> dict:
+    result = {"test": "batched_generation", "status": "pass", "errors": []}
+    prompts = [f"Explain blockchain concept number {i}." for i in range(concurrency)]
+
+    try:
+        engine.boot()
+        start = time.time()
+        futures = [engine.submit(p, max_tokens=16, temperature=0.0) for p in prompts]
+        wait(futures, timeout=300)
+        duration = round(time.time() - start, 3)
+
+        outputs = [f.result() for f in futures]
+        for prompt, out in zip(prompts, outputs):
+            assert out["text"].startswith(prompt), "Result routed to the wrong caller"
+            assert out["output_tokens"] <= 16, "max_tokens not respected"
+
+        batch_sizes = [out["batch_size"] for out in outputs]
+        assert max(batch_sizes) > 1, "Concurrent requests were not batched"
+
+        if verbose:
+            print(f"[TEST] Batch sizes: {batch_sizes}")
+            print(f"[TEST] {concurrency} requests served in {duration}s")
+            print(f"[TEST] Scheduler stats: {engine.status()['scheduler']}")
+
+        result["duration"] = duration
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+# Requests sharing a system prompt should hit the prefix KV cache after the first
+# prefill, and produce the same greedy output as an uncached run
+def test_prefix_cache(verbose: bool = True) -> dict:
+    result = {"test": "prefix_cache", "status": "pass", "errors": []}
+    system_prompt = "You are LocentraOS, an assistant for crypto and technology questions. Answer briefly."
+
+    try:
+        engine.boot()
+        assert engine.prefix_cache is not None, "Prefix cache disabled"
+        before = engine.prefix_cache.stats()
+
+        prompts = ["What is a DAO?", "Explain proof of stake in one sentence, please."]
+
+        def run():
+            futures = [
+                engine.submit(p, system_prompt=system_prompt, max_tokens=12, temperature=0.0, use_cache=False)
+                for p in prompts
+            ]
+            return [f.result() for f in futures]
+
+        run()
+        cached = run()
+        after = engine.prefix_cache.stats()
+
+        scheduler = engine.scheduler
+        prefix_cache, scheduler.prefix_cache = scheduler.prefix_cache, None
+        try:
+            plain = run()
+        finally:
+            scheduler.prefix_cache = prefix_cache
+
+        assert all(r["prefix_cached"] for r in cached), "Prefix cache was not used"
+        assert not any(r["prefix_cached"] for r in plain)
+        assert after["hits"] > before["hits"], "Second request did not hit the cache"
+        for c, p in zip(cached, plain):
+            assert c["text"] == p["text"], f"Cached prefix changed the greedy output: {c['text']!r} vs {p['text']!r}"
+            assert c["input_tokens"] == p["input_tokens"], "Cached path tokenized the prompt differently"
+
+        if verbose:
+            print(f"[TEST] Prefix cache stats: {after}")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+# Admission control: slots are granted FIFO, a full queue sheds with 503 and an
+# estimated wait past the deadline sheds with 429
+def test_admission_control(verbose: bool = True) -> dict:
+    result = {"test": "admission_control", "status": "pass", "errors": []}
+
+    try:
+        admission = AdmissionController(max_concurrency=1, max_queue=1, window=4)
+        first = admission.acquire(deadline=10)
+        assert first.done(), "Free slot was not granted immediately"
+        second = admission.acquire(deadline=10)
+        assert not second.done(), "Second request should wait for the slot"
+
+        try:
+            admission.acquire(deadline=10)
+            raise AssertionError("Full queue did not shed the request")
+        except AdmissionRejected as e:
+            assert e.status_code == 503 and e.retry_after >= 1
+
+        admission.release(latency=2.0)
+        assert second.done(), "Released slot was not handed to the waiter"
+        try:
+            admission.acquire(deadline=1)
+            raise AssertionError("Deadline shorter than the estimated wait was admitted")
+        except AdmissionRejected as e:
+            assert e.status_code == 429
+
+        third = admission.acquire(deadline=10)
+        admission.abandon(third)
+        admission.release(latency=2.0)
+        stats = admission.stats()
+        assert stats["active"] == 0 and stats["waiting"] == 0, f"Slots leaked: {stats}"
+
+        if verbose:
+            print(f"[TEST] Admission stats: {stats}")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+# A bulk backlog from one user must not delay another user's interactive request
+def test_fair_queueing(verbose: bool = True) -> dict:
+    result = {"test": "fair_queueing", "status": "pass", "errors": []}
+
+    try:
+        fq = FairQueue(sjf=False)
+        for i in range(20):
+            fq.put(f"bulk-{i}", user="script", priority="bulk", cost=100)
+        fq.put("chat", user="alice", priority="interactive", cost=100)
+        order = [fq.get_nowait() for _ in range(3)]
+        assert "chat" in order[:2], f"Interactive request starved behind bulk backlog: {order}"
+
+        # Two users with equal weight alternate even if one queued far more
+        fq = FairQueue(sjf=True)
+        for i in range(6):
+            fq.put(("a", 6 - i), user="a", cost=6 - i)
+        fq.put(("b", 1), user="b", cost=1)
+        fq.put(("b", 1), user="b", cost=1)
+        order = [fq.get_nowait() for _ in range(4)]
+        assert order.count(("b", 1)) == 2, f"Users were not interleaved: {order}"
+        assert order[0][1] == 1 or order[1][1] == 1, "SJF did not pick the shortest job first"
+
+        token = fq.put("gone", user="c")
+        assert fq.remove(token) and not fq.remove(token)
+
+        stats = fq.stats()
+        assert stats["users"]["b"]["served"] == 2 and stats["users"]["c"]["waiting"] == 0, stats
+
+        # The same object queued twice is two entries; removing one leaves the other
+        twice = FairQueue()
+        first = twice.put("job", user="d")
+        twice.put("job", user="d")
+        assert twice.remove(first) and not twice.remove(first)
+        assert twice.get_nowait() == "job" and twice.qsize() == 0
+
+        if verbose:
+            print(f"[TEST] Fairness stats: {stats['classes']}")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+# Identical in-flight requests share one generation; one caller leaving does not cancel it for the rest
+def test_single_flight(verbose: bool = True) -> dict:
+    result = {"test": "single_flight", "status": "pass", "errors": []}
+
+    try:
+        flights = SingleFlight()
+        shared = Future()
+        starts = []
+
+        def start():
+            starts.append(1)
+            return shared
+
+        first = flights.submit("key", start)
+        second = flights.submit("key", start)
+        third = flights.submit("key", start)
+        assert len(starts) == 1, "Duplicate request started its own generation"
+
+        third.cancel()
+        assert not shared.cancelled(), "One subscriber leaving cancelled the shared generation"
+        shared.set_result({"text": "42"})
+        assert first.result()["coalesced"] is False and second.result()["coalesced"] is True
+        assert third.cancelled()
+
+        stats = flights.stats()
+        assert stats["coalesced"] == 2 and stats["in_flight"] == 0, stats
+        if verbose:
+            print(f"[TEST] Single-flight stats: {stats}")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+# Cancelling a running request stops its decode early and is counted in the metrics
+def test_cancel_running(verbose: bool = True) -> dict:
+    result = {"test": "cancel_running", "status": "pass", "errors": []}
+
+    try:
+        engine.boot()
+        before = cancellation_stats()
+        future = engine.submit("Write a long essay about blockchains.", max_tokens=512, temperature=0.0, use_cache=False)
+        time.sleep(0.5)
+        assert request_cancel(future), "Running request could not be cancelled"
+
+        try:
+            future.result(timeout=30)
+            raise AssertionError("Cancelled request still returned a result")
+        except (GenerationCancelled, CancelledError):
+            pass
+
+        after = cancellation_stats()
+        assert after["total"] == before["total"] + 1, f"Cancellation not counted: {after}"
+
+        if verbose:
+            print(f"[TEST] Cancellation stats: {after}")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+# cancel() keeps the Future contract for a running request; request_cancel() flags it instead
+def test_generation_future_cancel(verbose: bool = True) -> dict:
+    result = {"test": "generation_future_cancel", "status": "pass", "errors": []}
+
+    try:
+        request = GenerationRequest("Hello")
+        assert request.future.set_running_or_notify_cancel()
+        assert not request.future.cancel() and not request.future.cancelled(), "cancel() succeeded on a running future"
+        assert request_cancel(request.future) and request.cancelled.is_set(), "request_cancel() did not flag the request"
+
+        queued = GenerationRequest("Hello")
+        assert request_cancel(queued.future) and queued.future.cancelled()
+
+        if verbose:
+            print("[TEST] Generation future cancellation follows the Future contract")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
+
+# Budgets: a tiny deadline ends generation early, stop strings are cut from the
+# completion, and every result says why it ended
+def test_generation_budgets(verbose: bool = True) -> dict:
+    result = {"test": "generation_budgets", "status": "pass", "errors": []}
+
+    try:
+        engine.boot()
+        rushed = engine.submit("Explain proof of stake.", max_tokens=256, temperature=0.0, deadline_ms=1, use_cache=False).result()
+        assert rushed["finish_reason"] == "deadline", f"Expected deadline, got {rushed['finish_reason']}"
+        assert rushed["output_tokens"] < 256
+
+        stopped = engine.submit("List three blockchains:\n1.", max_tokens=64, temperature=0.0, stop=["\n"], use_cache=False).result()
+        assert stopped["finish_reason"] in ("stop", "eos", "length")
+        if stopped["finish_reason"] == "stop":
+            assert "\n" not in stopped["completion"], "Stop string was not trimmed"
+
+        if verbose:
+            print(f"[TEST] Finish reasons: {rushed['finish_reason']}, {stopped['finish_reason']}")
+
+    except Exception as e:
+        result["status"] = "fail"
+        result["errors"].append(str(e))
+
+    return result
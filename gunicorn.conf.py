@@ -7,5 +7,30 @@ loglevel = "info"
 accesslog = "-"
 errorlog = "-"
 
+# Inference sidecar: with SIDECAR_SOCKET set, the master starts one process that
+# owns the models and every worker becomes a thin client of it over the socket.
+import subprocess
+import sys
+
+from backend.core.config import settings
+
+_sidecar = None
+
+
+def on_starting(server):
+    global _sidecar
+    if settings.SIDECAR_SOCKET:
+        _sidecar = subprocess.Popen([sys.executable, "-m", "backend.core.sidecar"])
+        server.log.info(f"Started inference sidecar (pid {_sidecar.pid}) on {settings.SIDECAR_SOCKET}")
+
+
+def on_exit(server):
+    if _sidecar is not None and _sidecar.poll() is None:
+        _sidecar.terminate()
+        try:
+            _sidecar.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _sidecar.kill()
+
 # Run using:
 # gunicorn backend.api.server:app -c gunicorn.conf.py 
\ No newline at end of file
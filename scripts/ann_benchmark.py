@@ -0,0 +1,140 @@
+import time
+import json
+import argparse
+import statistics
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from backend.core.config import settings
+from backend.data.ann_index import IVFPQIndex
+
+
+def synthetic_vectors(rows: int, dim: int, latent_dim: int = 24, seed: int = 0) -> np.ndarray:
+    """
+    Unit vectors with low intrinsic dimension: a random latent projected up to `dim`
+    plus a little noise. Sentence embeddings behave like this; isotropic noise does not.
+    """
+    rng = np.random.default_rng(seed)
+    projection = rng.standard_normal((latent_dim, dim)).astype(np.float32)
+    vectors = rng.standard_normal((rows, latent_dim)).astype(np.float32) @ projection
+    vectors += 0.5 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def prompt_log_vectors(rows: int) -> np.ndarray:
+    """Embeddings of the first `rows` logged prompts."""
+    from backend.data.vectorizer import embed_batch
+    from backend.db.connection import get_db
+    from backend.db.models import PromptLog
+
+    with get_db() as db:
+        prompts = [p for (p,) in db.query(PromptLog.prompt).order_by(PromptLog.id).limit(rows).all()]
+    if not prompts:
+        raise SystemExit("[!] No prompt logs to benchmark.")
+    return np.vstack([embed_batch(prompts[i:i + 1024]) for i in range(0, len(prompts), 1024)]).astype(np.float32)
+
+
+def exact_top_k(data: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = data @ query
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def _latency(samples) -> dict:
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000, 3),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+    }
+
+
+def benchmark_ann(
+    data: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    nlist: int = 1024,
+    m: int = 48,
+    nprobes=(1, 4, 16, 64),
+    refines=(0, 4),
+    save_path: Optional[str] = None
+) -> dict:
+    """Recall@k and latency of the IVF-PQ index against brute-force search, per nprobe/refine."""
+    print(f"\n[LocentraOS] ANN benchmark: {len(data)} vectors, dim {data.shape[1]}, {len(queries)} queries, k={k}")
+
+    exact_times, truth = [], []
+    for q in queries:
+        start = time.perf_counter()
+        truth.append(set(exact_top_k(data, q, k).tolist()))
+        exact_times.append(time.perf_counter() - start)
+    exact = _latency(exact_times)
+    print(f"[✓] Brute force: p50 {exact['p50_ms']} ms, p99 {exact['p99_ms']} ms")
+
+    index = IVFPQIndex(data.shape[1], nlist=nlist, m=m, keep_vectors=max(refines) > 0)
+    start = time.time()
+    sample = data[np.random.default_rng(0).choice(len(data), min(len(data), settings.ANN_TRAIN_SIZE), replace=False)]
+    index.train(sample)
+    index.add(np.arange(len(data)), data)
+    build_seconds = round(time.time() - start, 2)
+    print(f"[✓] Index trained and filled in {build_seconds}s (nlist={nlist}, m={m})")
+
+    results = []
+    for refine in refines:
+        for nprobe in nprobes:
+            times, hits = [], 0
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = index.search(q, k=k, nprobe=nprobe, refine=refine)
+                times.append(time.perf_counter() - start)
+                hits += len(expected & {i for i, _ in found})
+            row = {"nprobe": nprobe, "refine": refine, "recall": round(hits / (k * len(queries)), 4), **_latency(times)}
+            results.append(row)
+            print(f"    nprobe={nprobe:<4} refine={refine:<2} recall@{k}={row['recall']:.4f}  p50 {row['p50_ms']} ms  p99 {row['p99_ms']} ms")
+
+    output = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "rows": len(data),
+        "dim": int(data.shape[1]),
+        "queries": len(queries),
+        "k": k,
+        "nlist": nlist,
+        "m": m,
+        "build_seconds": build_seconds,
+        "brute_force": exact,
+        "results": results,
+    }
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\n[✓] Results saved to {save_path}")
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs. latency of the prompt ANN index against brute force")
+    parser.add_argument("--rows", type=int, default=200000, help="Indexed vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=settings.ANN_NLIST)
+    parser.add_argument("--m", type=int, default=settings.ANN_PQ_M)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--refine", type=int, nargs="+", default=[0, settings.ANN_REFINE])
+    parser.add_argument("--from-db", action="store_true", help="Use prompt-log embeddings instead of synthetic vectors")
+    parser.add_argument("--save", type=str, default=None, help="Path to save JSON results")
+    args = parser.parse_args()
+
+    vectors = prompt_log_vectors(args.rows + args.queries) if args.from_db else synthetic_vectors(args.rows + args.queries, args.dim)
+    # Held-out rows act as queries, so no query is its own nearest neighbour
+    benchmark_ann(
+        vectors[args.queries:],
+        vectors[:args.queries],
+        k=args.k,
+        nlist=args.nlist,
+        m=args.m,
+        nprobes=args.nprobe,
+        refines=args.refine,
+        save_path=args.save,
+    )
@@ -1,9 +1,11 @@
 import time
 import uuid
 import json
+import argparse
 import statistics
 from datetime import datetime
 from backend.models.infer import generate_response
+from backend.core.config import settings
 from backend.core.engine import engine
 from typing import Optional
 
@@ -27,7 +29,9 @@ def benchmark_model(
     token_counts = []
     errors = 0
 
-    print(f"\n[LocentraOS] Starting benchmark session: {session_id}")
+    backend = engine.model_meta.get("backend", settings.INFERENCE_BACKEND)
+
+    print(f"\n[LocentraOS] Starting benchmark session: {session_id} (backend: {backend})")
 
     # Optional warm-up run to stabilize performance
     if warmup:
@@ -67,6 +71,7 @@ def benchmark_model(
     # Output
     if use_color:
         rprint("\n[bold green]--- Benchmark Results ---[/bold green]")
+        rprint(f"[bold]Backend:[/bold] {backend}")
         rprint(f"[bold]Prompt:[/bold] {prompt}")
         rprint(f"[bold]Runs:[/bold] {runs} (errors: {errors})")
         rprint(f"[bold]Average Latency:[/bold] {avg_latency:.2f}s")
@@ -77,6 +82,7 @@ def benchmark_model(
         rprint(f"[bold]Throughput:[/bold] {throughput:.2f} tokens/sec")
     else:
         print("\n--- Benchmark Results ---")
+        print(f"Backend: {backend}")
         print(f"Prompt: {prompt}")
         print(f"Runs: {runs} (errors: {errors})")
         print(f"Average Latency: {avg_latency:.2f}s")
@@ -86,25 +92,64 @@ def benchmark_model(
         print(f"Total Tokens: {total_tokens}")
         print(f"Throughput: {throughput:.2f} tokens/sec")
 
+    output = {
+        "session_id": session_id,
+        "timestamp": timestamp,
+        "backend": backend,
+        "prompt": prompt,
+        "runs": runs,
+        "errors": errors,
+        "latencies": durations,
+        "avg_latency": avg_latency,
+        "median_latency": median_latency,
+        "min_latency": min_latency,
+        "max_latency": max_latency,
+        "total_tokens": total_tokens,
+        "throughput": throughput,
+    }
     if save_path:
-        output = {
-            "session_id": session_id,
-            "timestamp": timestamp,
-            "prompt": prompt,
-            "runs": runs,
-            "errors": errors,
-            "latencies": durations,
-            "avg_latency": avg_latency,
-            "median_latency": median_latency,
-            "min_latency": min_latency,
-            "max_latency": max_latency,
-            "total_tokens": total_tokens,
-            "throughput": throughput,
-        }
         with open(save_path, "w", encoding="utf-8") as f:
             json.dump(output, f, indent=2)
         print(f"[✓] Benchmark results saved to: {save_path}")
+    return output
+
+
+def compare_backends(backends, **kwargs) -> dict:
+    """Run the same benchmark once per inference backend (e.g. torch vs onnx) and compare tokens/sec."""
+    results = {}
+    for backend in backends:
+        settings.INFERENCE_BACKEND = backend
+        if engine.booted:
+            engine.reload_model()
+        else:
+            engine.boot()
+        results[backend] = benchmark_model(**kwargs)
+
+    print("\n--- Backend Comparison ---")
+    for backend, result in results.items():
+        if result:
+            print(f"{backend:>8}: {result['throughput']:.2f} tokens/sec, median {result['median_latency']:.2f}s")
+    return results
 
 
 if __name__ == "__main__":
-    benchmark_model()
+    parser = argparse.ArgumentParser(description="LocentraOS generation benchmark")
+    parser.add_argument("--backend", nargs="+", default=[settings.INFERENCE_BACKEND], help="torch and/or onnx")
+    parser.add_argument("--prompt", default="Define Solana in 1 sentence.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=100)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--save", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = compare_backends(
+        args.backend,
+        prompt=args.prompt,
+        runs=args.runs,
+        max_tokens=args.max_tokens,
+        temperature=args.temperature,
+    )
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[✓] Benchmark results saved to: {args.save}")